@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import ssl
+from typing import TYPE_CHECKING
+
+import aiohttp
+import certifi
+
+import config
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+
+class AppContext:
+    """
+    Resources shared by all the jobs of a long-lived process.
+
+    One pooled HTTP session, the Bot session and the avatar cache live as
+    long as the event loop instead of being recreated for every run.
+    """
+
+    MAX_CACHED_AVATARS = 3000
+
+    def __init__(self, bot: Bot | None = None):
+        self.logger = config.logger
+        self.bot: Bot = bot or config.bot
+        self.session: aiohttp.ClientSession | None = None
+        # Raw avatar bytes by URL, shared by every poster generator
+        self.avatar_bytes: dict[str, bytes] = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Get the pooled HTTP session, creating it on first use."""
+        if self.session is None or self.session.closed:
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            connector = aiohttp.TCPConnector(ssl=ssl_context, limit=50)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=config.env.float("HTTP_TIMEOUT", 10)
+                ),
+            )
+        return self.session
+
+    def trim_caches(self) -> None:
+        """Drop the oldest avatars once the cache grows past its limit."""
+        excess = len(self.avatar_bytes) - self.MAX_CACHED_AVATARS
+        for url in list(self.avatar_bytes)[: max(excess, 0)]:
+            del self.avatar_bytes[url]
+
+    async def close(self) -> None:
+        """Close the HTTP and Bot sessions."""
+        if self.session is not None:
+            await self.session.close()
+        await self.bot.session.close()
+        self.logger.info("Shared sessions closed")
@@ -1,6 +1,35 @@
+import argparse
 import asyncio
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
 import config
-from main import main
+from app_context import AppContext
+from bot_commands import run_bot
+from http_api import LeaderboardCache, LeaderboardServer
+from live import poll_live
+from main import main, prewarm
+
+# Cron trigger of the weekly publication
+LEADERBOARD_TRIGGER = {
+    "trigger": "cron",
+    "second": 0,
+    "minute": 0,
+    "hour": 10,
+    "day_of_week": "mon",
+}
+
+# Cron trigger of the pre-warm, ahead of the publication
+PREWARM_TRIGGER = {**LEADERBOARD_TRIGGER, "minute": 45, "hour": 9}
+
+# Cron trigger of the live leaderboard of the current week
+LIVE_TRIGGER = {
+    "trigger": "cron",
+    "second": 0,
+    "minute": 0,
+    "hour": config.env.str("LIVE_HOURS", "9-21/3"),
+}
 
 
 def start_scheduler() -> None:
@@ -12,16 +41,181 @@ def start_scheduler() -> None:
     config.scheduler.add_job(
         name="leaderboard_start_process",
         func=run_main,
-        trigger="cron",
-        second=0,
-        minute=0,
-        hour=10,
-        day_of_week="mon",
+        **LEADERBOARD_TRIGGER,
     )
 
+    if config.env.bool("PREWARM", True):
+        config.scheduler.add_job(
+            name="leaderboard_prewarm",
+            func=lambda: asyncio.run(prewarm()),
+            **PREWARM_TRIGGER,
+        )
+
+    if config.env.bool("LIVE_LEADERBOARD", False):
+        config.scheduler.add_job(
+            name="live_leaderboard",
+            func=lambda: asyncio.run(poll_live()),
+            **LIVE_TRIGGER,
+        )
+
     # Start the scheduler
     config.scheduler.start()
 
 
+class AsyncJobRunner:
+    """
+    Runs jobs of the asyncio scheduler on one long-lived event loop.
+
+    Every job shares the resources of the AppContext and is limited by
+    its own semaphore, so overlapping runs of a job queue up instead of
+    piling up on the loop.
+    """
+
+    def __init__(
+        self,
+        context: AppContext,
+        max_concurrency: int = 1,
+        cache: LeaderboardCache | None = None,
+    ):
+        self.context = context
+        self.max_concurrency = max_concurrency
+        # Cache of the HTTP API, reloaded after every run
+        self.cache = cache
+        self.logger = config.logger
+        self._limits: dict[str, asyncio.Semaphore] = {}
+
+    def _limit(self, job_name: str) -> asyncio.Semaphore:
+        if job_name not in self._limits:
+            self._limits[job_name] = asyncio.Semaphore(self.max_concurrency)
+        return self._limits[job_name]
+
+    async def run_leaderboard(self) -> None:
+        """Job: publish last week's leaderboard."""
+        async with self._limit("leaderboard"):
+            try:
+                await main(context=self.context)
+            finally:
+                self.context.trim_caches()
+                if self.cache is not None:
+                    await self.cache.reload()
+
+    async def run_prewarm(self) -> None:
+        """Job: prepare the publication of last week's leaderboard."""
+        async with self._limit("prewarm"):
+            await prewarm(context=self.context)
+
+    async def run_live(self) -> None:
+        """Job: update the live leaderboard of the current week."""
+        async with self._limit("live"):
+            try:
+                await poll_live(context=self.context)
+            finally:
+                self.context.trim_caches()
+
+    def on_job_event(self, event) -> None:
+        """Log missed and failed jobs."""
+        if event.code == EVENT_JOB_MISSED:
+            self.logger.warning(
+                "Job %s missed its run time %s",
+                event.job_id,
+                event.scheduled_run_time,
+            )
+        elif event.code == EVENT_JOB_ERROR:
+            self.logger.error(
+                "Job %s failed: %s", event.job_id, event.exception
+            )
+
+
+async def run_async_scheduler() -> None:
+    """Run the asyncio scheduler until the process is stopped."""
+    scheduler = AsyncIOScheduler(timezone=config.env.str("TZ"))
+
+    cache = server = None
+    if config.env.bool("HTTP_API", False):
+        cache = LeaderboardCache()
+        await cache.reload()
+        server = LeaderboardServer(cache)
+        await server.start()
+        scheduler.add_job(
+            name="http_cache_refresh",
+            func=cache.reload,
+            trigger="interval",
+            minutes=config.env.int("HTTP_REFRESH_MINUTES", 10),
+            coalesce=True,
+            max_instances=1,
+        )
+
+    async with AppContext() as context:
+        runner = AsyncJobRunner(
+            context,
+            max_concurrency=config.env.int("JOB_CONCURRENCY", 1),
+            cache=cache,
+        )
+        scheduler.add_listener(
+            runner.on_job_event, EVENT_JOB_MISSED | EVENT_JOB_ERROR
+        )
+        scheduler.add_job(
+            name="leaderboard_start_process",
+            func=runner.run_leaderboard,
+            # A run that is late by less than the grace time still starts,
+            # several missed runs collapse into one
+            misfire_grace_time=config.env.int("MISFIRE_GRACE_TIME", 3600),
+            coalesce=True,
+            max_instances=config.env.int("JOB_MAX_INSTANCES", 2),
+            **LEADERBOARD_TRIGGER,
+        )
+        if config.env.bool("PREWARM", True):
+            scheduler.add_job(
+                name="leaderboard_prewarm",
+                func=runner.run_prewarm,
+                # Useless once the publication has started
+                misfire_grace_time=600,
+                coalesce=True,
+                max_instances=1,
+                **PREWARM_TRIGGER,
+            )
+        if config.env.bool("LIVE_LEADERBOARD", False):
+            scheduler.add_job(
+                name="live_leaderboard",
+                func=runner.run_live,
+                # A late poll is superseded by the next one
+                misfire_grace_time=600,
+                coalesce=True,
+                max_instances=1,
+                **LIVE_TRIGGER,
+            )
+        scheduler.start()
+        # On-demand commands share the sessions and avatars of the jobs
+        bot = (
+            asyncio.create_task(run_bot(context))
+            if config.env.bool("BOT_COMMANDS", False)
+            else None
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if bot is not None:
+                bot.cancel()
+            scheduler.shutdown(wait=False)
+            if server is not None:
+                await server.stop()
+
+
+def parse_args() -> argparse.Namespace:
+    """Command line arguments."""
+    parser = argparse.ArgumentParser(description="Leaderboard scheduler")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        default=config.env.bool("ASYNC_SCHEDULER", False),
+        help="run all jobs on one long-lived asyncio event loop",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    start_scheduler()
+    if parse_args().use_async:
+        asyncio.run(run_async_scheduler())
+    else:
+        start_scheduler()
@@ -0,0 +1,70 @@
+"""
+Cold and warm browser startup.
+
+Cold: an incognito Chrome with the driver resolved by Selenium Manager,
+as every run used to start. Warm: the persistent profile of the account
+and the cached driver path. Each start is timed up to a ready browser
+and, with --login, up to a signed-in Strava session.
+
+    python -m bench.browser_startup --repeat 3 --login
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+import config
+from strava.authorization import StravaAuthorization
+from strava.browser import BrowserManager
+
+
+def time_start(warm: bool, login: bool) -> tuple[float, float | None]:
+    """Seconds to a started browser and to a signed-in session."""
+    email = config.env.str("EMAIL")
+    started = time.perf_counter()
+    manager = BrowserManager(
+        profile=email if warm else None, use_driver_cache=warm
+    )
+    browser = manager.start_browser()
+    ready = time.perf_counter() - started
+    signed_in = None
+    try:
+        if login:
+            StravaAuthorization(
+                browser, email, config.env.str("PASSWD")
+            ).authorization()
+            signed_in = time.perf_counter() - started
+    finally:
+        manager.close_browser()
+    return ready, signed_in
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--login", action="store_true", help="also sign in to Strava"
+    )
+    args = parser.parse_args()
+
+    # Populate the profile and the driver cache before the warm runs
+    time_start(warm=True, login=args.login)
+
+    for mode in ("cold", "warm"):
+        results = [
+            time_start(mode == "warm", args.login) for _ in range(args.repeat)
+        ]
+        ready = statistics.median(r[0] for r in results)
+        line = f"{mode:<5} start {ready:6.2f} s"
+        if args.login:
+            line += (
+                f"  signed in "
+                f"{statistics.median(r[1] for r in results):6.2f} s"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput of the bulk personal card renderer.
+
+Renders the cards of a synthetic club (avatars already downloaded) with
+several process counts and reports cards per second, next to the time
+of one full poster for reference:
+
+    python -m bench.cards --athletes 500 --processes 1 2 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "42:benchmark")
+os.environ.setdefault("LOCALE", "en")
+
+from bench.synthetic import make_avatars, make_leaderboard  # noqa: E402
+from poster_maker.cards import CardBatch  # noqa: E402
+from poster_maker.creator import AthleteRankPosterGenerator  # noqa: E402
+
+
+async def poster_seconds(leaderboard: list[dict], avatars: dict) -> float:
+    """Seconds to render one full poster of regular rows."""
+    generator = AthleteRankPosterGenerator(avatar_bytes=avatars)
+    generator.offline = True
+    started = time.perf_counter()
+    poster = await generator.generate_poster(leaderboard[10:24])
+    poster.close()
+    return time.perf_counter() - started
+
+
+async def bench(athletes: int, processes: list[int]) -> None:
+    leaderboard = make_leaderboard(athletes)
+    avatars = make_avatars(leaderboard)
+    seconds = await poster_seconds(leaderboard, avatars)
+    print(f"poster (14 rows): {seconds:.3f} s")
+    print(f"{'processes':>9} {'cards':>6} {'seconds':>8} {'cards/s':>8}")
+    workdir = Path(tempfile.mkdtemp(prefix="cards-bench-"))
+    try:
+        for count in processes:
+            report = await CardBatch(
+                leaderboard,
+                workdir / f"cards_{count}",
+                processes=count,
+                label="2025-W07",
+                avatar_bytes=avatars,
+            ).render()
+            print(
+                f"{count:>9} {report['cards']:>6} "
+                f"{report['render_seconds']:>8.2f} "
+                f"{report['cards_per_second']:>8.1f}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--athletes", type=int, default=200)
+    parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, os.cpu_count() or 1]
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(bench(args.athletes, args.processes))
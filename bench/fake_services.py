@@ -0,0 +1,366 @@
+"""
+Local stand-ins for Strava, the avatar CDN and the Telegram Bot API.
+
+All three run in one aiohttp server on a background thread with its own
+event loop, so the pipeline under test never waits for them to be
+scheduled. Point the pipeline at them with STRAVA_BASE_URL and
+TELEGRAM_API_URL, and StravaApiClient at api_url and auth_url.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import html
+import json
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+from aiohttp import web
+
+from bench.synthetic import NAMES, make_avatar_bytes
+
+DEFAULT_AVATAR = "/assets/avatar/athlete/medium-placeholder.png"
+
+
+class FakeServices:
+    """Fake Strava, avatar CDN and Telegram Bot API on one local port."""
+
+    def __init__(
+        self,
+        athletes: int = 50,
+        avatar_latency: float = 0.0,
+        avatar_error_rate: float = 0.0,
+        default_avatar_rate: float = 0.1,
+        telegram_latency: float = 0.0,
+        page_latency: float = 0.0,
+        member_count_lag: int = 0,
+        seed: int = 0,
+    ):
+        self.athletes = athletes
+        # Members the club info leaves out, as Strava's count lags behind
+        self.member_count_lag = member_count_lag
+        self.avatar_latency = avatar_latency
+        self.avatar_error_rate = avatar_error_rate
+        self.default_avatar_rate = default_avatar_rate
+        self.telegram_latency = telegram_latency
+        # Seconds to serve a leaderboard page, as a Strava page load
+        self.page_latency = page_latency
+        self.random = random.Random(seed)
+        self.stats: Counter = Counter()
+        self.port: int | None = None
+        self._avatars: dict[str, bytes] = {}
+        self._message_id = 0
+        self._token_id = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/api/v3"
+
+    @property
+    def auth_url(self) -> str:
+        return f"{self.base_url}/oauth/token"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_get("/login", self.login)
+        app.router.add_get("/dashboard", self.dashboard)
+        app.router.add_get("/clubs/{club_id}/leaderboard", self.leaderboard)
+        app.router.add_post("/oauth/token", self.oauth_token)
+        app.router.add_get("/api/v3/clubs/{club_id}", self.api_club)
+        app.router.add_get(
+            "/api/v3/clubs/{club_id}/members", self.api_club_members
+        )
+        app.router.add_get("/avatars/{rank}/{variant}", self.avatar)
+        app.router.add_get(DEFAULT_AVATAR, self.default_avatar)
+        app.router.add_post("/bot{token}/{method}", self.telegram)
+        return app
+
+    def start(self) -> None:
+        """Start serving on a free local port."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._runner = web.AppRunner(self._app(), access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self) -> None:
+        """Stop the server and its thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    # Strava
+
+    async def login(self, request: web.Request) -> web.Response:
+        # The session is always signed in: /login redirects away
+        raise web.HTTPFound("/dashboard")
+
+    async def dashboard(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text="<html><body>Dashboard</body></html>",
+            content_type="text/html",
+        )
+
+    def _avatar_url(self, rank: int) -> str:
+        # The same members have no photo on every page load
+        if random.Random(rank).random() < self.default_avatar_rate:
+            return f"{self.base_url}{DEFAULT_AVATAR}"
+        return f"{self.base_url}/avatars/{rank}/medium.jpg"
+
+    def leaderboard_rows(
+        self, last_week: bool = True, sport: str | None = None
+    ) -> list[dict[str, str]]:
+        """A served leaderboard view as StravaLeaderboard parses it.
+
+        This week has fewer athletes and shorter distances than last
+        week, and a sport view half the athletes of its week.
+        """
+        athletes, scale = self.athletes, 1.0
+        if not last_week:
+            athletes, scale = athletes * 2 // 3, 0.4
+        if sport:
+            athletes, scale = athletes // 2, scale * 0.7
+        rows = []
+        for rank in range(1, max(athletes, 1) + 1):
+            distance = max(200.0 * scale - rank * 0.03, 0.1)
+            avatar_medium = self._avatar_url(rank)
+            base_url, _, filename = avatar_medium.rpartition("/")
+            rows.append(
+                {
+                    "rank": str(rank),
+                    "athlete_name": f"{NAMES[rank % len(NAMES)]} {rank}",
+                    "distance": f"{distance:.1f} km",
+                    "activities": str(1 + rank % 7),
+                    "longest": f"{distance / 3:.1f} km",
+                    "avg_pace": f"{4 + rank % 3}:{rank % 60:02d} /km",
+                    "elev_gain": f"{rank % 900} m",
+                    "avatar_large": (
+                        f"{base_url}/{filename.replace('medium', 'large')}"
+                    ),
+                    "avatar_medium": avatar_medium,
+                    "link": f"{self.base_url}/athletes/{rank}",
+                }
+            )
+        return rows
+
+    @staticmethod
+    def _row_html(row: dict[str, str]) -> str:
+        props = html.escape(json.dumps({"src": row["avatar_medium"]}))
+        cells = (
+            row[key]
+            for key in (
+                "distance",
+                "activities",
+                "longest",
+                "avg_pace",
+                "elev_gain",
+            )
+        )
+        return (
+            f"<tr><td>{row['rank']}</td>"
+            f"<td><div class='avatar' data-react-props='{props}'></div>"
+            f"<a href='{row['link']}'>{html.escape(row['athlete_name'])}"
+            "</a></td>"
+            + "".join(f"<td>{cell}</td>" for cell in cells)
+            + "</tr>"
+        )
+
+    async def leaderboard(self, request: web.Request) -> web.Response:
+        # This week unless ?week=last, which the "Last Week" link opens
+        self.stats["strava_pages"] += 1
+        if self.page_latency:
+            await asyncio.sleep(self.page_latency)
+        sport = request.query.get("sport_type")
+        rows = "".join(
+            map(
+                self._row_html,
+                self.leaderboard_rows(
+                    request.query.get("week") == "last", sport
+                ),
+            )
+        )
+        last_week_query = html.escape(
+            urlencode({**request.query, "week": "last"})
+        )
+        page = (
+            "<html><body>"
+            f"<a class='last-week' href='?{last_week_query}'>Last Week</a>"
+            "<table class='dense'><tr><th>Rank</th><th>Athlete</th>"
+            "<th>Distance</th><th>Runs</th><th>Longest</th>"
+            "<th>Avg. Pace</th><th>Elev. Gain</th></tr>"
+            f"{rows}</table></body></html>"
+        )
+        return web.Response(text=page, content_type="text/html")
+
+    # Strava API
+
+    async def oauth_token(self, request: web.Request) -> web.Response:
+        self.stats["api_token_refreshes"] += 1
+        fields = await request.post()
+        if fields.get("grant_type") != "refresh_token":
+            return web.json_response({"message": "Bad Request"}, status=400)
+        self._token_id += 1
+        return web.json_response(
+            {
+                "access_token": self._access_token(),
+                "expires_at": int(time.time()) + 6 * 3600,
+                "refresh_token": f"refresh-{self._token_id}",
+            }
+        )
+
+    def _access_token(self) -> str:
+        return f"access-{self._token_id}"
+
+    def revoke_token(self) -> None:
+        """Answer HTTP 401 to the token issued last, as on its expiry."""
+        self._token_id += 1
+
+    def _api_response(self, request: web.Request, data) -> web.Response:
+        """JSON answer of the API, HTTP 304 if the client has it."""
+        header = request.headers.get("Authorization", "")
+        if header != f"Bearer {self._access_token()}":
+            self.stats["api_unauthorized"] += 1
+            return web.json_response(
+                {"message": "Authorization Error"}, status=401
+            )
+        body = json.dumps(data).encode()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.stats["api_requests"] += 1
+        if request.headers.get("If-None-Match") == etag:
+            self.stats["api_not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=body, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def api_club(self, request: web.Request) -> web.Response:
+        club_id = int(request.match_info["club_id"])
+        return self._api_response(
+            request,
+            {
+                "id": club_id,
+                "name": f"Club {club_id}",
+                "sport_type": "running",
+                "member_count": max(self.athletes - self.member_count_lag, 0),
+            },
+        )
+
+    def club_members(self) -> list[dict]:
+        """The club's members as the API lists them."""
+        return [
+            {
+                "resource_state": 2,
+                "firstname": NAMES[rank % len(NAMES)],
+                "lastname": f"{rank}.",
+                "membership": "member",
+                "admin": rank == 1,
+                "owner": rank == 1,
+            }
+            for rank in range(1, self.athletes + 1)
+        ]
+
+    async def api_club_members(self, request: web.Request) -> web.Response:
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("per_page", 30))
+        start = (page - 1) * per_page
+        self.stats["api_member_pages"] += 1
+        return self._api_response(
+            request, self.club_members()[start : start + per_page]
+        )
+
+    # Avatar CDN
+
+    async def _serve_avatar(self, key: str, size: int) -> web.Response:
+        self.stats["avatar_requests"] += 1
+        if self.avatar_latency:
+            await asyncio.sleep(self.avatar_latency)
+        if self.random.random() < self.avatar_error_rate:
+            self.stats["avatar_errors"] += 1
+            return web.Response(status=503)
+        if key not in self._avatars:
+            self._avatars[key] = make_avatar_bytes(key, size=size)
+        self.stats["avatar_bytes"] += len(self._avatars[key])
+        return web.Response(
+            body=self._avatars[key], content_type="image/jpeg"
+        )
+
+    async def avatar(self, request: web.Request) -> web.Response:
+        variant = request.match_info["variant"]
+        size = 124 if variant.startswith("large") else 62
+        return await self._serve_avatar(
+            f"{request.match_info['rank']}/{variant}", size
+        )
+
+    async def default_avatar(self, request: web.Request) -> web.Response:
+        return await self._serve_avatar("default", 62)
+
+    # Telegram Bot API
+
+    async def telegram(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.stats[f"telegram_{method}"] += 1
+        # Read the whole upload as the real API would
+        fields = {}
+        if request.content_type.startswith("multipart/"):
+            reader = await request.multipart()
+            async for part in reader:
+                data = await part.read()
+                self.stats["telegram_upload_bytes"] += len(data)
+                if part.filename is None:
+                    fields[part.name] = data.decode()
+        else:
+            fields = dict(await request.post())
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+
+        chat = {"id": int(fields.get("chat_id", 0)), "type": "supergroup"}
+        if method == "sendMediaGroup":
+            result = [
+                self._message(chat) for _ in json.loads(fields["media"])
+            ]
+        elif method in ("sendMessage", "sendPhoto", "editMessageMedia"):
+            result = self._message(chat)
+        elif method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "Harness"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat: dict) -> dict:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": chat,
+        }
@@ -0,0 +1,118 @@
+"""
+Import-time budget of the entry points.
+
+Every entry point is imported in a fresh interpreter without the Telegram,
+scheduler and locale settings. The best of several runs is compared with
+the budget recorded in import_budget.json, and modules an entry point must
+not pull in are reported.
+
+    python -m bench.import_budget            # check against the budget
+    python -m bench.import_budget --record   # record the current timings
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).with_name("import_budget.json")
+
+# Entry point -> modules it must not import
+ENTRY_POINTS = {
+    "config": ["aiogram", "apscheduler", "babel", "selenium", "PIL"],
+    "poster": ["aiogram", "apscheduler", "selenium"],
+    "parse": ["aiogram", "apscheduler", "PIL"],
+    "tg_sender": ["apscheduler", "selenium"],
+    "main": ["apscheduler"],
+    "aps_run": [],
+}
+
+# Headroom of a recorded budget over the measured time
+RECORD_HEADROOM = 1.5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = sorted({{name.split(".")[0] for name in sys.modules}})
+print(elapsed * 1000)
+print(" ".join(loaded))
+"""
+
+
+def measure(module: str, repeat: int) -> tuple[float, set[str]]:
+    """Best import time of a module in ms and the top-level modules loaded."""
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("BOT_TOKEN", "TZ", "LOCALE")
+    }
+    best, loaded = float("inf"), set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            cwd=BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed, modules = result.stdout.strip().splitlines()[-2:]
+        best = min(best, float(elapsed))
+        loaded = set(modules.split())
+    return best, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    budget = (
+        json.loads(BUDGET_FILE.read_text()) if BUDGET_FILE.is_file() else {}
+    )
+    failed = False
+    measured = {}
+
+    for module, forbidden in ENTRY_POINTS.items():
+        try:
+            elapsed, loaded = measure(module, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<10} import failed:\n{e.stderr}")
+            failed = True
+            continue
+
+        measured[module] = elapsed
+        limit = budget.get(module)
+        leaked = sorted(set(forbidden) & loaded)
+        status = "ok"
+        if leaked:
+            status = f"imports {', '.join(leaked)}"
+            failed = True
+        elif limit is not None and elapsed > limit and not args.record:
+            status = "over budget"
+            failed = True
+        limit_text = f"{limit:7.0f}" if limit is not None else "      -"
+        print(f"{module:<10} {elapsed:7.0f} ms  budget {limit_text} ms  {status}")
+
+    if args.record:
+        recorded = {
+            module: round(elapsed * RECORD_HEADROOM)
+            for module, elapsed in measured.items()
+        }
+        BUDGET_FILE.write_text(json.dumps(recorded, indent=2) + "\n")
+        print(f"Budget recorded to {BUDGET_FILE}")
+        return 0
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Several leaderboard views: one login each or all in one session.
+
+Reads both weeks (and, with --sports, their sport views) of the fake
+Strava leaderboard once with a browser and a login per view, then with
+StravaLeaderboardRetriever.retrieve_leaderboard_views() after a single
+login, checks every view against the served rows and reports both
+times. --page-latency stands for the load time of a Strava page.
+
+Needs Chrome, like the scrape itself:
+
+    python -m bench.leaderboard_views --athletes 300 --page-latency 1 \
+        --sports Run Ride
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from bench.fake_services import FakeServices
+from bench.load_harness import HARNESS_CLUB_ID, configure_env
+
+
+def retrieve(views: list) -> tuple[dict, float]:
+    """Rows of the views read after one login, and the seconds taken."""
+    import config
+    from parse import StravaLeaderboardRetriever
+
+    started = time.perf_counter()
+    strava = StravaLeaderboardRetriever(
+        config.env.str("EMAIL"), config.env.str("PASSWD"), HARNESS_CLUB_ID
+    )
+    leaderboards = strava.retrieve_leaderboard_views(views)
+    if isinstance(leaderboards, tuple):
+        raise RuntimeError(f"Views not retrieved: {leaderboards[1]}")
+    return leaderboards, time.perf_counter() - started
+
+
+def check(services: FakeServices, leaderboards: dict) -> None:
+    for view, rows in leaderboards.items():
+        expected = services.leaderboard_rows(view.last_week, view.sport)
+        assert rows == expected, f"rows of {view} differ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--athletes", type=int, default=300)
+    parser.add_argument("--page-latency", type=float, default=1.0)
+    parser.add_argument("--sports", nargs="*", default=[])
+    args = parser.parse_args()
+
+    with FakeServices(
+        athletes=args.athletes, page_latency=args.page_latency
+    ) as services:
+        configure_env(services)
+        from strava.leaderboard import LeaderboardView
+
+        views = [
+            LeaderboardView(last_week, sport)
+            for sport in [None, *args.sports]
+            for last_week in (True, False)
+        ]
+
+        separate = 0.0
+        for view in views:
+            leaderboards, seconds = retrieve([view])
+            check(services, leaderboards)
+            separate += seconds
+        print(f"{len(views)} views, a login each: {separate:7.2f} s")
+
+        leaderboards, together = retrieve(views)
+        check(services, leaderboards)
+        assert list(leaderboards) == views, list(leaderboards)
+        print(f"{len(views)} views, one session:  {together:7.2f} s")
+        for view, rows in leaderboards.items():
+            print(f"  {view}: {len(rows)} athletes")
+
+
+if __name__ == "__main__":
+    main()
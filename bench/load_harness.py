@@ -0,0 +1,171 @@
+"""
+End-to-end load harness against local stand-ins.
+
+Runs main.main() against fake Strava, avatar CDN and Telegram services
+(bench/fake_services.py) for clubs of several sizes, and reports the
+end-to-end time and the throughput of every checkpointed stage:
+
+    python -m bench.load_harness --athletes 50 500 5000 \
+        --avatar-latency 0.05 --avatar-error-rate 0.01
+
+Scraping needs Chrome. With --no-browser the scrape stage reads the
+fake leaderboard without a browser (taking --scrape-seconds, to stand
+for the browser time), and everything after it still goes through the
+fake CDN and the fake Bot API. --previous seeds the checkpoint of the
+week before with the same club, as a weekly run finds it.
+
+Compare the warm-up during the scrape with WARM_UP=False/True.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from bench.fake_services import FakeServices
+
+HARNESS_CLUB_ID = 424242
+
+
+def configure_env(services: FakeServices) -> None:
+    """Point the pipeline at the stand-ins (before config is imported)."""
+    os.environ.update(
+        STRAVA_BASE_URL=services.base_url,
+        TELEGRAM_API_URL=services.base_url,
+        BOT_TOKEN="42:harness",
+        CLUB_ID=str(HARNESS_CLUB_ID),
+        CHAT_ID="-1000000000042",
+        ADMIN_CHAT_ID="-1000000000043",
+        EMAIL="harness@example.com",
+        PASSWD="harness",
+        LOCALE=os.environ.get("LOCALE", "en"),
+        TZ=os.environ.get("TZ", "UTC"),
+        # Every size is measured from a cold start
+        CHROME_PROFILE="False",
+    )
+
+
+class StageClock:
+    """Records when every checkpoint stage completes."""
+
+    def __init__(self):
+        from checkpoint import RunCheckpoint
+
+        self.marks: dict[str, float] = {}
+        self.results: dict[str, dict] = {}
+        complete = RunCheckpoint._complete
+
+        def timed_complete(checkpoint, stage, **result):
+            complete(checkpoint, stage, **result)
+            self.marks[stage] = time.perf_counter()
+            self.results[stage] = result
+
+        RunCheckpoint._complete = timed_complete
+
+
+class BrowserlessScrape:
+    """Stand-in for the retriever: the served rows without a browser."""
+
+    def __init__(self, services: FakeServices):
+        self.page_html = None
+        self.rows = services.leaderboard_rows()
+
+
+def scrape_without_browser(services: FakeServices, seconds: float):
+    """Stand-in for main.scrape_leaderboard() taking the given time."""
+    time.sleep(seconds)
+    strava = BrowserlessScrape(services)
+    return strava, strava.rows
+
+
+async def run_once(
+    athletes: int,
+    services: FakeServices,
+    clock: StageClock,
+    previous: bool = False,
+):
+    import config
+    import main
+    from checkpoint import RunCheckpoint
+
+    checkpoint = RunCheckpoint.for_last_week(HARNESS_CLUB_ID)
+    shutil.rmtree(checkpoint.path, ignore_errors=True)
+    services.athletes = athletes
+    earlier = RunCheckpoint(
+        HARNESS_CLUB_ID,
+        config.iso_week_key(datetime.now() - timedelta(weeks=2)),
+    )
+    if previous:
+        earlier.save_scraped(services.leaderboard_rows())
+    services.stats.clear()
+    clock.marks.clear()
+    clock.results.clear()
+
+    started = time.perf_counter()
+    try:
+        await main.main()
+    finally:
+        total = time.perf_counter() - started
+        posters = len(clock.results.get("rendered", {}).get("posters", []))
+        shutil.rmtree(checkpoint.path, ignore_errors=True)
+        shutil.rmtree(earlier.path, ignore_errors=True)
+
+    marks = clock.marks
+    report = [f"{athletes:>6} athletes  total {total:7.2f} s"]
+    previous = started
+    for stage, unit, count in (
+        ("scraped", "athletes", athletes),
+        ("rendered", "posters", posters),
+        ("sent", "posters", posters),
+    ):
+        if stage not in marks:
+            report.append(f"{stage} failed")
+            break
+        elapsed = marks[stage] - previous
+        rate = count / elapsed if elapsed else float("inf")
+        report.append(f"{stage} {elapsed:6.2f} s ({rate:7.1f} {unit}/s)")
+        previous = marks[stage]
+    print("  ".join(report))
+    print(f"{'':>6}          services {dict(services.stats)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--athletes", type=int, nargs="+", default=[50, 500, 5000]
+    )
+    parser.add_argument("--avatar-latency", type=float, default=0.0)
+    parser.add_argument("--avatar-error-rate", type=float, default=0.0)
+    parser.add_argument("--default-avatar-rate", type=float, default=0.1)
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--no-browser", action="store_true")
+    parser.add_argument("--scrape-seconds", type=float, default=0.0)
+    parser.add_argument("--previous", action="store_true")
+    args = parser.parse_args()
+
+    with FakeServices(
+        avatar_latency=args.avatar_latency,
+        avatar_error_rate=args.avatar_error_rate,
+        default_avatar_rate=args.default_avatar_rate,
+        telegram_latency=args.telegram_latency,
+    ) as services:
+        configure_env(services)
+        import main as pipeline
+
+        if args.no_browser:
+            pipeline.scrape_leaderboard = (
+                lambda club_id, *_: scrape_without_browser(
+                    services, args.scrape_seconds
+                )
+            )
+        clock = StageClock()
+        for athletes in args.athletes:
+            asyncio.run(run_once(athletes, services, clock, args.previous))
+
+
+if __name__ == "__main__":
+    main()
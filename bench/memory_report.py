@@ -0,0 +1,141 @@
+"""
+Memory used by every stage of poster generation.
+
+Renders a synthetic leaderboard (2,000 athletes by default) with the
+avatars already downloaded, and reports for each stage the Python heap
+traced by tracemalloc and the process RSS (Pillow keeps pixel data
+outside the Python heap, so RSS is what a container limit sees).
+
+    python -m bench.memory_report --athletes 2000 --bounded
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "42:benchmark")
+os.environ.setdefault("LOCALE", "en")
+
+from bench.synthetic import make_avatars, make_leaderboard  # noqa: E402
+from poster import PosterAthletesCollector  # noqa: E402
+from poster_maker.creator import AthleteRankPosterGenerator  # noqa: E402
+from poster_maker.themes import get_registry  # noqa: E402
+from tg_sender import TelegramSender  # noqa: E402
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process in MB."""
+    with open("/proc/self/status", encoding="ascii") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class StageReport:
+    """Collects memory figures of the stages."""
+
+    def __init__(self):
+        self.rows = []
+
+    @contextmanager
+    def stage(self, name: str):
+        peak_rss = rss_mb()
+        stop = threading.Event()
+
+        def sample():
+            nonlocal peak_rss
+            while not stop.wait(0.005):
+                peak_rss = max(peak_rss, rss_mb())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            current, peak = tracemalloc.get_traced_memory()
+            self.rows.append(
+                (
+                    name,
+                    time.perf_counter() - started,
+                    current / 2**20,
+                    peak / 2**20,
+                    rss_mb(),
+                    max(peak_rss, rss_mb()),
+                )
+            )
+
+    def print(self):
+        print(
+            f"{'stage':<14}{'time s':>8}{'heap MB':>10}{'heap peak':>11}"
+            f"{'RSS MB':>9}{'RSS peak':>10}"
+        )
+        for name, elapsed, heap, heap_peak, rss, rss_peak in self.rows:
+            print(
+                f"{name:<14}{elapsed:>8.2f}{heap:>10.1f}{heap_peak:>11.1f}"
+                f"{rss:>9.1f}{rss_peak:>10.1f}"
+            )
+
+
+async def run(athletes: int, bounded: bool) -> None:
+    report = StageReport()
+    tracemalloc.start()
+    print(f"{athletes} athletes, memory bounded: {bounded}")
+
+    with report.stage("leaderboard"):
+        leaderboard = make_leaderboard(athletes)
+        avatars = make_avatars(leaderboard)
+
+    with report.stage("themes"):
+        theme = get_registry().get("autumn")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Published as a symlink, which the cleanup does not remove
+        output_dir = Path(workdir) / "posters"
+        generator = AthleteRankPosterGenerator(avatar_bytes=avatars)
+        generator.offline = True
+        del avatars
+        collector = PosterAthletesCollector(
+            leaderboard,
+            output_dir=output_dir,
+            poster_generator=generator,
+            theme=theme,
+            memory_bounded=bounded,
+        )
+
+        with report.stage("render+encode"):
+            posters = await collector.create_and_save_posters()
+
+        with report.stage("media groups"):
+            sender = TelegramSender(image_path=output_dir)
+            media = await sender.get_media_group()
+            albums = -(-len(media) // sender.ALBUM_SIZE)
+        await sender.bot.session.close()
+
+    tracemalloc.stop()
+    report.print()
+    print(f"{len(posters)} posters in {albums} albums")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--athletes", type=int, default=2000)
+    parser.add_argument("--bounded", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.athletes, args.bounded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Render and upload cost of the poster pagination.
+
+For clubs of several sizes compares the regular layout (10 rows on the
+first poster, then as many regular rows as the theme allows) with the
+layout plan_layout() picks, and the athletes each leaves out. The cost
+of one poster of each row style (render, PNG encoding, file size) is
+measured on synthetic athletes with the avatars already downloaded, and
+multiplied by the poster count.
+
+    python -m bench.pagination --athletes 50 500 2000 5000 --max-posters 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from io import BytesIO
+
+os.environ.setdefault("BOT_TOKEN", "42:benchmark")
+os.environ.setdefault("LOCALE", "en")
+
+from bench.synthetic import make_avatars, make_leaderboard  # noqa: E402
+from poster_maker.creator import AthleteRankPosterGenerator  # noqa: E402
+from poster_maker.layout import layout_for, plan_layout  # noqa: E402
+from poster_maker.themes import get_registry  # noqa: E402
+
+
+async def poster_cost(theme, rows: int, repeat: int) -> tuple[float, int]:
+    """Seconds to render and encode one full poster, and its PNG size."""
+    leaderboard = make_leaderboard(rows + 10)[10:]
+    generator = AthleteRankPosterGenerator(
+        avatar_bytes=make_avatars(leaderboard)
+    )
+    generator.offline = True
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        poster = await generator.generate_poster(leaderboard, theme=theme)
+        stream = BytesIO()
+        poster.save(stream, "PNG")
+        best = min(best, time.perf_counter() - started)
+        size = stream.tell()
+        poster.close()
+    await generator.close()
+    return best, size
+
+
+async def run(args):
+    theme = get_registry().get("default")
+    costs = {}
+    for compact in (False, True):
+        layout = layout_for(0, theme, compact)
+        costs[compact] = await poster_cost(
+            layout.theme, layout.rows, args.repeat
+        )
+        print(
+            f"{'compact' if compact else 'regular':<8} {layout.rows:>3} rows"
+            f"  {costs[compact][0] * 1000:7.0f} ms/poster"
+            f"  {costs[compact][1] / 1024:6.0f} KiB/poster"
+        )
+
+    print()
+    for athletes in args.athletes:
+        for name, layout in (
+            (
+                "regular",
+                layout_for(athletes, theme, max_posters=args.max_posters),
+            ),
+            ("planned", plan_layout(athletes, theme, args.max_posters)),
+        ):
+            seconds, size = costs[layout.compact]
+            print(
+                f"{athletes:>6} athletes  {name:<8}"
+                f"{' compact' if layout.compact else ' regular'}"
+                f"  {layout.posters:>4} posters  {layout.albums:>3} albums"
+                f"  render ~{layout.posters * seconds:7.1f} s"
+                f"  upload ~{layout.posters * size / 1024**2:6.1f} MiB"
+                f"  dropped {layout.dropped:>3}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--athletes", type=int, nargs="+", default=[50, 500, 2000, 5000]
+    )
+    parser.add_argument("--max-posters", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+StravaApiClient against the fake Strava API.
+
+Fetches the club info and all member pages three times with one client
+and checks each pass: a cold one (one token refresh, every page
+downloaded, more pages than the lagging member_count announces), a warm
+one answered by HTTP 304 from the ETags, and one after the token is
+revoked, where the concurrent 401s cost a single refresh.
+
+    python -m bench.strava_api --members 1234 --member-count-lag 150
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import os
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:benchmark")
+os.environ.setdefault("LOCALE", "en")
+
+from bench.fake_services import FakeServices  # noqa: E402
+from strava._api import StravaApiClient  # noqa: E402
+
+CLUB_ID = 1
+
+
+async def fetch(client: StravaApiClient, fake: FakeServices, name: str):
+    """Fetch the club once and print what it cost."""
+    before = fake.stats.copy()
+    refreshes, not_modified = client.token_refreshes, client.not_modified
+    started = time.perf_counter()
+    info, members = await client.get_club_with_members(CLUB_ID)
+    seconds = time.perf_counter() - started
+    stats = fake.stats - before
+    print(
+        f"{name:<8} {len(members):>6} members {seconds * 1000:7.1f} ms"
+        f"  pages {stats['api_member_pages']:>3}"
+        f"  304 {client.not_modified - not_modified:>3}"
+        f"  401 {stats['api_unauthorized']:>3}"
+        f"  token refreshes {client.token_refreshes - refreshes}"
+    )
+    assert info["id"] == CLUB_ID, info
+    assert members == fake.club_members(), "members differ"
+    return stats, client.token_refreshes - refreshes
+
+
+async def run(args):
+    pages = args.members // StravaApiClient.PER_PAGE + 1
+    with FakeServices(
+        athletes=args.members, member_count_lag=args.member_count_lag
+    ) as fake:
+        async with StravaApiClient(
+            "client",
+            "secret",
+            "refresh-0",
+            api_url=fake.api_url,
+            auth_url=fake.auth_url,
+        ) as client:
+            stats, refreshes = await fetch(client, fake, "cold")
+            assert refreshes == 1, refreshes
+            assert stats["api_member_pages"] == pages, stats
+            assert stats["api_not_modified"] == 0, stats
+
+            stats, refreshes = await fetch(client, fake, "warm")
+            assert refreshes == 0, refreshes
+            assert stats["api_not_modified"] == pages + 1, stats
+
+            fake.revoke_token()
+            stats, refreshes = await fetch(client, fake, "revoked")
+            assert refreshes == 1, refreshes
+            assert stats["api_unauthorized"] >= 1, stats
+    announced = math.ceil(
+        (args.members - args.member_count_lag) / StravaApiClient.PER_PAGE
+    )
+    print(f"ok: {pages} member pages, {announced} announced by member_count")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--members", type=int, default=1234)
+    parser.add_argument("--member-count-lag", type=int, default=150)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Synthetic leaderboards and avatars for the benchmarks."""
+
+from __future__ import annotations
+
+import random
+from io import BytesIO
+
+from PIL import Image
+
+NAMES = ("Олена", "Andrii", "Marta", "Сергій", "Jürgen", "Ірина", "Tom")
+
+
+def make_avatar_bytes(seed: int | str, size: int = 124) -> bytes:
+    """A JPEG avatar, by default of the size Strava serves as 'large'."""
+    rnd = random.Random(seed)
+    color = tuple(rnd.randrange(256) for _ in range(3))
+    stream = BytesIO()
+    Image.new("RGB", (size, size), color).save(stream, "JPEG", quality=85)
+    return stream.getvalue()
+
+
+def make_leaderboard(
+    athletes: int, avatar_base_url: str = "https://avatars.example/athletes"
+) -> list[dict[str, str]]:
+    """Rows shaped like StravaLeaderboard._get_data_leaderboard() output."""
+    rows = []
+    for i in range(athletes):
+        rank = i + 1
+        distance = max(200.0 - i * 0.09, 0.1)
+        avatar_medium = f"{avatar_base_url}/{rank}/medium.jpg"
+        rows.append(
+            {
+                "rank": str(rank),
+                "athlete_name": f"{NAMES[i % len(NAMES)]} Athlete {rank}",
+                "distance": f"{distance:.1f} km",
+                "activities": str(1 + i % 7),
+                "longest": f"{distance / 3:.1f} km",
+                "avg_pace": f"{4 + i % 3}:{i % 60:02d} /km",
+                "elev_gain": f"{i % 900} m",
+                "avatar_large": avatar_medium.replace("medium", "large"),
+                "avatar_medium": avatar_medium,
+                "link": f"https://www.strava.com/athletes/{rank}",
+            }
+        )
+    return rows
+
+
+def make_avatars(leaderboard: list[dict[str, str]]) -> dict[str, bytes]:
+    """Avatar bytes of both CDN variants by URL, as the poster generator
+    caches them."""
+    avatars = {}
+    for row in leaderboard:
+        seed = int(row["rank"])
+        avatars[row["avatar_medium"]] = make_avatar_bytes(seed, size=62)
+        avatars[row["avatar_large"]] = make_avatar_bytes(seed)
+    return avatars
@@ -0,0 +1,406 @@
+"""
+On-demand leaderboard bot command.
+
+    /leaderboard        last week's leaderboard
+    /leaderboard this   this week's leaderboard so far
+
+The posters are answered from what is already rendered: last week's
+published run, this week's live album, or the posters of an earlier
+command, kept in on_demand/<club_id>_<YYYY-Www>/ for
+COMMAND_MAX_AGE_MINUTES. Only when none is fresh the leaderboard is
+scraped and rendered, once for all the commands waiting on it, and
+only while the account pool has more than COMMAND_RESERVED_SCRAPES
+scrapes left this hour. The rest is kept for the scheduled runs, also
+when the bot runs in a process of its own: the pool's use is shared
+through account_usage.json. The scrape also reads the other week in
+the same browser session, so its next command renders without signing
+in again. A chat gets one answer per COMMAND_COOLDOWN seconds, and a
+failed refresh is not retried within the cooldown either, so commands
+never start a burst of browser sessions.
+
+    python bot_commands.py      # poll the bot (or BOT_COMMANDS=True
+                                # with "aps_run.py --async")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from aiogram import Dispatcher, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+import config
+from app_context import AppContext
+from checkpoint import RunCheckpoint
+from live import LiveLeaderboard
+from main import get_season_theme, make_generator, scrape_leaderboard_views
+from poster import PosterAthletesCollector
+from poster_maker.themes import get_registry
+from strava.accounts import get_account_pool
+from strava.leaderboard import LeaderboardView
+from tg_sender import TelegramSender
+
+# Arguments of /leaderboard asking for the current week
+THIS_WEEK_ARGS = ("this", "week", "now", "live")
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers meanwhile share it."""
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, func: Callable[[], Awaitable]):
+        """Result of func(), started only if no call of the key runs."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        # A caller that gives up does not cancel the others' call
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+class LeaderboardCommand:
+    """Answers /leaderboard from cached posters, refreshing them once."""
+
+    CACHE_DIR = config.BASE_DIR / "on_demand"
+
+    def __init__(
+        self,
+        context: AppContext | None = None,
+        club_id: int | None = None,
+        chat_ids: list[int] | None = None,
+        max_age: float | None = None,
+        cooldown: float | None = None,
+    ):
+        self.context = context
+        self.club_id = club_id or config.env.int("CLUB_ID")
+        # Chats the command answers in
+        self.chat_ids = set(chat_ids or self._chat_ids_from_env())
+        self.max_age = (
+            config.env.float("COMMAND_MAX_AGE_MINUTES", 60) * 60
+            if max_age is None
+            else max_age
+        )
+        self.cooldown = (
+            config.env.float("COMMAND_COOLDOWN", 300)
+            if cooldown is None
+            else cooldown
+        )
+        # Hourly scrapes of the pool left to the scheduled runs (the
+        # pre-warm and the publication)
+        self.reserved_scrapes = config.env.int(
+            "COMMAND_RESERVED_SCRAPES", 2
+        )
+        self.logger = config.logger
+        # Monotonic time of the last answer by chat
+        self._answered: dict[int, float] = {}
+        # Monotonic time of the last failed refresh by week
+        self._failed: dict[str, float] = {}
+        self._refreshes = SingleFlight()
+
+    @staticmethod
+    def _chat_ids_from_env() -> list[int]:
+        """COMMAND_CHAT_IDS (comma-separated), CHAT_ID if empty."""
+        chat_ids = config.env.str("COMMAND_CHAT_IDS", "")
+        if not chat_ids:
+            return [config.env.int("CHAT_ID")]
+        return [int(chat_id) for chat_id in chat_ids.split(",")]
+
+    @staticmethod
+    def week(this_week: bool) -> str:
+        """ISO week key of the asked leaderboard."""
+        if this_week:
+            return config.iso_week_key(datetime.now())
+        return config.iso_week_key(datetime.now() - timedelta(weeks=1))
+
+    def _cache_path(self, week: str) -> Path:
+        return self.CACHE_DIR / f"{self.club_id}_{week}"
+
+    def _read_cache_file(self, week: str, name: str) -> dict:
+        path = self._cache_path(week) / name
+        if not path.is_file():
+            return {}
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_cache_file(self, week: str, name: str, data: dict) -> None:
+        path = self._cache_path(week) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _read_cache_state(self, week: str) -> dict:
+        return self._read_cache_file(week, "state.json")
+
+    def _write_cache_state(self, week: str, state: dict) -> None:
+        self._write_cache_file(week, "state.json", state)
+
+    def scraped_rows(self, this_week: bool) -> list[dict] | None:
+        """Rows of the week scraped along with the other week, if fresh."""
+        scraped = self._read_cache_file(self.week(this_week), "rows.json")
+        if time.time() - scraped.get("scraped_at", 0) > self.max_age:
+            return None
+        return scraped.get("rows") or None
+
+    def _save_rows(self, this_week: bool, rows: list[dict]) -> None:
+        self._write_cache_file(
+            self.week(this_week),
+            "rows.json",
+            {"scraped_at": time.time(), "rows": rows},
+        )
+
+    def cached_posters(self, this_week: bool) -> list[tuple[Path, float]]:
+        """Rendered posters of the asked week and when they were made.
+
+        The newest come first; a published run of last week is final and
+        never stale.
+        """
+        week = self.week(this_week)
+        found = []
+        live_path = LiveLeaderboard.LIVE_DIR / f"{self.club_id}_{week}"
+        if this_week and live_path.is_dir():
+            live = LiveLeaderboard(self.club_id, None, week)
+            updated_at = live.state.get("updated_at")
+            if updated_at and live.posters_dir.is_dir():
+                found.append(
+                    (
+                        live.posters_dir,
+                        datetime.fromisoformat(updated_at).timestamp(),
+                    )
+                )
+        elif not this_week:
+            checkpoint = RunCheckpoint(self.club_id, week)
+            if (
+                checkpoint.is_done("rendered")
+                and checkpoint.rendered_files_exist()
+            ):
+                found.append((checkpoint.posters_dir, float("inf")))
+
+        posters_dir = self._cache_path(week) / "posters"
+        updated_at = self._read_cache_state(week).get("updated_at")
+        if updated_at and posters_dir.is_dir():
+            found.append((posters_dir, updated_at))
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+    def fresh_posters(self, this_week: bool) -> Path | None:
+        """The newest posters of the week if they are recent enough."""
+        for posters_dir, updated_at in self.cached_posters(this_week):
+            if time.time() - updated_at <= self.max_age:
+                return posters_dir
+        return None
+
+    def _check_scrape_budget(self) -> None:
+        """Leave the reserved scrapes of the hour to the scheduled runs."""
+        spare = get_account_pool().spare_scrapes()
+        if spare <= self.reserved_scrapes:
+            raise RuntimeError(
+                f"Only {spare} scrapes left this hour, reserved for "
+                f"the scheduled runs"
+            )
+
+    def _run_rows(self, this_week: bool) -> list[dict] | None:
+        """Rows of the week already at hand, without a scrape."""
+        if not this_week:
+            checkpoint = RunCheckpoint(self.club_id, self.week(False))
+            if checkpoint.is_done("scraped"):
+                return checkpoint.load_scraped()
+        return self.scraped_rows(this_week)
+
+    async def _leaderboard(self, this_week: bool) -> list[dict]:
+        """Rows of the asked week, scraped unless a run has them.
+
+        The other week is read in the same browser session unless it can
+        be answered already.
+        """
+        leaderboard = self._run_rows(this_week)
+        if leaderboard:
+            return leaderboard
+
+        self._check_scrape_budget()
+        asked = LeaderboardView(last_week=not this_week)
+        other = LeaderboardView(last_week=this_week)
+        views = [asked]
+        if (
+            self.fresh_posters(not this_week) is None
+            and not self._run_rows(not this_week)
+        ):
+            views.append(other)
+        leaderboards = await asyncio.to_thread(
+            scrape_leaderboard_views, self.club_id, views
+        )
+        if isinstance(leaderboards, tuple):
+            raise RuntimeError(
+                f"Leaderboard not retrieved: {leaderboards[1]}"
+            )
+        if leaderboards.get(other):
+            self._save_rows(not this_week, leaderboards[other])
+        leaderboard = leaderboards.get(asked)
+        if not leaderboard:
+            raise RuntimeError("Leaderboard not retrieved: no rows")
+        return leaderboard
+
+    async def refresh(self, this_week: bool) -> Path:
+        """Scrape and render the asked week into the command's cache."""
+        week = self.week(this_week)
+        started = time.perf_counter()
+        leaderboard = await self._leaderboard(this_week)
+        collector = PosterAthletesCollector(
+            leaderboard,
+            output_dir=self._cache_path(week) / "posters",
+            poster_generator=make_generator(self.context),
+            theme=(
+                get_registry().for_date(datetime.now())
+                if this_week
+                else get_season_theme()
+            ),
+            max_posters=config.env.int("MAX_POSTERS", 0) or None,
+        )
+        await collector.create_and_save_posters()
+        self._write_cache_state(
+            week, {"updated_at": time.time(), "athletes": len(leaderboard)}
+        )
+        self.logger.info(
+            "On-demand leaderboard %s refreshed in %.2f s",
+            week,
+            time.perf_counter() - started,
+        )
+        return self._cache_path(week) / "posters"
+
+    async def _refresh_once(self, this_week: bool) -> Path:
+        """Refresh shared by the waiters, a failure is remembered."""
+        week = self.week(this_week)
+        try:
+            return await self.refresh(this_week)
+        except Exception as e:
+            self._failed[week] = time.monotonic()
+            self.logger.error("On-demand refresh of %s failed: %s", week, e)
+            raise
+
+    async def posters(self, this_week: bool) -> Path | None:
+        """Posters to answer with, refreshed once for all the waiters.
+
+        Falls back to stale posters if the refresh fails or has failed
+        within the cooldown.
+        """
+        posters_dir = self.fresh_posters(this_week)
+        if posters_dir is not None:
+            return posters_dir
+
+        week = self.week(this_week)
+        failed_at = self._failed.get(week)
+        if (
+            failed_at is None
+            or time.monotonic() - failed_at >= self.cooldown
+            or self._refreshes.in_flight(week)
+        ):
+            try:
+                return await self._refreshes.do(
+                    week, lambda: self._refresh_once(this_week)
+                )
+            except Exception:
+                pass  # Logged once by the refresh itself
+
+        stale = self.cached_posters(this_week)
+        return stale[0][0] if stale else None
+
+    def cooldown_left(self, chat_id: int) -> float:
+        """Seconds until the chat may ask again."""
+        answered = self._answered.get(chat_id)
+        if answered is None:
+            return 0
+        return max(answered + self.cooldown - time.monotonic(), 0)
+
+    async def answer(self, chat_id: int, this_week: bool) -> str | None:
+        """Send the asked posters to the chat.
+
+        Returns a text to reply with instead, None once the album is sent
+        (or if the chat may not use the command).
+        """
+        if chat_id not in self.chat_ids:
+            return None
+        wait = self.cooldown_left(chat_id)
+        if wait:
+            return config.translate.gettext(
+                "⏳ The leaderboard was just sent, try again in {minutes} min."
+            ).format(minutes=int(wait // 60) + 1)
+        # Taken before the wait, so repeated commands do not queue up
+        self._answered[chat_id] = time.monotonic()
+
+        posters_dir = await self.posters(this_week)
+        if posters_dir is None:
+            return config.translate.gettext(
+                "⚠️ The leaderboard is not available right now, "
+                "try again later."
+            )
+
+        sender = TelegramSender(
+            report_date=datetime.now() if this_week else None,
+            image_path=posters_dir.resolve(),
+            bot_instance=self.context.bot if self.context else None,
+            close_session=False,
+        )
+        await sender.send_album_to_telegram(chat_id)
+        return None
+
+
+async def on_leaderboard(
+    message: Message, command: CommandObject, leaderboard: LeaderboardCommand
+) -> None:
+    """Handler of /leaderboard [this]."""
+    this_week = (command.args or "").strip().lower() in THIS_WEEK_ARGS
+    reply = await leaderboard.answer(message.chat.id, this_week)
+    if reply:
+        await message.reply(reply)
+
+
+def make_dispatcher() -> Dispatcher:
+    """Dispatcher with the bot commands registered."""
+    router = Router(name="leaderboard")
+    router.message.register(on_leaderboard, Command("leaderboard"))
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    return dispatcher
+
+
+async def run_bot(
+    context: AppContext, command: LeaderboardCommand | None = None
+) -> None:
+    """Answer bot commands until cancelled.
+
+    Updates are handled as tasks, so commands waiting on a refresh do
+    not hold up the others.
+    """
+    await make_dispatcher().start_polling(
+        context.bot,
+        handle_signals=False,
+        close_bot_session=False,
+        leaderboard=command or LeaderboardCommand(context),
+    )
+
+
+async def serve() -> None:
+    """Entry point of a process polling the bot."""
+    async with AppContext() as context:
+        await run_bot(context)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
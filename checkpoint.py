@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import config
+
+
+class RunCheckpoint:
+    """
+    Stage checkpoints of one publication run.
+
+    A run is keyed by the club and the ISO week it reports on, so a retry
+    of the same week resumes from the last completed stage::
+
+        checkpoints/<club_id>_<YYYY-Www>/
+            state.json      - completed stages and their results, and the
+                              albums delivered by an unfinished send
+            leaderboard.json
+            prewarm.json    - rows read by the pre-warm ahead of the run
+            posters         - link to the published posters (posters.<run>/)
+            cards           - link to the published personal cards
+            report.json     - timings and fallbacks of the latest attempt
+            .lock           - held by the run in progress
+    """
+
+    CHECKPOINTS_DIR = config.BASE_DIR / "checkpoints"
+    STAGES = ("scraped", "rendered", "sent")
+
+    def __init__(self, club_id: int | str, week: str):
+        self.club_id = str(club_id)
+        self.week = week
+        self.logger = config.logger
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = self._read_state()
+
+    @classmethod
+    def for_last_week(cls, club_id: int | str) -> RunCheckpoint:
+        """Checkpoint of the run that reports on the previous ISO week."""
+        week = config.iso_week_key(datetime.now() - timedelta(weeks=1))
+        return cls(club_id, week)
+
+    @property
+    def run_key(self) -> str:
+        """Club and ISO week of the run."""
+        return f"{self.club_id}_{self.week}"
+
+    @property
+    def path(self) -> Path:
+        """Directory of the checkpoint."""
+        return self.CHECKPOINTS_DIR / self.run_key
+
+    @property
+    def posters_dir(self) -> Path:
+        """Directory the posters of the run are rendered into."""
+        return self.path / "posters"
+
+    @property
+    def cards_dir(self) -> Path:
+        """Directory the personal cards of the run are rendered into."""
+        return self.path / "cards"
+
+    @property
+    def _state_file(self) -> Path:
+        return self.path / "state.json"
+
+    @property
+    def _leaderboard_file(self) -> Path:
+        return self.path / "leaderboard.json"
+
+    @property
+    def _prewarm_file(self) -> Path:
+        return self.path / "prewarm.json"
+
+    @property
+    def _report_file(self) -> Path:
+        return self.path / "report.json"
+
+    @contextmanager
+    def locked(self):
+        """Hold the run exclusively for the duration of the block.
+
+        Yields False at once if another run of the same key (in this or
+        another process) holds it. The state is read again once locked,
+        since the other run may have completed stages meanwhile.
+        """
+        with open(self.path / ".lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                self.state = self._read_state()
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self) -> dict:
+        if not self._state_file.is_file():
+            return {"run_key": self.run_key, "stages": {}}
+        with self._state_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: Path, data) -> None:
+        """Write JSON atomically, so a crash never leaves half a file."""
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _complete(self, stage: str, **result) -> None:
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        self.state["stages"][stage] = {
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+            **result,
+        }
+        self._write_json(self._state_file, self.state)
+        self.logger.info("Run %s: stage '%s' completed", self.run_key, stage)
+
+    def is_done(self, stage: str) -> bool:
+        """Check whether the stage has been completed."""
+        return stage in self.state["stages"]
+
+    @property
+    def last_stage(self) -> str | None:
+        """The last completed stage or None for a new run."""
+        done = [stage for stage in self.STAGES if self.is_done(stage)]
+        return done[-1] if done else None
+
+    def save_scraped(self, leaderboard: list[dict[str, str]]) -> None:
+        """Checkpoint the scraped leaderboard."""
+        self._write_json(self._leaderboard_file, leaderboard)
+        self._complete("scraped", athletes=len(leaderboard))
+
+    def load_scraped(self) -> list[dict[str, str]]:
+        """Read the scraped leaderboard."""
+        with self._leaderboard_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_rendered(self, filenames: list[str]) -> None:
+        """Checkpoint the rendered posters."""
+        self._complete("rendered", posters=filenames)
+
+    def rendered_files_exist(self) -> bool:
+        """Check that all the rendered posters are still on disk."""
+        filenames = self.state["stages"]["rendered"]["posters"]
+        return all((self.posters_dir / name).is_file() for name in filenames)
+
+    def save_sent(self, chat_id: int | str, message_ids: list[int]) -> None:
+        """Checkpoint the published album."""
+        self._complete("sent", chat_id=chat_id, message_ids=message_ids)
+
+    def save_sent_album(
+        self, chat_id: int | str, num: int, message_ids: list[int]
+    ) -> None:
+        """Keep an album delivered while the send is still going on."""
+        sending = self.state.setdefault(
+            "sending", {"chat_id": chat_id, "albums": {}}
+        )
+        if sending["chat_id"] != chat_id:
+            sending.update(chat_id=chat_id, albums={})
+        sending["albums"][str(num)] = message_ids
+        self._write_json(self._state_file, self.state)
+
+    def sent_albums(self, chat_id: int | str) -> dict[int, list[int]]:
+        """Message ids of the albums delivered by an unfinished send."""
+        sending = self.state.get("sending")
+        if not sending or sending["chat_id"] != chat_id:
+            return {}
+        return {int(num): ids for num, ids in sending["albums"].items()}
+
+    def save_prewarm(self, leaderboard: list[dict[str, str]]) -> None:
+        """Keep the rows read by the pre-warm (not a stage of the run)."""
+        self._write_json(self._prewarm_file, leaderboard)
+
+    def prewarm_leaderboard(self) -> list[dict[str, str]] | None:
+        """Rows read by the pre-warm of this run, if any."""
+        if not self._prewarm_file.is_file():
+            return None
+        with self._prewarm_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def previous_leaderboard(self) -> list[dict[str, str]] | None:
+        """Leaderboard of the latest earlier run of the club, if any."""
+        earlier = sorted(
+            path
+            for path in self.CHECKPOINTS_DIR.glob(
+                f"{self.club_id}_*/leaderboard.json"
+            )
+            if path.parent.name.split("_", 1)[1] < self.week
+        )
+        if not earlier:
+            return None
+        with earlier[-1].open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_report(self, report: dict) -> None:
+        """Save the timings and fallbacks of the latest attempt."""
+        self._write_json(self._report_file, report)
+
+    def sent_message_ids(self) -> list[int]:
+        """Ids of the messages of the published album."""
+        return self.state["stages"].get("sent", {}).get("message_ids", [])
@@ -1,19 +1,20 @@
+from __future__ import annotations
+
 import logging
 import gettext
 
 from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-from apscheduler.schedulers.blocking import BlockingScheduler
-
-from babel import Locale
-from babel.dates import format_date
+from typing import TYPE_CHECKING
 
 from environs import Env
 
+if TYPE_CHECKING:
+    from aiogram import Bot
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from babel import Locale
+
 # Read environment variables
 env = Env()
 env.read_env()
@@ -25,17 +26,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Telegram Bot
-bot = Bot(
-    token=env.str("BOT_TOKEN"),
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-)
-
 # Base directory
 BASE_DIR = Path(__file__).resolve().parent
 
-# Base URL
-BASE_URL = "https://www.strava.com"
+# Base URL (overridable to point the scraper at a stand-in)
+BASE_URL = env.str("STRAVA_BASE_URL", "") or "https://www.strava.com"
 
 # Chrome driver options
 option_arguments = [
@@ -60,22 +55,77 @@ option_arguments = [
     "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
 ]
 
-# Create a scheduler
-scheduler = BlockingScheduler(timezone=env.str("TZ"))
 
-# Locale
+class Settings:
+    """
+    Resources built from the environment on first use.
 
-# We create a locale (language) object for translation
-locale = Locale(env.str("LOCALE"))
+    Importing the config does not require the Telegram, scheduler or
+    locale settings, so render-only and scrape-only processes neither pay
+    for them nor fail without them.
+    """
 
-# Initialize the gettext object to use the current locale
-translate = gettext.translation(
-    "bot", localedir=BASE_DIR / "locales", languages=[locale.language]
-)
+    @cached_property
+    def bot(self) -> Bot:
+        """Telegram Bot"""
+        from aiogram import Bot
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from aiogram.enums import ParseMode
+
+        # A local Bot API server (or a stand-in) instead of api.telegram.org
+        api_url = env.str("TELEGRAM_API_URL", "")
+        session = (
+            AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+            if api_url
+            else None
+        )
+        return Bot(
+            token=env.str("BOT_TOKEN"),
+            session=session,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+
+    @cached_property
+    def scheduler(self) -> BlockingScheduler:
+        """Create a scheduler"""
+        from apscheduler.schedulers.blocking import BlockingScheduler
+
+        return BlockingScheduler(timezone=env.str("TZ"))
+
+    @cached_property
+    def locale(self) -> Locale:
+        """We create a locale (language) object for translation"""
+        from babel import Locale
+
+        return Locale(env.str("LOCALE"))
+
+    @cached_property
+    def translate(self) -> gettext.NullTranslations:
+        """Initialize the gettext object to use the current locale"""
+        return gettext.translation(
+            "bot",
+            localedir=BASE_DIR / "locales",
+            languages=[self.locale.language],
+        )
+
+
+settings = Settings()
+
+
+def __getattr__(name: str):
+    """Keep `config.bot`, `config.scheduler`, etc. working lazily."""
+    if name in ("bot", "scheduler", "locale", "translate"):
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def format_and_translate_date(date: datetime) -> dict:
     """Format and translate a date."""
+    from babel.dates import format_date
+
+    locale = settings.locale
 
     # Format the date, month, and year using Babel
     formatted_week = format_date(date, format="w", locale=locale)
@@ -90,3 +140,9 @@ def format_and_translate_date(date: datetime) -> dict:
     }
 
     return variables
+
+
+def iso_week_key(date: datetime) -> str:
+    """Return the ISO week of a date as a key, e.g. '2025-W07'."""
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import config
+
+# Share of the run time of every stage, in pipeline order
+STAGE_SHARES = {"scrape": 0.5, "render": 0.3, "send": 0.2}
+# Seconds a stage gets even when the run is already late, so that it is
+# still bounded but not skipped
+MIN_STAGE_BUDGET = 10
+
+
+class RunDeadline:
+    """
+    Deadline of a run split into per-stage budgets.
+
+    A stage may use its share of the time left for it and the stages after
+    it, so time an early stage does not use carries over. Stages that run
+    over degrade instead of waiting; the fallbacks they take are counted
+    for the run report.
+    """
+
+    def __init__(
+        self,
+        seconds: float | None,
+        shares: dict[str, float] | None = None,
+    ):
+        self.seconds = seconds
+        self.shares = shares or STAGE_SHARES
+        self.started = time.monotonic()
+        self.elapsed: dict[str, float] = {}
+        self.fallbacks: Counter = Counter()
+        self.logger = config.logger
+
+    @classmethod
+    def from_env(cls) -> RunDeadline:
+        """Deadline from RUN_DEADLINE (seconds, 0 for none)."""
+        return cls(config.env.float("RUN_DEADLINE", 0) or None)
+
+    def remaining(self) -> float | None:
+        """Seconds left until the deadline."""
+        if self.seconds is None:
+            return None
+        return max(self.seconds - (time.monotonic() - self.started), 0)
+
+    def budget(self, *stages: str) -> float | None:
+        """Seconds the given consecutive stages may take from now."""
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        names = list(self.shares)
+        rest = sum(
+            self.shares[name]
+            for name in names[names.index(stages[0]) :]
+        )
+        budget = remaining * sum(self.shares[name] for name in stages) / rest
+        return max(budget, MIN_STAGE_BUDGET)
+
+    def stage_deadline(self, *stages: str) -> float | None:
+        """Monotonic time by which the stages should be done."""
+        budget = self.budget(*stages)
+        return None if budget is None else time.monotonic() + budget
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.elapsed[name] = time.monotonic() - started
+
+    def fallback(self, stage: str, kind: str, count: int = 1) -> None:
+        """Record a fallback taken by a stage."""
+        if count:
+            self.fallbacks[f"{stage}:{kind}"] += count
+            self.logger.warning(
+                "Stage '%s' over budget, fallback: %s", stage, kind
+            )
+
+    def report(self) -> dict:
+        """Timings and fallbacks of the run."""
+        return {
+            "deadline": self.seconds,
+            "elapsed": round(time.monotonic() - self.started, 3),
+            "stages": {
+                name: round(seconds, 3)
+                for name, seconds in self.elapsed.items()
+            },
+            "fallbacks": dict(self.fallbacks),
+        }
@@ -0,0 +1,239 @@
+"""
+Read-only HTTP endpoint of the published leaderboards.
+
+Serves the leaderboards and posters of the checkpointed runs from memory:
+
+    GET /clubs/<club_id>/leaderboard                latest week
+    GET /clubs/<club_id>/leaderboard/<YYYY-Www>     one week
+    GET /clubs/<club_id>/history                    weeks in the cache
+    GET /clubs/<club_id>/posters/<YYYY-Www>/<file>  rendered poster
+
+Responses carry an ETag and Cache-Control and answer conditional GETs
+with 304. A request only looks up the cache; the cache is reloaded from
+checkpoints/ after every run and every HTTP_REFRESH_MINUTES, never by a
+request.
+
+    python http_api.py      # serve without the scheduler
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+from aiohttp import web
+
+import config
+from checkpoint import RunCheckpoint
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """Body of a response and its entity tag."""
+
+    body: bytes
+    content_type: str
+    etag: str
+
+    @classmethod
+    def of(cls, body: bytes, content_type: str) -> CachedResponse:
+        return cls(body, content_type, hashlib.sha1(body).hexdigest())
+
+    @classmethod
+    def json(cls, data) -> CachedResponse:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return cls.of(body, "application/json")
+
+
+class LeaderboardCache:
+    """
+    Responses of the latest checkpointed runs by request path.
+
+    A reload reads only the runs whose state changed since the previous
+    one and swaps the whole table at once, so a request never sees half
+    of a reload.
+    """
+
+    def __init__(
+        self,
+        checkpoints_dir: Path | None = None,
+        weeks: int | None = None,
+    ):
+        self.checkpoints_dir = checkpoints_dir or RunCheckpoint.CHECKPOINTS_DIR
+        # Weeks of every club kept in memory
+        self.weeks = weeks or config.env.int("HTTP_CACHE_WEEKS", 8)
+        self.logger = config.logger
+        self.responses: dict[str, CachedResponse] = {}
+        # Responses of every run and the state version they were read at
+        self._runs: dict[str, tuple[int, dict | None]] = {}
+        self._lock = asyncio.Lock()
+
+    def _read_run(self, path: Path) -> dict[str, CachedResponse] | None:
+        """Responses of one run, None if nothing was scraped yet."""
+        club_id, week = path.name.split("_", 1)
+        with (path / "state.json").open("r", encoding="utf-8") as f:
+            stages = json.load(f)["stages"]
+        if "scraped" not in stages:
+            return None
+        with (path / "leaderboard.json").open("r", encoding="utf-8") as f:
+            leaderboard = json.load(f)
+
+        prefix = f"/clubs/{club_id}"
+        responses = {}
+        posters = []
+        for name in stages.get("rendered", {}).get("posters", []):
+            poster_file = path / "posters" / name
+            if not poster_file.is_file():
+                continue
+            url = f"{prefix}/posters/{week}/{name}"
+            responses[url] = CachedResponse.of(
+                poster_file.read_bytes(), "image/png"
+            )
+            posters.append(url)
+
+        responses[f"{prefix}/leaderboard/{week}"] = CachedResponse.json(
+            {
+                "club_id": club_id,
+                "week": week,
+                "scraped_at": stages["scraped"]["completed_at"],
+                "published": "sent" in stages,
+                "posters": posters,
+                "athletes": leaderboard,
+            }
+        )
+        return responses
+
+    def _latest_runs(self) -> dict[str, list[Path]]:
+        """Directories of the newest runs of every club, newest first."""
+        runs: dict[str, list[Path]] = {}
+        for state_file in self.checkpoints_dir.glob("*_*/state.json"):
+            club_id = state_file.parent.name.split("_", 1)[0]
+            runs.setdefault(club_id, []).append(state_file.parent)
+        return {
+            club_id: sorted(paths, key=lambda p: p.name, reverse=True)[
+                : self.weeks
+            ]
+            for club_id, paths in runs.items()
+        }
+
+    def refresh(self) -> None:
+        """Re-read the changed runs and swap in the new responses."""
+        runs, responses = {}, {}
+        for club_id, paths in self._latest_runs().items():
+            history = []
+            for path in paths:
+                version = (path / "state.json").stat().st_mtime_ns
+                cached = self._runs.get(path.name)
+                if cached is None or cached[0] != version:
+                    cached = (version, self._read_run(path))
+                runs[path.name] = cached
+                if cached[1] is None:
+                    continue
+                responses.update(cached[1])
+                week = path.name.split("_", 1)[1]
+                history.append(
+                    {
+                        "week": week,
+                        "url": f"/clubs/{club_id}/leaderboard/{week}",
+                    }
+                )
+            if history:
+                responses[f"/clubs/{club_id}/leaderboard"] = responses[
+                    history[0]["url"]
+                ]
+                responses[f"/clubs/{club_id}/history"] = (
+                    CachedResponse.json(history)
+                )
+
+        self._runs, self.responses = runs, responses
+        self.logger.info(
+            "HTTP cache: %s responses of %s runs", len(responses), len(runs)
+        )
+
+    async def reload(self) -> None:
+        """Refresh the cache without blocking the event loop."""
+        async with self._lock:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the previous responses
+                self.logger.error("HTTP cache reload failed: %s", e)
+
+
+class LeaderboardServer:
+    """aiohttp server answering from a LeaderboardCache."""
+
+    def __init__(
+        self,
+        cache: LeaderboardCache,
+        host: str | None = None,
+        port: int | None = None,
+        max_age: int | None = None,
+    ):
+        self.cache = cache
+        self.host = host or config.env.str("HTTP_HOST", "0.0.0.0")
+        self.port = port or config.env.int("HTTP_PORT", 8080)
+        self.max_age = (
+            config.env.int("HTTP_CACHE_MAX_AGE", 300)
+            if max_age is None
+            else max_age
+        )
+        self.logger = config.logger
+        self._runner: web.AppRunner | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        response = self.cache.responses.get(request.path)
+        if response is None:
+            raise web.HTTPNotFound()
+
+        headers = {"Cache-Control": f"public, max-age={self.max_age}"}
+        if request.if_none_match and any(
+            tag.value in (response.etag, "*") for tag in request.if_none_match
+        ):
+            reply = web.Response(status=304, headers=headers)
+        else:
+            reply = web.Response(
+                body=response.body,
+                content_type=response.content_type,
+                headers=headers,
+            )
+        reply.etag = response.etag
+        return reply
+
+    async def start(self) -> None:
+        """Start serving."""
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info("HTTP API on http://%s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve() -> None:
+    """Serve the cache and reload it every HTTP_REFRESH_MINUTES."""
+    cache = LeaderboardCache()
+    await cache.reload()
+    server = LeaderboardServer(cache)
+    await server.start()
+    try:
+        while True:
+            await asyncio.sleep(
+                config.env.int("HTTP_REFRESH_MINUTES", 10) * 60
+            )
+            await cache.reload()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,295 @@
+"""
+Live leaderboard of the current week.
+
+Every poll scrapes this week's leaderboard, re-renders only the posters
+whose rows changed (rank, name, distance or avatar) and edits the
+published Telegram messages in place. The first poll of a week sends
+the album; the message ids and a fingerprint of every poster are kept
+in live/<club_id>_<YYYY-Www>/state.json. A poll holds the .lock file of
+that directory, so a poll that overlaps it (a slow one and the next
+tick, or cron and the scheduler) is skipped.
+
+    python live.py        # one poll, e.g. from cron or the scheduler
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from aiogram.exceptions import TelegramAPIError
+
+import config
+from app_context import AppContext
+from parse import pooled_retriever
+from poster import PosterAthletesCollector
+from poster_maker.creator import AthleteRankPosterGenerator
+from poster_maker.themes import PosterTheme, get_registry
+from strava.exceptions import AccountPoolExhaustedException
+from tg_sender import TelegramSender
+
+
+def scrape_this_week(club_id: int):
+    """Start a browser and retrieve this week's leaderboard of the club."""
+    try:
+        with pooled_retriever(club_id) as strava:
+            return strava.retrieve_leaderboard_data(is_last_week=False)
+    except AccountPoolExhaustedException as e:
+        return None, str(e)
+
+
+class LiveLeaderboard:
+    """The published live leaderboard of one club and week."""
+
+    LIVE_DIR = config.BASE_DIR / "live"
+
+    def __init__(self, club_id: int | str, chat_id: int | str, week: str):
+        self.club_id = str(club_id)
+        self.chat_id = chat_id
+        self.week = week
+        self.logger = config.logger
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = self._read_state()
+
+    @classmethod
+    def for_this_week(
+        cls, club_id: int | str, chat_id: int | str
+    ) -> LiveLeaderboard:
+        """Live leaderboard of the current ISO week."""
+        return cls(club_id, chat_id, config.iso_week_key(datetime.now()))
+
+    @property
+    def path(self) -> Path:
+        return self.LIVE_DIR / f"{self.club_id}_{self.week}"
+
+    @property
+    def posters_dir(self) -> Path:
+        return self.path / "posters"
+
+    @property
+    def _state_file(self) -> Path:
+        return self.path / "state.json"
+
+    @contextmanager
+    def locked(self):
+        """Hold the live leaderboard exclusively for the block.
+
+        Yields False at once if another poll (in this or another process)
+        holds it. The state is read again once locked.
+        """
+        with open(self.path / ".lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                self.state = self._read_state()
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_state(self) -> dict:
+        if not self._state_file.is_file():
+            return {"chat_id": self.chat_id, "messages": [], "posters": []}
+        with self._state_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self) -> None:
+        tmp_path = self._state_file.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._state_file)
+
+    @staticmethod
+    def fingerprint(group: list[dict], theme: PosterTheme) -> str:
+        """Fingerprint of everything a poster shows."""
+        rows = [
+            (
+                athlete["rank"],
+                athlete["athlete_name"],
+                athlete["distance"],
+                athlete["avatar_medium"],
+            )
+            for athlete in group
+        ]
+        data = json.dumps([theme.name, rows], ensure_ascii=False)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    async def render(
+        self,
+        leaderboard: list[dict],
+        generator: AthleteRankPosterGenerator,
+    ) -> tuple[list[dict], list[int]]:
+        """Render the posters that changed since the previous poll.
+
+        Returns the posters (file and fingerprint) and the positions of
+        the re-rendered ones.
+        """
+        collector = PosterAthletesCollector(
+            leaderboard,
+            output_dir=self.posters_dir,
+            poster_generator=generator,
+            theme=get_registry().for_date(datetime.now()),
+            max_posters=config.env.int("MAX_POSTERS", 0) or None,
+        )
+        previous = self.state["posters"]
+        published = collector.output.current()
+        posters, changed = [], []
+        staging = collector.start_output()
+        try:
+            for num, group in enumerate(collector.poster_groups()):
+                fingerprint = self.fingerprint(
+                    group, collector.poster_theme(num)
+                )
+                if (
+                    published is not None
+                    and num < len(previous)
+                    and previous[num]["fingerprint"] == fingerprint
+                    and (published / previous[num]["file"]).is_file()
+                ):
+                    # Unchanged: the new version shares the file
+                    os.link(
+                        published / previous[num]["file"],
+                        staging / previous[num]["file"],
+                    )
+                    posters.append(previous[num])
+                    continue
+                filename = await collector.save_poster(num, group)
+                posters.append({"file": filename, "fingerprint": fingerprint})
+                changed.append(num)
+            collector.publish_output()
+        finally:
+            collector.discard_output()
+            await generator.close()
+        return posters, changed
+
+    async def publish(
+        self, posters: list[dict], changed: list[int], sender: TelegramSender
+    ) -> dict[str, int]:
+        """Bring the Telegram messages in line with the posters."""
+        messages = self.state["messages"]
+        counts = {"edited": 0, "sent": 0, "deleted": 0}
+
+        if messages:
+            for num in changed:
+                if num >= len(messages):
+                    continue
+                caption = sender.get_caption if num == 0 else None
+                edited = await sender.edit_poster(
+                    self.chat_id, messages[num], posters[num]["file"], caption
+                )
+                if not edited:
+                    # The album was (partly) removed from the chat: drop
+                    # what is left of it and send it again
+                    try:
+                        await sender.bot.delete_messages(
+                            self.chat_id, messages
+                        )
+                    except TelegramAPIError as e:
+                        self.logger.warning(
+                            "Old live album not deleted: %s", e
+                        )
+                    messages = []
+                    self._save_messages(messages)
+                    break
+                counts["edited"] += 1
+
+        if not messages:
+            messages = await sender.send_album_to_telegram(self.chat_id)
+            counts["sent"] = len(messages)
+        elif len(posters) > len(messages):
+            extra = [poster["file"] for poster in posters[len(messages) :]]
+            messages = messages + await sender.send_posters(
+                self.chat_id, extra
+            )
+            counts["sent"] = len(extra)
+        elif len(posters) < len(messages):
+            stale = messages[len(posters) :]
+            await sender.bot.delete_messages(self.chat_id, stale)
+            messages = messages[: len(posters)]
+            counts["deleted"] = len(stale)
+
+        # Kept at once: a crash before the poll ends must not make the
+        # next poll send yet another album
+        self._save_messages(messages)
+        return counts
+
+    def _save_messages(self, messages: list[int]) -> None:
+        self.state["messages"] = messages
+        self._save_state()
+
+    async def update(
+        self, leaderboard: list[dict], context: AppContext | None = None
+    ) -> dict[str, int]:
+        """Re-render the changed posters and update the published album."""
+        generator = (
+            AthleteRankPosterGenerator(
+                session=context.get_session(),
+                avatar_bytes=context.avatar_bytes,
+            )
+            if context
+            else AthleteRankPosterGenerator()
+        )
+        posters, changed = await self.render(leaderboard, generator)
+
+        sender = TelegramSender(
+            report_date=datetime.now(),
+            image_path=self.posters_dir.resolve(),
+            bot_instance=context.bot if context else None,
+            close_session=False,
+        )
+        counts = await self.publish(posters, changed, sender)
+
+        self.state["posters"] = posters
+        self.state["updated_at"] = datetime.now().isoformat(
+            timespec="seconds"
+        )
+        self._save_state()
+
+        counts.update(
+            posters=len(posters),
+            rendered=len(changed),
+            reused=len(posters) - len(changed),
+        )
+        self.logger.info("Live leaderboard %s: %s", self.path.name, counts)
+        return counts
+
+
+async def poll_live(context: AppContext | None = None):
+    """Scrape this week's leaderboard and update the live album."""
+    club_id = config.env.int("CLUB_ID")
+    chat_id = config.env.str("LIVE_CHAT_ID", "") or config.env.int("CHAT_ID")
+    live = LiveLeaderboard.for_this_week(club_id, chat_id)
+
+    # Two polls would both delete and send the album, or edit it twice
+    with live.locked() as locked:
+        if not locked:
+            config.logger.warning(
+                "Live poll of %s is in progress elsewhere, skipped.",
+                live.week,
+            )
+            return
+
+        leaderboard = await asyncio.to_thread(scrape_this_week, club_id)
+        if isinstance(leaderboard, tuple) or not leaderboard:
+            config.logger.error(
+                "Live leaderboard not retrieved: %s", leaderboard
+            )
+            return
+
+        try:
+            await live.update(leaderboard, context)
+        finally:
+            if context is None:
+                await config.bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(poll_live())
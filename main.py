@@ -1,91 +1,582 @@
+import argparse
 import asyncio
+import functools
+import json
+import threading
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
 
-from aiogram.utils.markdown import text, hcode, hpre
+from aiogram.utils.markdown import text
 
 import config
-from parse import StravaLeaderboardRetriever
+from app_context import AppContext
+from checkpoint import RunCheckpoint
+from deadline import RunDeadline
+from parse import PooledLeaderboardStream, pooled_retriever
 from poster import PosterAthletesCollector
+from poster_maker.cards import CardBatch
 from poster_maker.creator import AthleteRankPosterGenerator
+from poster_maker.emoji_source import LocalEmojiSource
+from poster_maker.themes import PosterTheme, get_registry
+from render_queue import RenderQueue, render_with_workers
+from snapshot import LeaderboardSnapshot
+from strava.exceptions import (
+    AccountPoolExhaustedException,
+    ScrapeCancelledException,
+)
+from strava.leaderboard import LeaderboardView
 from tg_sender import TelegramSender
 
 
-async def get_season_config(poster_generator: AthleteRankPosterGenerator):
-    """Set season-specific configurations for the poster generator."""
+def get_season_theme(report_date: datetime | None = None) -> PosterTheme:
+    """Get the poster theme of the season of the reported week."""
+    report_date = report_date or datetime.now() - timedelta(weeks=1)
+    return get_registry().for_date(report_date)
 
-    month: int = (datetime.now() - timedelta(weeks=1)).month
 
-    background_dir = (
-        config.BASE_DIR / "poster_maker/resources/images/poster_bgrnd"
-    )
-    background_images = {
-        "winter": "winter.jpg",
-        "spring": "spring.jpg",
-        "summer": "summer.jpg",
-        "autumn": "autumn.jpg",
-        "other": "other.jpg",
-        "other_winter": "other_winter.jpg",
-    }
+def scrape_leaderboard(
+    club_id: int,
+    timeout: float | None = None,
+    cancelled: threading.Event | None = None,
+):
+    """Start a browser and retrieve last week's leaderboard of the club.
 
-    # Dictionary with information about seasons and corresponding settings
-    season_configs = {
-        (1, 2, 12): (
-            "winter",
-            "other_winter",
-            ((263, 43), (130, 123), (400, 123)),
-        ),
-        (3, 4, 5): ("spring", "other", ((253, 105), (80, 112), (425, 112))),
-        (6, 7, 8): ("summer", "other", ((265, 40), (130, 123), (400, 123))),
-        (9, 10, 11): ("autumn", "other", ((263, 98), (85, 60), (450, 65))),
-    }
+    The scrape signs in as the least-loaded account of the pool, waiting
+    for one up to timeout seconds, and does not start once cancelled is
+    set.
+    """
+    try:
+        with pooled_retriever(club_id, timeout, cancelled) as strava:
+            return strava, strava.retrieve_leaderboard_data()
+    except (AccountPoolExhaustedException, ScrapeCancelledException) as e:
+        return None, (None, str(e))
 
-    # Determining the season based on the current month
-    for months, settings in season_configs.items():
-        if month in months:
-            poster_generator.BACKGROUND_IMAGE_PATH = (
-                background_dir / background_images[settings[0]]
-            )
-            poster_generator.BACKGROUND_2_IMAGE_PATH = (
-                background_dir / background_images[settings[1]]
+
+def scrape_leaderboard_views(club_id: int, views: list[LeaderboardView]):
+    """Retrieve several views of the club's leaderboard after one login.
+
+    Returns the rows by view, or (None, error) like scrape_leaderboard().
+    """
+    try:
+        with pooled_retriever(club_id) as strava:
+            return strava.retrieve_leaderboard_views(views)
+    except AccountPoolExhaustedException as e:
+        return None, str(e)
+
+
+async def notify_admin(
+    title: str, details: str, context: AppContext | None = None
+):
+    """Send an error report to the admin chat."""
+    msg = f"<pre><code class='language-python'>{details}</code></pre>"
+    message = text(title, msg, sep="\n")
+    # The alert must not hang a run that is already late
+    if context is None:
+        async with config.bot as bot:
+            await bot.send_message(
+                config.env.int("ADMIN_CHAT_ID"), message, request_timeout=30
             )
-            poster_generator.AVATARS_TOP3_POSITIONS = settings[2]
-            break
+    else:
+        await context.bot.send_message(
+            config.env.int("ADMIN_CHAT_ID"), message, request_timeout=30
+        )
+
+
+def make_generator(
+    context: AppContext | None = None,
+) -> AthleteRankPosterGenerator:
+    """Poster generator using the shared session and avatars if any."""
+    if context is None:
+        return AthleteRankPosterGenerator()
+    return AthleteRankPosterGenerator(
+        session=context.get_session(), avatar_bytes=context.avatar_bytes
+    )
+
+
+def make_collector(
+    athletes_rank: list[dict],
+    checkpoint: RunCheckpoint,
+    context: AppContext | None = None,
+    avatar_deadline: float | None = None,
+    poster_generator: AthleteRankPosterGenerator | None = None,
+) -> PosterAthletesCollector:
+    """Poster collector rendering into the run's checkpoint.
+
+    After avatar_deadline (monotonic time) avatars are no longer
+    downloaded and the posters degrade to cached variants or placeholders.
+    """
+    collector = PosterAthletesCollector(
+        athletes_rank,
+        output_dir=checkpoint.posters_dir,
+        poster_generator=poster_generator or make_generator(context),
+        # Apply settings according to the seasons
+        theme=get_season_theme(),
+        memory_bounded=config.env.bool("MEMORY_BOUNDED", False),
+        max_posters=config.env.int("MAX_POSTERS", 0) or None,
+    )
+    collector.poster_generator.deadline = avatar_deadline
+    return collector
+
+
+async def preload_theme() -> PosterTheme:
+    """Decode the season theme's backgrounds, fonts and emoji glyph."""
+    theme = await asyncio.to_thread(get_season_theme)
+    await asyncio.to_thread(theme.preload)
+    await asyncio.to_thread(
+        LocalEmojiSource(theme.font_size).get_glyph, "🔸"
+    )
+    return theme
 
 
-async def main():
-    """Main function"""
+async def warm_up(
+    checkpoint: RunCheckpoint,
+    generator: AthleteRankPosterGenerator,
+    context: AppContext | None = None,
+):
+    """
+    Prepare the render and send stages while the browser scrapes.
 
-    # Get Athletes data
-    strava = StravaLeaderboardRetriever(
-        config.env.str("EMAIL"),
-        config.env.str("PASSWD"),
-        config.env.int("CLUB_ID"),
+    Decodes the themes, backgrounds and fonts, opens the HTTP and Bot
+    sessions, and starts downloading the avatars of the rows the pre-warm
+    read, or else of the club's previous leaderboard (most members are
+    the same from week to week). A failed warm-up only costs the time it
+    would have saved.
+    """
+    started = time.perf_counter()
+    try:
+        theme = await preload_theme()
+
+        generator.open_session()
+        bot = context.bot if context else config.bot
+        await bot.get_me(request_timeout=30)
+
+        previous = await asyncio.to_thread(
+            checkpoint.prewarm_leaderboard
+        ) or await asyncio.to_thread(checkpoint.previous_leaderboard)
+        if previous:
+            generator.prefetch_avatars(previous, theme)
+    except Exception as e:
+        config.logger.warning("Warm-up failed: %s", e)
+        return
+    config.logger.info(
+        "Warm-up done in %.2f s, prefetching %s avatars",
+        time.perf_counter() - started,
+        len(generator.pending_prefetches),
     )
-    athletes_rank = strava.retrieve_leaderboard_data()
 
-    # Check if data was retrieved
+
+async def prewarm(context: AppContext | None = None):
+    """
+    Prepare the publication ahead of its time.
+
+    Signs in to Strava, which checks the session or refreshes the cookies
+    and the browser profile, reads last week's table into the checkpoint
+    and decodes the theme and fonts. With a context the avatars of the
+    table are downloaded into the shared cache. The publication then only
+    scrapes the final table, renders and sends.
+    """
+    club_id = config.env.int("CLUB_ID")
+    checkpoint = RunCheckpoint.for_last_week(club_id)
+    if checkpoint.is_done("sent"):
+        return
+
+    started = time.perf_counter()
+    theme = await preload_theme()
+
+    _, athletes_rank = await asyncio.to_thread(scrape_leaderboard, club_id)
     if isinstance(athletes_rank, tuple):
-        config.logger.error(athletes_rank[1])
-        # Send error to admin via Telegram
-        msg = f"<pre><code class='language-python'>{athletes_rank[1]}</code></pre>"
-        async with config.bot as bot:
-            await bot.send_message(
-                config.env.int("ADMIN_CHAT_ID"),
-                text("🖥 Strava parsing error: ", msg, sep="\n"),
+        # Found before the publication, so there is time to fix it
+        await notify_admin(
+            "🖥 Strava pre-warm failed: ", athletes_rank[1], context
+        )
+        return
+    checkpoint.save_prewarm(athletes_rank)
+
+    downloaded = 0
+    if context is not None:
+        generator = make_generator(context)
+        generator.prefetch_avatars(athletes_rank, theme)
+        downloaded = await generator.finish_prefetches()
+        await generator.close()
+    config.logger.info(
+        "Pre-warm of run %s done in %.2f s: %s rows, %s avatars downloaded",
+        checkpoint.run_key,
+        time.perf_counter() - started,
+        len(athletes_rank),
+        downloaded,
+    )
+
+
+async def scrape_and_render_streaming(
+    club_id: int,
+    checkpoint: RunCheckpoint,
+    context: AppContext | None = None,
+    avatar_deadline: float | None = None,
+    account_wait: float | None = None,
+) -> tuple[PosterAthletesCollector, str | None]:
+    """Render posters while the leaderboard rows are still being read.
+
+    The account and the browser live in the thread reading the rows, so
+    a scrape cut short by the deadline still releases and quits them.
+    An account is waited for up to account_wait seconds.
+    """
+    stream = PooledLeaderboardStream(club_id, timeout=account_wait)
+    poster = make_collector([], checkpoint, context, avatar_deadline)
+    filenames = await poster.create_and_save_posters(stream)
+    checkpoint.save_scraped(poster.athletes_data)
+    checkpoint.save_rendered(filenames)
+    return poster, stream.page_html
+
+
+async def main(save_snapshot: bool = False, context: AppContext | None = None):
+    """Main function
+
+    Every stage is checkpointed under the club and the reported ISO week,
+    so a retry resumes from the last completed stage and never publishes
+    the same album twice. With a context the HTTP and Bot sessions and
+    the avatar cache are shared with other jobs of the process. The run
+    keeps to RUN_DEADLINE: a stage over its budget degrades or is given
+    up, and the run report lists the fallbacks taken.
+    """
+
+    club_id = config.env.int("CLUB_ID")
+    chat_id = config.env.int("CHAT_ID")
+    checkpoint = RunCheckpoint.for_last_week(club_id)
+
+    # A scheduled run, its retry and a manual run must not all publish
+    with checkpoint.locked() as locked:
+        if not locked:
+            config.logger.warning(
+                "Run %s is in progress elsewhere, skipped.",
+                checkpoint.run_key,
+            )
+            return
+
+        if checkpoint.is_done("sent"):
+            config.logger.info(
+                "Run %s has already been published (messages %s).",
+                checkpoint.run_key,
+                checkpoint.sent_message_ids(),
+            )
+            return
+
+        deadline = RunDeadline.from_env()
+        try:
+            await run_pipeline(
+                club_id, chat_id, checkpoint, deadline, save_snapshot, context
+            )
+        finally:
+            await report_run(checkpoint, deadline, context)
+            if context is None:
+                # The session may be open since the warm-up
+                await config.bot.session.close()
+
+
+async def run_pipeline(
+    club_id: int,
+    chat_id: int,
+    checkpoint: RunCheckpoint,
+    deadline: RunDeadline,
+    save_snapshot: bool = False,
+    context: AppContext | None = None,
+):
+    """Scrape, render and send, resuming from the checkpoint."""
+    poster = page_html = generator = None
+    if checkpoint.is_done("scraped"):
+        athletes_rank = checkpoint.load_scraped()
+        config.logger.info(
+            "Resuming run %s from the scraped data.", checkpoint.run_key
+        )
+    elif config.env.bool("STREAM_LEADERBOARD", False):
+        # Scrape and render at once, posters start with the first rows.
+        # Avatars are downloaded while the scrape budget lasts.
+        try:
+            with deadline.stage("scrape"):
+                poster, page_html = await asyncio.wait_for(
+                    scrape_and_render_streaming(
+                        club_id,
+                        checkpoint,
+                        context,
+                        deadline.stage_deadline("scrape"),
+                        deadline.budget("scrape"),
+                    ),
+                    deadline.budget("scrape", "render"),
+                )
+        except asyncio.TimeoutError:
+            deadline.fallback("scrape", "aborted")
+            return
+        except Exception as e:
+            config.logger.error("Streaming scrape failed: %s", e)
+            await notify_admin("🖥 Strava parsing error: ", str(e), context)
+            return
+        finally:
+            if poster is not None:
+                record_render_fallbacks(poster, deadline)
+        athletes_rank = poster.athletes_data
+    else:
+        # Get Athletes data (the browser work runs off the event loop,
+        # meanwhile the render and send stages are warmed up).
+        # On timeout the browser thread is left to finish on its own,
+        # and does not start the browser if it still waits for an account.
+        generator = make_generator(context)
+        warming = (
+            asyncio.create_task(warm_up(checkpoint, generator, context))
+            if config.env.bool("WARM_UP", True)
+            else None
+        )
+        scraped = False
+        abandoned = threading.Event()
+        try:
+            with deadline.stage("scrape"):
+                strava, athletes_rank = await asyncio.wait_for(
+                    asyncio.to_thread(
+                        scrape_leaderboard,
+                        club_id,
+                        deadline.budget("scrape"),
+                        abandoned,
+                    ),
+                    deadline.budget("scrape"),
+                )
+            scraped = True
+        except asyncio.TimeoutError:
+            deadline.fallback("scrape", "aborted")
+            return
+        finally:
+            if not scraped:
+                abandoned.set()
+            if warming is not None:
+                if not scraped:
+                    warming.cancel()
+                await asyncio.gather(warming, return_exceptions=True)
+            if not scraped:
+                # Cancels the avatar prefetches, closes an owned session
+                await generator.close()
+
+        # Check if data was retrieved
+        if isinstance(athletes_rank, tuple):
+            await generator.close()
+            config.logger.error(athletes_rank[1])
+            # Send error to admin via Telegram
+            await notify_admin(
+                "🖥 Strava parsing error: ", athletes_rank[1], context
+            )
+            return
+
+        page_html = strava.page_html
+        checkpoint.save_scraped(athletes_rank)
+
+    if checkpoint.is_done("rendered") and checkpoint.rendered_files_exist():
+        config.logger.info(
+            "Resuming run %s from the rendered posters.", checkpoint.run_key
+        )
+    else:
+        # Generate and save posters
+        with deadline.stage("render"):
+            poster = make_collector(
+                athletes_rank,
+                checkpoint,
+                context,
+                deadline.stage_deadline("render"),
+                poster_generator=generator,
             )
+            if config.env.bool("RENDER_QUEUE", False):
+                # Render workers in other processes share the posters
+                filenames = await render_with_workers(
+                    poster, RenderQueue(), checkpoint.run_key
+                )
+            else:
+                filenames = await poster.create_and_save_posters()
+        record_render_fallbacks(poster, deadline)
+        checkpoint.save_rendered(filenames)
+
+    if save_snapshot:
+        if page_html is None:
+            # Resumed from the checkpoint, the page was not read
+            config.logger.warning(
+                "Snapshot of run %s saved without the page HTML",
+                checkpoint.run_key,
+            )
+        if poster is not None:
+            cached = poster.poster_generator.avatar_bytes
+        else:
+            cached = context.avatar_bytes if context else {}
+        LeaderboardSnapshot.for_last_week(
+            club_id,
+            leaderboard=athletes_rank,
+            page_html=page_html,
+            avatars=await snapshot_avatars(athletes_rank, cached, context),
+        ).save()
+
+    # Sending posters via Telegram
+    send = TelegramSender(
+        # The published posters of this run, whatever runs publish later
+        image_path=checkpoint.posters_dir.resolve(),
+        bot_instance=context.bot if context else None,
+        close_session=context is None,
+    )
+    # A send is never cancelled once started, or a retry would post the
+    # delivered albums again: the budget bounds every album request, and
+    # the albums are checkpointed one by one so a retry sends the rest
+    sent_albums = checkpoint.sent_albums(chat_id)
+    if sent_albums:
+        config.logger.info(
+            "Resuming run %s after %s sent albums.",
+            checkpoint.run_key,
+            len(sent_albums),
+        )
+    send_deadline = deadline.stage_deadline("send")
+    with deadline.stage("send"):
+        message_ids = await send.send_album_to_telegram(
+            chat_id,
+            sent_albums=sent_albums,
+            on_album_sent=functools.partial(
+                checkpoint.save_sent_album, chat_id
+            ),
+            album_timeout=deadline.budget("send"),
+        )
+    if send_deadline is not None and time.monotonic() > send_deadline:
+        deadline.fallback("send", "late")
+    if not message_ids:
+        # Nothing reached the chat: the run is not published
+        await notify_admin("📭 No poster sent: ", checkpoint.run_key, context)
         return
+    checkpoint.save_sent(chat_id, message_ids)
+
+
+def record_render_fallbacks(
+    poster: PosterAthletesCollector, deadline: RunDeadline
+) -> None:
+    """Add the degraded renderings of the posters to the run."""
+    for kind, count in poster.poster_generator.fallbacks.items():
+        deadline.fallback("render", kind, count)
+
 
-    # Generate and save posters
-    poster = PosterAthletesCollector(athletes_rank)
+async def report_run(
+    checkpoint: RunCheckpoint,
+    deadline: RunDeadline,
+    context: AppContext | None = None,
+):
+    """Save the run report and alert the admin if the run degraded."""
+    report = deadline.report()
+    checkpoint.save_report(report)
+    config.logger.info("Run %s report: %s", checkpoint.run_key, report)
+    if report["fallbacks"]:
+        try:
+            await notify_admin(
+                "⏱ Run over its deadline, fallbacks used: ",
+                json.dumps(report, indent=2),
+                context,
+            )
+        except Exception as e:
+            config.logger.error("Run report not sent: %s", e)
+
+
+async def snapshot_avatars(
+    athletes_rank: list[dict],
+    cached: dict[str, bytes],
+    context: AppContext | None = None,
+) -> dict[str, bytes]:
+    """Avatars of the leaderboard's posters, for its snapshot.
+
+    Only the avatars of its rows are taken from the cache, which may be
+    shared with other runs or emptied by MEMORY_BOUNDED; the missing
+    ones are downloaded.
+    """
+    urls = {
+        url
+        for athlete in athletes_rank
+        for url in (athlete.get("avatar_medium"), athlete.get("avatar_large"))
+        if url
+    }
+    async with AthleteRankPosterGenerator(
+        session=context.get_session() if context else None,
+        avatar_bytes={url: cached[url] for url in urls if url in cached},
+        theme=get_season_theme(),
+    ) as generator:
+        generator.prefetch_avatars(athletes_rank)
+        await generator.finish_prefetches()
+        return generator.avatar_bytes
+
+
+async def replay(snapshot_path: str, send: bool = False):
+    """Render (and optionally send) posters from a saved snapshot.
+
+    No browser is started and avatars are taken from the snapshot only.
+    The posters are rendered into the snapshot's posters/ directory.
+    """
+    snapshot = LeaderboardSnapshot.load(snapshot_path)
+
+    poster = PosterAthletesCollector(
+        snapshot.leaderboard,
+        output_dir=Path(snapshot_path) / "posters",
+        theme=get_season_theme(snapshot.week_date),
+    )
+    poster.poster_generator.avatar_bytes = dict(snapshot.avatars)
+    poster.poster_generator.offline = True
 
-    # Apply settings according to the seasons
-    await get_season_config(poster.poster_generator)
     await poster.create_and_save_posters()
 
-    # Sending posters via Telegram
-    send = TelegramSender()
-    await send.send_album_to_telegram(config.env.int("CHAT_ID"))
+    if send:
+        sender = TelegramSender(
+            report_date=snapshot.week_date,
+            image_path=poster.output.path.resolve(),
+        )
+        await sender.send_album_to_telegram(config.env.int("CHAT_ID"))
+
+
+async def render_cards(processes: int | None = None) -> dict:
+    """Render the personal card of every athlete of last week's run."""
+    checkpoint = RunCheckpoint.for_last_week(config.env.int("CLUB_ID"))
+    if not checkpoint.is_done("scraped"):
+        raise RuntimeError(
+            f"No leaderboard of {checkpoint.run_key} to render cards of"
+        )
+    return await CardBatch(
+        checkpoint.load_scraped(),
+        checkpoint.cards_dir,
+        theme=get_season_theme(),
+        processes=processes,
+        label=checkpoint.week,
+    ).render()
+
+
+def parse_args() -> argparse.Namespace:
+    """Command line arguments."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="save the scraped leaderboard, page HTML and avatars",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="render posters from a snapshot directory instead of Strava",
+    )
+    parser.add_argument(
+        "--send",
+        action="store_true",
+        help="send the replayed posters to CHAT_ID",
+    )
+    parser.add_argument(
+        "--cards",
+        action="store_true",
+        help="render a personal card per athlete of last week's run",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="processes rendering the cards (CARD_PROCESSES by default)",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.cards:
+        asyncio.run(render_cards(args.processes))
+    elif args.replay:
+        asyncio.run(replay(args.replay, send=args.send))
+    else:
+        asyncio.run(main(save_snapshot=args.snapshot))
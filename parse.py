@@ -1,10 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import threading
+from contextlib import closing, contextmanager
+from typing import AsyncIterator, Callable, Iterator
+
 import config
+from strava.accounts import get_account_pool
 from strava.authorization import StravaAuthorization
 from strava.browser import BrowserManager
-from strava.exceptions import AuthorizationFailureException
-from strava.leaderboard import StravaLeaderboard
+from strava.exceptions import (
+    AuthorizationFailureException,
+    ScrapeCancelledException,
+)
+from strava.leaderboard import LeaderboardView, StravaLeaderboard
 
 
 class StravaLeaderboardRetriever:
@@ -12,16 +21,32 @@ class StravaLeaderboardRetriever:
 
     def __init__(self, email: str, password: str, club_id: int):
         self.club_id = club_id
-        self.browser = BrowserManager().start_browser()
+        # A persistent Chrome profile per account keeps the login
+        profile = email if config.env.bool("CHROME_PROFILE", False) else None
+        self.browser = BrowserManager(profile).start_browser()
         self.auth = StravaAuthorization(self.browser, email, password)
         self.leaderboard = StravaLeaderboard(self.browser)
+        # Set when the account could not sign in, to rest it in the pool
+        self.auth_failed = False
+
+    @property
+    def page_html(self) -> str | None:
+        """Raw HTML of the last extracted leaderboard page."""
+        return self.leaderboard.page_source
+
+    def _authorize(self) -> None:
+        try:
+            self.auth.authorization()
+        except AuthorizationFailureException:
+            self.auth_failed = True
+            raise
 
     def retrieve_leaderboard_data(
         self, is_last_week: bool = True
     ) -> list[dict[str, str]] | None | tuple[None, str]:
         """Retrieve leaderboard data for the specified Strava club."""
         try:
-            self.auth.authorization()
+            self._authorize()
             leaderboard_data = (
                 self.leaderboard.get_this_week_or_last_week_leaders(
                     self.club_id,
@@ -39,3 +64,170 @@ class StravaLeaderboardRetriever:
             return None, str(e)
         finally:
             self.browser.quit()
+
+    def retrieve_leaderboard_views(
+        self, views: list[LeaderboardView]
+    ) -> dict[LeaderboardView, list[dict[str, str]]] | tuple[None, str]:
+        """Retrieve several leaderboard views after a single login."""
+        try:
+            self._authorize()
+            return self.leaderboard.get_leaderboard_views(self.club_id, views)
+        except AuthorizationFailureException as auth_error:
+            config.logger.error(
+                "Strava authorization error: %s", str(auth_error)
+            )
+            return None, str(auth_error)
+        except Exception as e:
+            config.logger.error("An error occurred: %s", str(e))
+            return None, str(e)
+        finally:
+            self.browser.quit()
+
+    def stream_leaderboard_data(
+        self, is_last_week: bool = True, batch_size: int = 50
+    ) -> Iterator[list[dict[str, str]]]:
+        """Yield leaderboard rows in batches as they are extracted.
+
+        Errors are raised to the caller; the browser is closed when the
+        iteration ends.
+        """
+        try:
+            self._authorize()
+            yield from self.leaderboard.iter_leaderboard_batches(
+                self.club_id, is_last_week, batch_size
+            )
+        finally:
+            self.browser.quit()
+
+    def astream_leaderboard_data(
+        self, is_last_week: bool = True, batch_size: int = 50
+    ) -> AsyncIterator[list[dict[str, str]]]:
+        """Stream the batches from a worker thread into the event loop."""
+        return astream_batches(
+            lambda: self.stream_leaderboard_data(is_last_week, batch_size)
+        )
+
+
+async def astream_batches(
+    batches: Callable[[], Iterator[list[dict[str, str]]]],
+    cancelled: threading.Event | None = None,
+) -> AsyncIterator[list[dict[str, str]]]:
+    """Iterate batches(), a blocking iterator, in a worker thread.
+
+    A consumer that stops early (or is cancelled) does not wait for the
+    thread: it stops after the batch in progress and closes the
+    iterator itself, running its cleanup in the thread. The consumer
+    then sets cancelled, which batches() may also check.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    if cancelled is None:
+        cancelled = threading.Event()
+
+    def put(item) -> None:
+        if cancelled.is_set():
+            return
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # The event loop is closed
+
+    def produce():
+        try:
+            with closing(batches()) as iterator:
+                for batch in iterator:
+                    if cancelled.is_set():
+                        break
+                    put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    producer = loop.run_in_executor(None, produce)
+    finished = False
+    try:
+        while (item := await queue.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        finished = True
+    finally:
+        cancelled.set()
+        if finished:
+            await producer
+
+
+class PooledLeaderboardStream:
+    """
+    Leaderboard batches read under an account of the pool.
+
+    The account is acquired, the browser started and quit and the
+    account released all in one worker thread, so a consumer cancelled
+    by a deadline leaks neither the lease nor the browser. A thread still
+    waiting for an account when the consumer gives up never starts the
+    browser.
+    """
+
+    def __init__(
+        self,
+        club_id: int,
+        is_last_week: bool = True,
+        batch_size: int = 50,
+        timeout: float | None = None,
+    ):
+        self.club_id = club_id
+        self.is_last_week = is_last_week
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # Raw HTML of the last page read, set once the stream ends
+        self.page_html: str | None = None
+        self.cancelled = threading.Event()
+
+    def _batches(self) -> Iterator[list[dict[str, str]]]:
+        with pooled_retriever(
+            self.club_id, self.timeout, self.cancelled
+        ) as strava:
+            try:
+                yield from strava.stream_leaderboard_data(
+                    self.is_last_week, self.batch_size
+                )
+            finally:
+                self.page_html = strava.page_html
+
+    def __aiter__(self) -> AsyncIterator[list[dict[str, str]]]:
+        return astream_batches(self._batches, self.cancelled)
+
+
+@contextmanager
+def pooled_retriever(
+    club_id: int,
+    timeout: float | None = None,
+    cancelled: threading.Event | None = None,
+):
+    """Retriever signed in as the least-loaded account of the pool.
+
+    The account is held until the block ends and rests if it failed to
+    sign in. Raises AccountPoolExhaustedException if no account becomes
+    available within the timeout (at most ACCOUNT_WAIT seconds), and
+    ScrapeCancelledException if cancelled is set before or while waiting
+    for it, in which case no browser is started.
+    """
+    account_wait = config.env.float("ACCOUNT_WAIT", 600)
+    timeout = account_wait if timeout is None else min(timeout, account_wait)
+    if cancelled is not None and cancelled.is_set():
+        raise ScrapeCancelledException("Scrape given up before it started")
+    with get_account_pool().lease(timeout) as lease:
+        if cancelled is not None and cancelled.is_set():
+            lease.unused = True
+            raise ScrapeCancelledException(
+                "Scrape given up while waiting for an account"
+            )
+        strava = StravaLeaderboardRetriever(
+            lease.email, lease.password, club_id
+        )
+        try:
+            yield strava
+        finally:
+            lease.auth_failed = strava.auth_failed
@@ -1,35 +1,170 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import AsyncIterator
+
 from poster_maker.creator import AthleteRankPosterGenerator
+from poster_maker.layout import FIRST_POSTER_ROWS, PosterLayout, plan_layout
+from poster_maker.publishing import PublishedDirectory
 from poster_maker.saver import PosterSaver
+from poster_maker.themes import PosterTheme
 
 
 class PosterAthletesCollector:
     """Collect and generate posters for athletes."""
 
-    def __init__(self, athletes_data):
+    def __init__(
+        self,
+        athletes_data,
+        output_dir: Path | None = None,
+        poster_generator: AthleteRankPosterGenerator | None = None,
+        theme: PosterTheme | None = None,
+        memory_bounded: bool = False,
+        max_posters: int | None = None,
+    ):
         self.athletes_data = athletes_data
-        self.poster_generator = AthleteRankPosterGenerator()
-        self.saver = PosterSaver()
+        self.poster_generator = (
+            poster_generator or AthleteRankPosterGenerator()
+        )
+        self.theme = theme or self.poster_generator.theme
+        # Only one poster and its avatars are held in memory at a time
+        self.poster_generator.release_avatars = memory_bounded
+        # Posters are rendered into a staging directory of the run and
+        # published into output_dir at once
+        self.output = PublishedDirectory(
+            output_dir or PosterSaver.OUTPUT_FOLDER
+        )
+        self.saver: PosterSaver | None = None
+        # Preferred upper bound of the poster count (compact rows if needed)
+        self.max_posters = max_posters
+        self.layout: PosterLayout | None = None
 
     def _group_athletes_for_posters(self):
         """Group athletes for generating posters."""
 
-        top_10 = self.athletes_data[:10]
-        remainder = self.athletes_data[10:]
-        tag = len(remainder) - (len(remainder) % 15)
-        groups = [top_10] + [remainder[i:i+15] for i in range(0, tag, 15)]
+        self.layout = plan_layout(
+            len(self.athletes_data), self.theme, self.max_posters
+        )
+        first, size = self.layout.first_rows, self.layout.rows
+        top_10 = self.athletes_data[:first]
+        remainder = self.athletes_data[first : self.layout.shown]
+        groups = [top_10] + [
+            remainder[i : i + size] for i in range(0, len(remainder), size)
+        ]
         return groups
 
-    async def create_and_save_posters(self):
-        """Create and save posters for grouped athletes."""
-        groups = self._group_athletes_for_posters()
-        await self.saver.clear_output_folder()
+    async def _group_batches_for_posters(
+        self, batches: AsyncIterator[list[dict]]
+    ) -> AsyncIterator[list[dict]]:
+        """Group athletes for posters as their batches arrive.
+
+        The club size is not known in advance, so the regular row style
+        is used: the top 10 first, then groups of the rows the theme
+        allows, the last one only if full when it goes over max_posters.
+        Every received row is also added to athletes_data, and avatars
+        are prefetched batch by batch.
+        """
+        self.athletes_data = []
+        self.layout = None
+        pending = []
+        size = FIRST_POSTER_ROWS
+        posters = 0
+
+        async for batch in batches:
+            self.athletes_data.extend(batch)
+            self.poster_generator.prefetch_avatars(batch, self.theme)
+            pending.extend(batch)
+            while len(pending) >= size:
+                yield pending[:size]
+                pending = pending[size:]
+                posters += 1
+                size = self.theme.rows_per_poster
+
+        # The first poster is made even when it is not full
+        if not posters or (
+            pending
+            and (self.max_posters is None or posters < self.max_posters)
+        ):
+            yield pending
+
+    def poster_groups(self) -> list[list[dict]]:
+        """Athletes of every poster, in order (plans the layout)."""
+        return self._group_athletes_for_posters()
+
+    def poster_theme(self, num: int) -> PosterTheme:
+        """Theme of the poster at the given position."""
+        # The top 10 always keep the regular row style
+        return self.layout.theme if self.layout and num else self.theme
+
+    def start_output(self) -> Path:
+        """Create the staging directory the posters are saved into."""
+        self.saver = PosterSaver(self.output.stage())
+        return self.saver.output_dir
+
+    def publish_output(self) -> Path:
+        """Publish the saved posters, returning their directory."""
+        published = self.output.publish(self.saver.output_dir)
+        self.saver = None
+        return published
+
+    def discard_output(self) -> None:
+        """Delete the posters of an unfinished render."""
+        if self.saver is not None:
+            self.output.discard(self.saver.output_dir)
+            self.saver = None
+
+    async def save_poster(self, num: int, group: list[dict]) -> str:
+        """Render and save the poster at the given position.
+
+        Saves into the staging directory (see start_output()) and returns
+        the file name of the poster.
+        """
+        filename = f"poster_{num + 1}.png"
+        poster = await self.poster_generator.generate_poster(
+            group, num == 0, theme=self.poster_theme(num)
+        )
+        await self.saver.save_poster(poster, filename)
+        return filename
+
+    async def _iter_groups(self) -> AsyncIterator[list[dict]]:
+        for group in self._group_athletes_for_posters():
+            yield group
+
+    async def iter_saved_posters(
+        self, batches: AsyncIterator[list[dict]] | None = None
+    ) -> AsyncIterator[str]:
+        """Render, encode and save the posters one by one.
+
+        Yields the file name of every poster once it is on disk (in the
+        staging directory) and its image has been released. The posters
+        are published together once the last one is saved. With batches
+        the athletes are taken from them as they arrive instead of from
+        athletes_data.
+        """
+        groups = (
+            self._group_batches_for_posters(batches)
+            if batches is not None
+            else self._iter_groups()
+        )
+        self.start_output()
+
+        try:
+            num = 0
+            async for group in groups:
+                yield await self.save_poster(num, group)
+                num += 1
+            self.publish_output()
+        finally:
+            self.discard_output()
+            await self.poster_generator.close()
 
-        for num, group in enumerate(groups):
-            is_head_icon = num == 0
-            filename = f"poster_{num + 1}.png"
-            poster = await self.poster_generator.generate_poster(
-                group, is_head_icon
-            )
-            await self.saver.save_poster(poster, filename)
+    async def create_and_save_posters(
+        self, batches: AsyncIterator[list[dict]] | None = None
+    ) -> list[str]:
+        """Create and save posters for grouped athletes.
 
-        await self.poster_generator.close()
+        Returns the file names of the saved posters.
+        """
+        return [
+            filename async for filename in self.iter_saved_posters(batches)
+        ]
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from io import BytesIO
+
+from PIL import Image
+
+# Square size in px of the avatar variants served by the Strava CDN
+AVATAR_VARIANTS = {"avatar_medium": 62, "avatar_large": 124}
+
+# Path of the generic avatars of members without a photo
+DEFAULT_AVATAR_PATH = "/assets/avatar/athlete/"
+
+
+def is_default_avatar(avatar_url: str | None) -> bool:
+    """Check whether the URL is Strava's generic placeholder avatar."""
+    return not avatar_url or DEFAULT_AVATAR_PATH in avatar_url
+
+
+def avatar_candidates(athlete: dict, size: int) -> list[str]:
+    """
+    Avatar URLs of an athlete for the given target size.
+
+    The smallest variant that is at least as large as the target comes
+    first, then the larger ones, then the smaller ones as a last resort.
+    """
+    variants = sorted(
+        (variant_size, athlete[key])
+        for key, variant_size in AVATAR_VARIANTS.items()
+        if athlete.get(key)
+    )
+    sufficient = [
+        url for variant_size, url in variants if variant_size >= size
+    ]
+    smaller = [
+        url for variant_size, url in reversed(variants) if variant_size < size
+    ]
+    return sufficient + smaller
+
+
+def decode_avatar(image_bytes: bytes, size: int | None = None) -> Image.Image:
+    """
+    Open an avatar, decoding a JPEG at the smallest scale that still
+    covers the target size.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    if size:
+        # No-op for formats other than JPEG
+        image.draft("RGB", (size, size))
+    return image
@@ -0,0 +1,196 @@
+"""
+Personal cards of every athlete of a leaderboard, rendered in bulk.
+
+The avatars are downloaded once by the run. Every worker process gets
+them when it starts, decodes the theme's background, fonts and emoji
+glyphs once and renders its share of the cards offline with a single
+generator, so the caches of one card serve all the following ones.
+The cards are written into a staging directory that is published as a
+whole (see PublishedDirectory).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import config
+from poster_maker.creator import AthleteRankPosterGenerator
+from poster_maker.emoji_source import LocalEmojiSource
+from poster_maker.publishing import PublishedDirectory
+from poster_maker.saver import PosterSaver
+from poster_maker.themes import DEFAULT_THEME, PosterTheme, get_registry
+
+CARD_EMOJI = ("🔸", "🏃", "📏", "⛰", "⏱")
+# Chunks per process: small enough to balance, large enough to be cheap
+CHUNKS_PER_PROCESS = 4
+
+# Generator of a worker process, set up by _init_worker()
+_worker_generator: AthleteRankPosterGenerator | None = None
+
+
+def card_filename(athlete: dict) -> str:
+    """File name of an athlete's card: the Strava athlete id."""
+    athlete_id = (athlete.get("link") or "").rstrip("/").rpartition("/")[2]
+    if not athlete_id:
+        athlete_id = f"rank_{athlete['rank']}"
+    return f"{athlete_id}.png"
+
+
+def preload_card_theme(theme: PosterTheme) -> None:
+    """Decode everything a card needs ahead of the first one."""
+    theme.preload()
+    source = LocalEmojiSource(theme.font_size)
+    for emoji in CARD_EMOJI:
+        source.get_glyph(emoji)
+
+
+def _offline_generator(
+    avatar_bytes: dict[str, bytes], theme: PosterTheme
+) -> AthleteRankPosterGenerator:
+    generator = AthleteRankPosterGenerator(
+        avatar_bytes=avatar_bytes, theme=theme
+    )
+    generator.offline = True
+    return generator
+
+
+def _init_worker(avatar_bytes: dict[str, bytes], theme: PosterTheme):
+    """Set up a worker process once, before its first chunk."""
+    global _worker_generator
+    preload_card_theme(theme)
+    _worker_generator = _offline_generator(avatar_bytes, theme)
+
+
+async def render_cards(
+    generator: AthleteRankPosterGenerator,
+    athletes: list[dict],
+    output_dir: Path,
+    label: str = "",
+) -> list[str]:
+    """Render and save the cards of athletes, return their file names."""
+    saver = PosterSaver(output_dir)
+    filenames = []
+    for athlete in athletes:
+        card = await generator.generate_card(athlete, label=label)
+        filename = card_filename(athlete)
+        await saver.save_poster(card, filename)
+        filenames.append(filename)
+    return filenames
+
+
+def _render_chunk(
+    athletes: list[dict], output_dir: str, label: str
+) -> list[str]:
+    """Render a chunk of cards in a worker process."""
+    return asyncio.run(
+        render_cards(_worker_generator, athletes, Path(output_dir), label)
+    )
+
+
+class CardBatch:
+    """
+    Renders the personal cards of a leaderboard into one directory.
+
+    processes=1 renders in the calling process, which is also the
+    fastest choice for a handful of cards.
+    """
+
+    def __init__(
+        self,
+        athletes: list[dict],
+        output_dir: Path | str,
+        theme: PosterTheme | None = None,
+        processes: int | None = None,
+        label: str = "",
+        avatar_bytes: dict[str, bytes] | None = None,
+    ):
+        self.athletes = athletes
+        # Avatars at hand (e.g. of a snapshot) are not downloaded again
+        self.avatar_bytes = dict(avatar_bytes or {})
+        self.output = PublishedDirectory(output_dir)
+        self.theme = theme or get_registry().get(DEFAULT_THEME.name)
+        self.processes = max(
+            processes
+            or config.env.int("CARD_PROCESSES", 0)
+            or os.cpu_count()
+            or 1,
+            1,
+        )
+        self.label = label
+        self.logger = config.logger
+
+    async def download_avatars(self) -> dict[str, bytes]:
+        """Download the avatars of all the cards at once."""
+        async with AthleteRankPosterGenerator(
+            avatar_bytes=self.avatar_bytes, theme=self.theme
+        ) as generator:
+            generator.prefetch_avatars(self.athletes, card=True)
+            await generator.finish_prefetches()
+            return generator.avatar_bytes
+
+    def _chunks(self) -> list[list[dict]]:
+        count = min(self.processes * CHUNKS_PER_PROCESS, len(self.athletes))
+        return [self.athletes[i::count] for i in range(count)]
+
+    async def _render_in_processes(
+        self, avatar_bytes: dict[str, bytes], staging: Path
+    ) -> list[str]:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=_init_worker,
+            initargs=(avatar_bytes, self.theme),
+        ) as pool:
+            chunks = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool, _render_chunk, chunk, str(staging), self.label
+                    )
+                    for chunk in self._chunks()
+                )
+            )
+        return [filename for chunk in chunks for filename in chunk]
+
+    async def render(self) -> dict:
+        """Render, save and publish the cards, return the run report."""
+        started = time.perf_counter()
+        avatar_bytes = await self.download_avatars()
+        downloaded = time.perf_counter()
+
+        staging = self.output.stage()
+        try:
+            if self.processes == 1 or len(self.athletes) <= 1:
+                await asyncio.to_thread(preload_card_theme, self.theme)
+                filenames = await render_cards(
+                    _offline_generator(avatar_bytes, self.theme),
+                    self.athletes,
+                    staging,
+                    self.label,
+                )
+            else:
+                filenames = await self._render_in_processes(
+                    avatar_bytes, staging
+                )
+        except BaseException:
+            self.output.discard(staging)
+            raise
+        version = self.output.publish(staging)
+
+        finished = time.perf_counter()
+        render_seconds = finished - downloaded
+        report = {
+            "cards": len(filenames),
+            "processes": self.processes,
+            "download_seconds": round(downloaded - started, 3),
+            "render_seconds": round(render_seconds, 3),
+            "cards_per_second": round(
+                len(filenames) / render_seconds if render_seconds else 0, 1
+            ),
+            "output": str(version),
+        }
+        self.logger.info("Cards rendered: %s", report)
+        return report
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import re
 import ssl
-from io import BytesIO
+import time
+from collections import Counter
+from typing import ClassVar
 
 import aiohttp
 import certifi
@@ -10,33 +13,67 @@ from PIL import Image, ImageDraw
 from pilmoji import Pilmoji
 
 import config
+from profiling import profiled_stage
+from poster_maker.avatars import (
+    avatar_candidates,
+    decode_avatar,
+    is_default_avatar,
+)
+from poster_maker.emoji_source import EmojiTextDrawer, LocalEmojiSource
 from poster_maker.font_manager import FontManager
+from poster_maker.themes import (
+    DEFAULT_THEME,
+    PosterTheme,
+    get_registry,
+    load_background,
+)
 
 
 class AthleteRankPosterGenerator:
     """A class for generating posters with athlete rank information."""
 
     RESOURCES_DIR = config.BASE_DIR / "poster_maker/resources"
-    BACKGROUND_IMAGE_PATH = RESOURCES_DIR / "images/background.png"
-    BACKGROUND_2_IMAGE_PATH = RESOURCES_DIR / "images/background_2.png"
     CUP_PATH = RESOURCES_DIR / "images/cup.png"
     LOGO_PATH = RESOURCES_DIR / "images/logo.png"
     STRAVA_PATH = RESOURCES_DIR / "images/strava.png"
-    HEAD_ICONS_POSITION_Y = 410
-    AVATAR_SMALL_SIZE = 60
-    AVATAR_LARGE_SIZE = 124
-    AVATAR_SMALL_POSITION_X = 20
-    AVATARS_TOP3_POSITIONS = ((258, 28), (130, 55), (385, 60))
-    DISTANCE_POSITION_X = 450
-    NAME_POSITION_X = 85
-    ROW_POSITION_Y = 17
-    RANK_POSITION_X = 15
-
-    def __init__(self):
+
+    # Personal card: a strip cut from the top of the plain background
+    CARD_SIZE = (640, 340)
+    CARD_RANK_FONT_SIZE = 56
+    CARD_NAME_FONT_SIZE = 34
+    CARD_LABEL_FONT_SIZE = 22
+
+    # Circular renderings of the default avatars by URL and size, shared
+    # by every athlete without a photo
+    _default_avatars: ClassVar[dict[tuple[str, int], Image.Image]] = {}
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession | None = None,
+        avatar_bytes: dict[str, bytes] | None = None,
+        theme: PosterTheme | None = None,
+    ):
         self.logger = config.logger
-        self.session = None
-        self.font_utils = FontManager()
+        self.session = session
+        # A session passed in belongs to the caller and is not closed here
+        self._owns_session = session is None
+        # Theme used when generate_poster() is not given one
+        self.theme = theme or get_registry().get(DEFAULT_THEME.name)
         self.method_calls = 0
+        # Raw avatar bytes by URL (filled on download or from a snapshot)
+        self.avatar_bytes: dict[str, bytes] = (
+            avatar_bytes if avatar_bytes is not None else {}
+        )
+        # In offline mode avatars are taken only from avatar_bytes
+        self.offline = False
+        # Drop avatar bytes once their poster is done (bounded memory)
+        self.release_avatars = False
+        # Avatar downloads started ahead of rendering
+        self._prefetch: dict[str, asyncio.Future] = {}
+        # Monotonic time after which no avatar is downloaded any more
+        self.deadline: float | None = None
+        # Degraded renderings by kind, for the run report
+        self.fallbacks: Counter = Counter()
 
     async def __aenter__(self):
         return self
@@ -46,28 +83,123 @@ class AthleteRankPosterGenerator:
 
     async def close(self):
         """Closing the client session when shutting down."""
-        await self.session.close()
+        for pending in self._prefetch.values():
+            pending.cancel()
+        self._prefetch.clear()
+        if self.session is not None and self._owns_session:
+            await self.session.close()
+
+    def open_session(self) -> aiohttp.ClientSession:
+        """Open the HTTP session ahead of the first download."""
+        return self._get_session()
+
+    @property
+    def pending_prefetches(self) -> list[str]:
+        """URLs of the avatar downloads still in progress."""
+        return [url for url, task in self._prefetch.items() if not task.done()]
+
+    async def finish_prefetches(self) -> int:
+        """Wait for the avatar downloads started ahead, return their count."""
+        pending = list(self._prefetch.values())
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
 
     def _get_session(self):
         if self.session is None:
             ssl_context = ssl.create_default_context(cafile=certifi.where())
             connector = aiohttp.TCPConnector(ssl=ssl_context)
-            self.session = aiohttp.ClientSession(connector=connector)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=config.env.float("HTTP_TIMEOUT", 10)
+                ),
+            )
         return self.session
 
-    async def _load_user_avatar(self, avatar_url: str) -> Image.Image | None:
+    async def _load_user_avatar(
+        self, avatar_url: str, size: int | None = None
+    ) -> Image.Image | None:
         if not avatar_url:
             return Image.new("RGBA", (256, 256), (180, 180, 180, 255))
 
+        image_bytes = await self._fetch_avatar_bytes(avatar_url)
+        if image_bytes is None:
+            return None
+        return decode_avatar(image_bytes, size)
+
+    def _avatar_url(self, athlete: dict, size: int) -> str:
+        """Pick the avatar variant to use for the target size.
+
+        A variant that is already downloaded or on its way is preferred,
+        otherwise the smallest one that covers the size.
+        """
+        candidates = avatar_candidates(athlete, size)
+        for url in candidates:
+            if url in self.avatar_bytes or url in self._prefetch:
+                return url
+        return candidates[0] if candidates else ""
+
+    def avatar_urls(
+        self, athlete: dict, theme: PosterTheme, card: bool = False
+    ) -> list[str]:
+        """Avatar URLs a poster row (or the card) of the athlete needs."""
+        if is_default_avatar(athlete.get("avatar_medium")):
+            urls = [athlete.get("avatar_medium") or ""]
+        elif card:
+            urls = [self._avatar_url(athlete, theme.avatar_large_size)]
+        else:
+            urls = [self._avatar_url(athlete, theme.avatar_small_size)]
+            if int(athlete["rank"]) in range(1, 4):
+                urls.append(
+                    self._avatar_url(athlete, theme.avatar_large_size)
+                )
+        return urls
+
+    def prefetch_avatars(
+        self,
+        athletes,
+        theme: PosterTheme | None = None,
+        card: bool = False,
+    ):
+        """Start downloading the avatars of athletes in the background."""
+        if self.offline:
+            return
+        theme = theme or self.theme
+        for url in {
+            url
+            for athlete in athletes
+            for url in self.avatar_urls(athlete, theme, card)
+        }:
+            if url and url not in self.avatar_bytes:
+                if url not in self._prefetch:
+                    self._prefetch[url] = asyncio.ensure_future(
+                        self._download_avatar(url)
+                    )
+
+    async def _fetch_avatar_bytes(self, avatar_url: str) -> bytes | None:
+        """Get avatar bytes from the cache or download them."""
+        if avatar_url in self.avatar_bytes:
+            return self.avatar_bytes[avatar_url]
+        pending = self._prefetch.pop(avatar_url, None)
+        if pending is not None:
+            return await pending
+        if self.offline:
+            self.logger.warning("Avatar is missing offline: %s", avatar_url)
+            return None
+        return await self._download_avatar(avatar_url)
+
+    async def _download_avatar(self, avatar_url: str) -> bytes | None:
         try:
             async with self._get_session().get(avatar_url) as response:
                 response.raise_for_status()  # Checking for successful response status
                 image_bytes = await response.read()
-                return Image.open(BytesIO(image_bytes))
-        except aiohttp.ClientError as e:
-            self.logger.error("Error loading avatar: %s", e)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error("Error loading avatar %s: %r", avatar_url, e)
             return None
 
+        self.avatar_bytes[avatar_url] = image_bytes
+        return image_bytes
+
     async def _make_circular_avatar(
         self,
         avatar_url: str,
@@ -75,18 +207,24 @@ class AthleteRankPosterGenerator:
         border_width: int = 1,
         size=None,
     ) -> Image.Image:
-        source_img = await self._load_user_avatar(avatar_url)
-        empty_avatar = Image.new("RGBA", (60, 60), (255, 255, 255, 0))
+        source_img = await self._load_user_avatar(avatar_url, size)
 
         if source_img is not None:
-            avatar = source_img.resize((size, size)) if size else source_img
-            size = min(avatar.size)
-            mask = Image.new("L", (size, size), 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0, size, size), fill=255)
+            # Release the decoded source and every intermediate image
+            # as soon as it is no longer needed
+            with source_img:
+                resized = (
+                    source_img.resize((size, size))
+                    if size
+                    else source_img.copy()
+                )
+            size = min(resized.size)
+            with resized:
+                avatar = resized.crop((0, 0, size, size))
 
-            avatar = avatar.crop((0, 0, size, size))
-            avatar.putalpha(mask)
+            with Image.new("L", (size, size), 0) as mask:
+                ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+                avatar.putalpha(mask)
 
             draw = ImageDraw.Draw(avatar)
             try:
@@ -96,44 +234,110 @@ class AthleteRankPosterGenerator:
                     width=border_width,
                 )
             except TypeError:
-                return empty_avatar  # Return a transparent image on error
+                avatar.close()
+                # Return a transparent image on error
+                return Image.new("RGBA", (60, 60), (255, 255, 255, 0))
 
             return avatar
         self.logger.error("Image not found: url=%s incorrect", avatar_url)
-        return empty_avatar  # Return a transparent image on error
+        # Return a transparent image on error
+        return Image.new("RGBA", (60, 60), (255, 255, 255, 0))
+
+    @property
+    def overdue(self) -> bool:
+        """Whether the render budget is used up."""
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def _has_cached_avatar(self, athlete: dict) -> bool:
+        return any(
+            url in self.avatar_bytes for url in avatar_candidates(athlete, 0)
+        )
 
-    def _add_logos_and_icons(self, image: Image.Image) -> None:
-        logo = Image.open(self.LOGO_PATH)
-        strava = Image.open(self.STRAVA_PATH)
-        cup = Image.open(self.CUP_PATH)
+    async def _overdue_avatar(self, athlete: dict, size: int) -> Image.Image:
+        """Avatar without downloading: any cached variant or a placeholder."""
+        candidates = avatar_candidates(athlete, size)
+        for url in candidates:
+            if url in self.avatar_bytes:
+                if url != candidates[0]:
+                    self.fallbacks["avatar_other_variant"] += 1
+                return await self._make_circular_avatar(url, size=size)
+        self.fallbacks["avatar_placeholder"] += 1
+        return await self._make_circular_avatar("", size=size)
+
+    async def _athlete_avatar(self, athlete: dict, size: int) -> Image.Image:
+        """Circular avatar of an athlete at the target size."""
+        avatar_url = athlete.get("avatar_medium") or ""
+        if self.overdue and not (
+            is_default_avatar(avatar_url)
+            and (avatar_url, size) in self._default_avatars
+        ):
+            return await self._overdue_avatar(athlete, size)
+        if not is_default_avatar(avatar_url):
+            return await self._make_circular_avatar(
+                avatar_url=self._avatar_url(athlete, size), size=size
+            )
 
-        image.paste(cup, (130, 150), cup)
-        image.paste(logo, (5, 5), logo)
-        image.paste(strava, (538, 0), strava)
+        # The placeholder is the same for everyone: render it once
+        key = (avatar_url, size)
+        avatar = self._default_avatars.get(key)
+        if avatar is None:
+            avatar = await self._make_circular_avatar(
+                avatar_url=avatar_url, size=size
+            )
+            if avatar_url and avatar_url not in self.avatar_bytes:
+                return avatar  # Not downloaded, try again next time
+            self._default_avatars[key] = avatar
+        return avatar.copy()
+
+    def _add_logos_and_icons(
+        self, image: Image.Image, theme: PosterTheme
+    ) -> None:
+        for path, position in (
+            (self.CUP_PATH, (130, 150)),
+            (self.LOGO_PATH, (5, 5)),
+            (self.STRAVA_PATH, (538, 0)),
+        ):
+            with Image.open(path) as icon:
+                image.paste(icon, position, icon)
 
         # Add text
-        Pilmoji(image).text((538, 240), "🔟\n🔝", font=self.font_utils.font)
+        font_utils = FontManager(theme.font_path, theme.font_size)
+        Pilmoji(image, source=LocalEmojiSource(theme.font_size)).text(
+            (538, 240), "🔟\n🔝", font=font_utils.font
+        )
 
+    @profiled_stage("generate_poster")
     async def generate_poster(
-        self, athletes: list[dict], head_icons: bool = False
+        self,
+        athletes: list[dict],
+        head_icons: bool = False,
+        theme: PosterTheme | None = None,
     ) -> Image.Image:
         """
         Generate a poster image with athlete information.
+
+        All the look and geometry comes from the theme, nothing is kept
+        on the generator, so renders with different themes may overlap.
         """
+        theme = theme or self.theme
+        font_utils = FontManager(theme.font_path, theme.font_size)
+        font = font_utils.font
 
         self.method_calls += 1
         self.logger.info(
             "Generation of poster #%s has begun...", self.method_calls
         )
         if not head_icons:
-            shift = 50
-            poster = Image.open(self.BACKGROUND_2_IMAGE_PATH)
+            shift = theme.first_row_y
+            poster = load_background(theme.background_2).copy()
         else:
-            shift = self.HEAD_ICONS_POSITION_Y
-            poster = Image.open(self.BACKGROUND_IMAGE_PATH)
-            # self._add_logos_and_icons(poster)
+            shift = theme.head_icons_position_y
+            poster = load_background(theme.background).copy()
+            # self._add_logos_and_icons(poster, theme)
 
-        emoji_text = Pilmoji(poster)
+        emoji_text = EmojiTextDrawer(
+            poster, LocalEmojiSource(size=theme.font_size)
+        )
 
         for athlete in athletes:
             rank = athlete["rank"]
@@ -142,54 +346,134 @@ class AthleteRankPosterGenerator:
                 long_name if len(long_name) <= 18 else f"{long_name[:16]}..."
             )
             distance = athlete["distance"]
-            avatar_url = athlete["avatar_large"]
-            avatar_small = await self._make_circular_avatar(
-                avatar_url=avatar_url,
-                size=self.AVATAR_SMALL_SIZE,
+            avatar_small = await self._athlete_avatar(
+                athlete, theme.avatar_small_size
             )
 
-            if head_icons and int(rank) in range(1, 4):
-                avatar_top_3 = await self._make_circular_avatar(
-                    avatar_url=avatar_url,
-                    size=self.AVATAR_LARGE_SIZE,
+            top_3 = head_icons and int(rank) in range(1, 4)
+            if top_3 and self.overdue and not self._has_cached_avatar(athlete):
+                # A late large avatar is left out rather than waited for
+                self.fallbacks["top3_avatar_skipped"] += 1
+            elif top_3:
+                avatar_top_3 = await self._athlete_avatar(
+                    athlete, theme.avatar_large_size
                 )
+                with avatar_top_3:
+                    poster.paste(
+                        avatar_top_3,
+                        theme.avatars_top3_positions[int(rank) - 1],
+                        avatar_top_3,
+                    )
+
+            with avatar_small:
                 poster.paste(
-                    avatar_top_3,
-                    self.AVATARS_TOP3_POSITIONS[int(rank) - 1],
-                    avatar_top_3,
+                    avatar_small,
+                    (theme.avatar_small_x, shift),
+                    avatar_small,
                 )
 
-            poster.paste(
-                avatar_small,
-                (self.AVATAR_SMALL_POSITION_X, shift),
-                avatar_small,
-            )
-
             # Drawing text on an image
-            # emoji_text.text(
-            #     (self.RANK_POSITION_X, self.ROW_POSITION_Y + shift),
-            #     text=f"{rank}.",
-            #     fill="#1b0f13",
-            #     font=self.font_utils.font,
-            # )
-
             emoji_text.text(
-                (self.NAME_POSITION_X, self.ROW_POSITION_Y + shift),
+                (theme.name_x, theme.row_text_y + shift),
                 text=f"{rank}. {name}",
-                fill="#1b0f13",
-                font=await self.font_utils.set_font(
+                fill=theme.text_color,
+                font=await font_utils.set_font(
                     re.search(r"\w", name).group(0)
                 ),
             )
 
-            emoji_text.text(
-                (self.DISTANCE_POSITION_X, self.ROW_POSITION_Y + shift),
-                text=f"🔸 {distance}",
-                fill="#1b0f13",
-                font=self.font_utils.font,
+            emoji_text.emoji_prefixed_text(
+                (theme.distance_x, theme.row_text_y + shift),
+                emoji="🔸",
+                text=distance,
+                fill=theme.text_color,
+                font=font,
             )
 
-            shift += 59
+            shift += theme.row_height
+
+        if self.release_avatars:
+            for athlete in athletes:
+                for url in avatar_candidates(athlete, 0):
+                    self.avatar_bytes.pop(url, None)
 
         self.logger.info("Poster #%s is complete.", self.method_calls)
         return poster
+
+    @profiled_stage("generate_card")
+    async def generate_card(
+        self,
+        athlete: dict,
+        theme: PosterTheme | None = None,
+        label: str = "",
+    ) -> Image.Image:
+        """
+        Generate the personal card of an athlete: the large avatar, rank,
+        name and every leaderboard value of the week.
+
+        Texts are values and emoji only, so cards need no translation.
+        """
+        theme = theme or self.theme
+        width, height = self.CARD_SIZE
+        card = load_background(theme.background_2).crop((0, 0, width, height))
+        emoji_text = EmojiTextDrawer(
+            card, LocalEmojiSource(size=theme.font_size)
+        )
+        font = FontManager(theme.font_path, theme.font_size).font
+        margin = 24
+        text_x = margin * 2 + theme.avatar_large_size
+
+        avatar = await self._athlete_avatar(athlete, theme.avatar_large_size)
+        with avatar:
+            card.paste(avatar, (margin, margin), avatar)
+
+        emoji_text.text(
+            (text_x, margin - 4),
+            text=f"#{athlete['rank']}",
+            fill=theme.text_color,
+            font=FontManager(
+                theme.font_path, self.CARD_RANK_FONT_SIZE
+            ).font,
+        )
+        long_name = athlete["athlete_name"]
+        name = long_name if len(long_name) <= 24 else f"{long_name[:22]}..."
+        name_symbol = re.search(r"\w", name)
+        emoji_text.text(
+            (text_x, margin + 64),
+            text=name,
+            fill=theme.text_color,
+            font=await FontManager(
+                theme.font_path, self.CARD_NAME_FONT_SIZE
+            ).set_font(name_symbol.group(0) if name_symbol else " "),
+        )
+        if label:
+            emoji_text.draw.text(
+                (text_x, margin + 110),
+                label,
+                fill=theme.text_color,
+                font=FontManager(
+                    theme.font_path, self.CARD_LABEL_FONT_SIZE
+                ).font,
+            )
+
+        stats = (
+            ("🔸", "distance"),
+            ("🏃", "activities"),
+            ("📏", "longest"),
+            ("⛰", "elev_gain"),
+            ("⏱", "avg_pace"),
+        )
+        stats_y = margin * 2 + theme.avatar_large_size + 12
+        for i, (emoji, key) in enumerate(stats):
+            emoji_text.emoji_prefixed_text(
+                (margin + (i % 2) * width // 2, stats_y + (i // 2) * 50),
+                emoji=emoji,
+                text=str(athlete.get(key) or "—"),
+                fill=theme.text_color,
+                font=font,
+            )
+
+        if self.release_avatars:
+            for url in avatar_candidates(athlete, 0):
+                self.avatar_bytes.pop(url, None)
+        return card
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from io import BytesIO
+from typing import ClassVar
+
+import emoji as emoji_lib
+from PIL import Image, ImageDraw, ImageFont
+from pilmoji import Pilmoji
+from pilmoji.source import BaseSource
+
+import config
+from poster_maker.font_manager import font_codepoints
+
+
+class LocalEmojiSource(BaseSource):
+    """
+    Emoji images from the bundled resources, no network involved.
+
+    An emoji is looked up as images/emoji/<code points>.png (e.g. 1f538.png)
+    and otherwise drawn with the Symbola font. The rendered glyphs are kept
+    per emoji and size for the lifetime of the process.
+    """
+
+    EMOJI_DIR = config.BASE_DIR / "poster_maker/resources/images/emoji"
+    FALLBACK_FONT = (
+        config.BASE_DIR / "poster_maker/resources/fonts/Symbola-AjYx.ttf"
+    )
+    FALLBACK_COLOR = "#1b0f13"
+
+    _glyphs: ClassVar[dict[tuple[str, int], Image.Image | None]] = {}
+    _pngs: ClassVar[dict[tuple[str, int], bytes | None]] = {}
+
+    def __init__(self, size: int = 30):
+        self.size = size
+
+    @staticmethod
+    def _filename(emoji: str) -> str:
+        # The variation selector does not change the image
+        return "-".join(
+            f"{ord(char):x}" for char in emoji if char != "\ufe0f"
+        )
+
+    def _render(self, emoji: str) -> Image.Image | None:
+        image_path = self.EMOJI_DIR / f"{self._filename(emoji)}.png"
+        if image_path.is_file():
+            with Image.open(image_path) as image:
+                return image.convert("RGBA").resize(
+                    (self.size, self.size), Image.Resampling.LANCZOS
+                )
+
+        codepoints = font_codepoints(str(self.FALLBACK_FONT))
+        if any(ord(char) not in codepoints for char in emoji.strip("\ufe0f")):
+            return None
+
+        font = ImageFont.truetype(str(self.FALLBACK_FONT), size=self.size)
+        glyph = Image.new("RGBA", (self.size, self.size), (0, 0, 0, 0))
+        ImageDraw.Draw(glyph).text(
+            (self.size // 2, self.size // 2),
+            emoji,
+            font=font,
+            fill=self.FALLBACK_COLOR,
+            anchor="mm",
+        )
+        return glyph
+
+    def get_glyph(self, emoji: str) -> Image.Image | None:
+        """Get the emoji image at the source size (shared, do not modify)."""
+        key = (emoji, self.size)
+        if key not in self._glyphs:
+            self._glyphs[key] = self._render(emoji)
+        return self._glyphs[key]
+
+    def get_emoji(self, emoji: str, /) -> BytesIO | None:
+        key = (emoji, self.size)
+        if key not in self._pngs:
+            glyph = self.get_glyph(emoji)
+            if glyph is None:
+                self._pngs[key] = None
+            else:
+                stream = BytesIO()
+                glyph.save(stream, "PNG")
+                self._pngs[key] = stream.getvalue()
+        png = self._pngs[key]
+        return BytesIO(png) if png is not None else None
+
+    def get_discord_emoji(self, id: int, /) -> BytesIO | None:
+        return None
+
+
+class EmojiTextDrawer:
+    """Draw text on a poster, using Pilmoji only for text with emoji."""
+
+    def __init__(self, image: Image.Image, source: LocalEmojiSource):
+        self.image = image
+        self.source = source
+        self.draw = ImageDraw.Draw(image)
+        self._pilmoji = None
+
+    def text(self, xy, text: str, fill, font: ImageFont.FreeTypeFont):
+        """Draw a text that may contain emoji."""
+        if emoji_lib.emoji_count(text) == 0:
+            self.draw.text(xy, text, fill=fill, font=font)
+            return
+
+        if self._pilmoji is None:
+            self._pilmoji = Pilmoji(self.image, source=self.source)
+        self._pilmoji.text(xy, text, fill=fill, font=font)
+
+    def emoji_prefixed_text(
+        self, xy, emoji: str, text: str, fill, font: ImageFont.FreeTypeFont
+    ):
+        """Draw an emoji followed by an emoji-free text.
+
+        The emoji is pasted from the glyph cache instead of being parsed
+        out of the text on every row.
+        """
+        x, y = xy
+        glyph = self.source.get_glyph(emoji)
+        if glyph is None:
+            self.text(xy, f"{emoji} {text}", fill, font)
+            return
+
+        # Align the glyph with the top of the text, as Pilmoji does
+        top = font.getbbox(text)[1]
+        self.image.paste(glyph, (x, y + top), glyph)
+        x += glyph.width + round(font.getlength(" "))
+        self.draw.text((x, y), text, fill=fill, font=font)
@@ -1,4 +1,7 @@
+from __future__ import annotations
+
 import os
+from functools import lru_cache
 from pathlib import Path
 
 from PIL import ImageFont
@@ -7,6 +10,30 @@ from fontTools.ttLib import TTFont
 import config
 
 
+@lru_cache(maxsize=64)
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Font loaded once per file and size (read-only, safe to share)."""
+    return ImageFont.truetype(path, size=size)
+
+
+@lru_cache(maxsize=None)
+def font_codepoints(font_path: str) -> frozenset[int]:
+    """Code points covered by a font file, read once per file."""
+    ttf = TTFont(font_path, lazy=True)
+    return frozenset(ttf.getBestCmap() or {})
+
+
+@lru_cache(maxsize=4096)
+def font_path_for_symbol(symbol_unicode: int, default_font: str) -> str:
+    """The default font if it has the symbol, else the first font that does."""
+    if symbol_unicode in font_codepoints(default_font):
+        return default_font
+    for font in sorted(Path(FontManager.FONT_DIR).glob("*")):
+        if font.is_file() and symbol_unicode in font_codepoints(str(font)):
+            return str(font)
+    return default_font
+
+
 class FontManager:
     """A FontManager class for managing fonts."""
 
@@ -14,26 +41,19 @@ class FontManager:
     DEFAULT_FONT = os.path.join(FONT_DIR, "Ubuntu-Regular.ttf")
     FONT_SIZE = 30
 
+    def __init__(self, default_font=None, font_size: int | None = None):
+        if default_font is not None:
+            self.DEFAULT_FONT = str(default_font)
+        if font_size is not None:
+            self.FONT_SIZE = font_size
+
     async def set_font(self, symbol: str) -> ImageFont.FreeTypeFont:
         """Set the font_manager to a given symbol"""
-        symbol_unicode = ord(symbol)
-        ttf = TTFont(self.DEFAULT_FONT)
-
-        if self.is_symbol_in_font(symbol_unicode, ttf):
-            return ImageFont.truetype(self.DEFAULT_FONT, size=self.FONT_SIZE)
-
-        fonts = self.get_font_list()
-
-        for font in fonts:
-            ttf = TTFont(os.path.join(self.FONT_DIR, font))
-
-            if self.is_symbol_in_font(symbol_unicode, ttf):
-                return ImageFont.truetype(
-                    os.path.join(self.FONT_DIR, font),
-                    size=self.FONT_SIZE,
-                )
-
-        return ImageFont.truetype(self.DEFAULT_FONT, size=self.FONT_SIZE)
+        # The character maps are parsed once per font file, not per row
+        return load_font(
+            font_path_for_symbol(ord(symbol), str(self.DEFAULT_FONT)),
+            self.FONT_SIZE,
+        )
 
     @staticmethod
     def is_symbol_in_font(symbol_unicode: ord, font: TTFont) -> bool:
@@ -58,4 +78,4 @@ class FontManager:
     @property
     def font(self) -> ImageFont.FreeTypeFont:
         """Get the font_manager for text in the poster."""
-        return ImageFont.truetype(self.DEFAULT_FONT, size=self.FONT_SIZE)
+        return load_font(self.DEFAULT_FONT, self.FONT_SIZE)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from math import ceil
+from typing import NamedTuple
+
+import config
+from poster_maker.themes import PosterTheme
+from sender.album_sender import PosterAlbumSender
+
+# The first poster is the top 10 of the club
+FIRST_POSTER_ROWS = 10
+
+
+class PosterLayout(NamedTuple):
+    """How a leaderboard is split into posters."""
+
+    first_rows: int
+    rows: int
+    # Theme of the posters after the first one
+    theme: PosterTheme
+    posters: int
+    compact: bool = False
+    # Athletes of the leaderboard and how many of them get a row
+    athletes: int = 0
+    shown: int = 0
+
+    @property
+    def albums(self) -> int:
+        """Telegram albums needed to send the posters."""
+        return ceil(self.posters / PosterAlbumSender.ALBUM_SIZE)
+
+    @property
+    def dropped(self) -> int:
+        """Athletes left out of the posters."""
+        return self.athletes - self.shown
+
+
+def layout_for(
+    athletes: int,
+    theme: PosterTheme,
+    compact: bool = False,
+    max_posters: int | None = None,
+) -> PosterLayout:
+    """Layout with the rows per poster the theme geometry allows.
+
+    The last poster is made even when it is not full, unless that goes
+    over max_posters: then only full posters follow the first one and the
+    last few athletes are left out.
+    """
+    theme = theme.compact() if compact else theme
+    rows = theme.rows_per_poster
+    remainder = max(athletes - FIRST_POSTER_ROWS, 0)
+    posters = 1 + ceil(remainder / rows)
+    if max_posters is not None and posters > max_posters:
+        posters = 1 + remainder // rows
+        remainder -= remainder % rows
+    return PosterLayout(
+        first_rows=FIRST_POSTER_ROWS,
+        rows=rows,
+        theme=theme,
+        posters=posters,
+        compact=compact,
+        athletes=athletes,
+        shown=min(athletes, FIRST_POSTER_ROWS) + remainder,
+    )
+
+
+def plan_layout(
+    athletes: int, theme: PosterTheme, max_posters: int | None = None
+) -> PosterLayout:
+    """
+    Pick the pagination that needs the fewest albums and posters.
+
+    The regular row style is kept unless the compact one saves an album
+    or is needed to stay within max_posters, and never for a layout that
+    leaves out more athletes.
+    """
+    regular = layout_for(athletes, theme, max_posters=max_posters)
+    compact = layout_for(
+        athletes, theme, compact=True, max_posters=max_posters
+    )
+
+    def fits(layout: PosterLayout) -> bool:
+        return max_posters is None or layout.posters <= max_posters
+
+    if regular.dropped != compact.dropped:
+        layout = min(regular, compact, key=lambda item: item.dropped)
+    elif fits(regular) and regular.albums <= compact.albums:
+        layout = regular
+    elif fits(compact) or compact.posters < regular.posters:
+        layout = compact
+    else:
+        layout = regular
+
+    config.logger.info(
+        "Poster layout for %s athletes: %s posters of %s rows%s, "
+        "%s album(s), %s athletes left out",
+        athletes,
+        layout.posters,
+        layout.rows,
+        " (compact)" if layout.compact else "",
+        layout.albums,
+        layout.dropped,
+    )
+    return layout
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import config
+
+
+def _umask() -> int:
+    """The process umask (only readable by setting it)."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class PublishedDirectory:
+    """
+    A directory of posters that is replaced as a whole.
+
+    The directory is a symlink to the published version of the posters,
+    <name>.<run>. A run renders into a staging directory of its own next
+    to it and publishes by swapping the symlink with one rename, so
+    overlapping runs never clear or mix each other's posters and readers
+    see either the old posters or the new ones. Versions and abandoned
+    staging directories older than the retention are deleted on publish.
+
+    A real directory found at the path (from before versioning) is moved
+    aside to <name>.<run>-old by the first publish, and expires like any
+    other version.
+    """
+
+    def __init__(
+        self, path: Path | str, retention_hours: float | None = None
+    ):
+        self.path = Path(path)
+        self.retention_hours = (
+            config.env.float("RUN_DIR_RETENTION_HOURS", 24)
+            if retention_hours is None
+            else retention_hours
+        )
+        self.logger = config.logger
+
+    def current(self) -> Path | None:
+        """The published version, None if nothing was published yet."""
+        return self.path.resolve() if self.path.is_dir() else None
+
+    def stage(self) -> Path:
+        """Create a new, empty staging directory for a run."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        run = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-"
+        return Path(
+            tempfile.mkdtemp(
+                prefix=f".{self.path.name}.{run}",
+                suffix=".tmp",
+                dir=self.path.parent,
+            )
+        )
+
+    def publish(self, staging: Path) -> Path:
+        """Make the staging directory the published version."""
+        run = staging.name[len(self.path.name) + 2 : -len(".tmp")]
+        version = self.path.parent / f"{self.path.name}.{run}"
+        # mkdtemp() makes it private, the bot, live and HTTP API
+        # processes may run as other users
+        os.chmod(staging, 0o777 & ~_umask())
+        os.rename(staging, version)
+
+        link = self.path.parent / f".{self.path.name}.{run}.link"
+        os.symlink(version.name, link)
+        if self.path.is_dir() and not self.path.is_symlink():
+            old = self.path.parent / f"{self.path.name}.{run}-old"
+            os.rename(self.path, old)
+            self.logger.warning(
+                "Moved the posters directory %s from before versioning "
+                "to %s",
+                self.path,
+                old,
+            )
+        os.replace(link, self.path)
+        self.logger.info("Published posters %s", version)
+
+        self.clean_up()
+        return version
+
+    def discard(self, staging: Path) -> None:
+        """Delete the staging directory of a failed run."""
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def clean_up(self) -> None:
+        """Delete old versions and abandoned staging directories."""
+        current = self.current()
+        expired = time.time() - self.retention_hours * 3600
+        name = self.path.name
+        for entry in (
+            *self.path.parent.glob(f"{name}.*"),
+            *self.path.parent.glob(f".{name}.*"),
+        ):
+            if entry == current:
+                continue
+            try:
+                if entry.lstat().st_mtime >= expired:
+                    continue
+                if entry.is_symlink():
+                    # Left by a run that stopped while publishing
+                    entry.unlink()
+                else:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    self.logger.info("Deleted old posters %s", entry)
+            except FileNotFoundError:
+                # Published or deleted by another run meanwhile
+                continue
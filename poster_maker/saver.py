@@ -1,8 +1,11 @@
+from __future__ import annotations
+
 from pathlib import Path
 
 from PIL import Image
 
 import config
+from profiling import profiled_stage
 
 
 class PosterSaver:
@@ -10,10 +13,12 @@ class PosterSaver:
 
     OUTPUT_FOLDER = config.BASE_DIR / "out_posters"
 
-    def __init__(self):
+    def __init__(self, output_dir: Path | None = None):
         self.logger = config.logger
-        self.output_dir = Path(self.OUTPUT_FOLDER)
+        self.output_dir = Path(output_dir or self.OUTPUT_FOLDER)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
 
+    @profiled_stage("save_poster")
     async def save_poster(self, poster: Image.Image, filename: str):
         """Save the generated poster image to a file."""
         output_file = self.output_dir / filename
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image
+
+import config
+from poster_maker.font_manager import load_font
+
+RESOURCES_DIR = config.BASE_DIR / "poster_maker/resources"
+BACKGROUNDS_DIR = RESOURCES_DIR / "images/poster_bgrnd"
+
+Position = tuple[int, int]
+
+
+@dataclass(frozen=True)
+class PosterTheme:
+    """
+    Look and geometry of the posters.
+
+    Themes are immutable and passed to every render, so renders with
+    different themes can run side by side in one process.
+    """
+
+    name: str
+    background: Path
+    background_2: Path
+    avatars_top3_positions: tuple[Position, Position, Position]
+    font_path: Path = RESOURCES_DIR / "fonts/Ubuntu-Regular.ttf"
+    font_size: int = 30
+    text_color: str = "#1b0f13"
+    # Rows of the first poster start below the head icons
+    head_icons_position_y: int = 410
+    first_row_y: int = 50
+    row_height: int = 59
+    row_text_y: int = 17
+    avatar_small_size: int = 60
+    avatar_large_size: int = 124
+    avatar_small_x: int = 20
+    name_x: int = 85
+    distance_x: int = 450
+    # Free space below the last row of a poster
+    bottom_margin: int = 75
+    # Denser rows used when a big club would need too many posters
+    compact_row_height: int = 40
+    compact_row_text_y: int = 7
+    compact_avatar_size: int = 38
+    compact_font_size: int = 22
+
+    @property
+    def rows_per_poster(self) -> int:
+        """Rows that fit on a poster after the first one."""
+        height = load_background(self.background_2).height
+        return (height - self.first_row_y - self.bottom_margin) // (
+            self.row_height
+        )
+
+    def compact(self) -> PosterTheme:
+        """The same theme with the compact row style."""
+        return replace(
+            self,
+            name=f"{self.name}-compact",
+            row_height=self.compact_row_height,
+            row_text_y=self.compact_row_text_y,
+            avatar_small_size=self.compact_avatar_size,
+            font_size=self.compact_font_size,
+            name_x=self.avatar_small_x + self.compact_avatar_size + 7,
+        )
+
+    def preload(self) -> None:
+        """Decode the backgrounds and fonts ahead of the first render."""
+        load_background(self.background)
+        load_background(self.background_2)
+        for size in (self.font_size, self.compact_font_size):
+            load_font(str(self.font_path), size)
+
+    def validate(self) -> None:
+        """Check the resources and the geometry of the theme."""
+        for path in (self.background, self.background_2, self.font_path):
+            if not Path(path).is_file():
+                raise ValueError(f"Theme {self.name}: missing file {path}")
+        if len(self.avatars_top3_positions) != 3:
+            raise ValueError(
+                f"Theme {self.name}: three top-3 positions needed"
+            )
+        if self.row_height <= 0 or self.font_size <= 0:
+            raise ValueError(f"Theme {self.name}: invalid row geometry")
+        if self.compact_row_height <= 0 or self.compact_font_size <= 0:
+            raise ValueError(f"Theme {self.name}: invalid compact geometry")
+        # Decode once to make sure the images are usable
+        load_background(self.background)
+        load_background(self.background_2)
+
+
+@lru_cache(maxsize=None)
+def load_background(path: Path) -> Image.Image:
+    """Decoded background shared by all renders (copy before drawing)."""
+    with Image.open(path) as image:
+        image.load()
+        return image.copy()
+
+
+DEFAULT_THEME = PosterTheme(
+    name="default",
+    background=RESOURCES_DIR / "images/background.png",
+    background_2=RESOURCES_DIR / "images/background_2.png",
+    avatars_top3_positions=((258, 28), (130, 55), (385, 60)),
+)
+
+SEASON_THEMES = (
+    PosterTheme(
+        name="winter",
+        background=BACKGROUNDS_DIR / "winter.jpg",
+        background_2=BACKGROUNDS_DIR / "other_winter.jpg",
+        avatars_top3_positions=((263, 43), (130, 123), (400, 123)),
+    ),
+    PosterTheme(
+        name="spring",
+        background=BACKGROUNDS_DIR / "spring.jpg",
+        background_2=BACKGROUNDS_DIR / "other.jpg",
+        avatars_top3_positions=((253, 105), (80, 112), (425, 112)),
+    ),
+    PosterTheme(
+        name="summer",
+        background=BACKGROUNDS_DIR / "summer.jpg",
+        background_2=BACKGROUNDS_DIR / "other.jpg",
+        avatars_top3_positions=((265, 40), (130, 123), (400, 123)),
+    ),
+    PosterTheme(
+        name="autumn",
+        background=BACKGROUNDS_DIR / "autumn.jpg",
+        background_2=BACKGROUNDS_DIR / "other.jpg",
+        avatars_top3_positions=((263, 98), (85, 60), (450, 65)),
+    ),
+)
+
+# Season theme by month
+SEASON_MONTHS = {
+    "winter": (1, 2, 12),
+    "spring": (3, 4, 5),
+    "summer": (6, 7, 8),
+    "autumn": (9, 10, 11),
+}
+
+
+class ThemeRegistry:
+    """Validated poster themes by name."""
+
+    def __init__(self):
+        self._themes: dict[str, PosterTheme] = {}
+
+    def register(self, theme: PosterTheme) -> PosterTheme:
+        """Validate and add a theme."""
+        theme.validate()
+        self._themes[theme.name] = theme
+        return theme
+
+    def get(self, name: str) -> PosterTheme:
+        """Get a theme by name."""
+        try:
+            return self._themes[name]
+        except KeyError:
+            raise KeyError(f"Unknown poster theme: {name}") from None
+
+    def names(self) -> list[str]:
+        """Names of the registered themes."""
+        return list(self._themes)
+
+    def for_date(self, date: datetime) -> PosterTheme:
+        """Get the season theme for a date."""
+        for name, months in SEASON_MONTHS.items():
+            if date.month in months and name in self._themes:
+                return self._themes[name]
+        return self._themes[DEFAULT_THEME.name]
+
+
+@lru_cache(maxsize=1)
+def get_registry() -> ThemeRegistry:
+    """The registry of the built-in themes, loaded once per process."""
+    registry = ThemeRegistry()
+    for theme in (DEFAULT_THEME, *SEASON_THEMES):
+        registry.register(theme)
+    config.logger.info("Poster themes loaded: %s", registry.names())
+    return registry
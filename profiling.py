@@ -0,0 +1,203 @@
+"""
+Opt-in CPU and allocation profiling of pipeline stages.
+
+Stages are marked with @profiled_stage("name"). A stage is profiled only
+when its name is listed in the PROFILE_STAGES environment variable
+(comma-separated, or "all") at import time. Otherwise the decorator
+returns the function untouched, so a disabled profiler costs nothing.
+
+For every profiled call a sampling profiler records the stacks of the
+calling thread, and tracemalloc snapshots taken around the call are
+compared. The results go to profiles/<run id>/:
+
+    <stage>.folded     collapsed stacks (flamegraph.pl / speedscope)
+    <stage>.alloc.txt  top allocations of every call
+
+Run an entry point with profiling from the command line:
+
+    python profiling.py --stages generate_poster,save_poster main.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import inspect
+import os
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_ENV = "PROFILE_STAGES"
+PROFILES_DIR = Path(__file__).resolve().parent / "profiles"
+SAMPLE_INTERVAL = 0.005
+TOP_ALLOCATIONS = 25
+
+ENABLED_STAGES = frozenset(
+    stage.strip()
+    for stage in os.environ.get(PROFILE_ENV, "").split(",")
+    if stage.strip()
+)
+
+
+def is_enabled(stage: str) -> bool:
+    """Check whether a stage is profiled in this process."""
+    return stage in ENABLED_STAGES or "all" in ENABLED_STAGES
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, stacks: Counter):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = stacks
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({Path(code.co_filename).name}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileSession:
+    """Profiling results of one run, by stage."""
+
+    def __init__(self):
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.path = PROFILES_DIR / run_id
+        self.stacks: dict[str, Counter] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._tracing = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profile the calling thread while the block runs."""
+        with self._lock:
+            self.calls[name] += 1
+            call = self.calls[name]
+            stacks = self.stacks.setdefault(name, Counter())
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            self._tracing += 1
+
+        before = tracemalloc.take_snapshot()
+        sampler = StackSampler(threading.get_ident(), stacks)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            with self._lock:
+                self._tracing -= 1
+                if self._tracing == 0:
+                    tracemalloc.stop()
+                self._write(name, call, elapsed, before, after)
+
+    def _write(self, name, call, elapsed, before, after):
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with (self.path / f"{name}.folded").open("w") as f:
+            for stack, count in self.stacks[name].most_common():
+                f.write(f"{stack} {count}\n")
+
+        stats = after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+        with (self.path / f"{name}.alloc.txt").open("a") as f:
+            f.write(f"# {name} call {call}: {elapsed:.3f} s\n")
+            for stat in stats:
+                f.write(f"{stat}\n")
+            f.write("\n")
+
+
+_session: ProfileSession | None = None
+
+
+def get_session() -> ProfileSession:
+    """The profiling session of this process."""
+    global _session
+    if _session is None:
+        _session = ProfileSession()
+    return _session
+
+
+def profiled_stage(name: str):
+    """Profile the decorated function as the named stage when enabled."""
+
+    def decorator(func):
+        if not is_enabled(name):
+            return func
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with get_session().stage(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_session().stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run an entry point with stage profiling."
+    )
+    parser.add_argument(
+        "--stages",
+        default="all",
+        help="comma-separated stage names or 'all'",
+    )
+    parser.add_argument("script", help="entry point, e.g. main.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    # The stages are read when the decorated modules import this module
+    # (as "profiling", not "__main__"), so the switch is set before that
+    os.environ[PROFILE_ENV] = args.stages
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    import profiling
+
+    sys.argv = [args.script, *args.args]
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        if profiling._session is not None:
+            print(
+                f"Profiles written to {profiling._session.path}",
+                file=sys.stderr,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Durable queue of poster render jobs.
+
+A run submits one job per poster (athletes, theme, output file) to a
+SQLite queue. Worker processes claim the jobs, render and save the
+posters and report the results back:
+
+    python render_queue.py worker --processes 4
+
+Workers on other nodes need the project directory (the queue file and
+the output directories) on a volume they share. A claimed job is leased;
+if its worker dies, the job is claimed again after the lease, up to
+MAX_ATTEMPTS times. The coordinating run renders jobs of its own batch
+while it waits, so a batch also completes with no worker running.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import config
+from poster import PosterAthletesCollector
+from poster_maker.creator import AthleteRankPosterGenerator
+from poster_maker.saver import PosterSaver
+from poster_maker.themes import PosterTheme, get_registry
+
+QUEUE_FILE = config.BASE_DIR / "render_queue.sqlite3"
+# Seconds a worker may hold a job before it is given to another one
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+
+@dataclass
+class RenderJob:
+    """One poster to render, as stored in the queue."""
+
+    athletes: list[dict]
+    theme: str
+    compact: bool
+    head_icons: bool
+    output_dir: str
+    filename: str
+    # Wall-clock time after which no avatar is downloaded any more
+    avatar_deadline: float | None = None
+    id: int | None = None
+
+    def to_json(self) -> str:
+        payload = asdict(self)
+        del payload["id"]
+        return json.dumps(payload, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, job_id: int, payload: str) -> RenderJob:
+        return cls(**json.loads(payload), id=job_id)
+
+    def poster_theme(self) -> PosterTheme:
+        theme = get_registry().get(self.theme)
+        return theme.compact() if self.compact else theme
+
+
+class RenderQueue:
+    """Render jobs in a SQLite database shared by the processes."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_until REAL,
+            result TEXT,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+        CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch);
+    """
+
+    def __init__(
+        self,
+        path: Path | str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path = Path(
+            path or config.env.str("RENDER_QUEUE_FILE", "") or QUEUE_FILE
+        )
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.logger = config.logger
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call: safe from any thread or process, and an
+        # unfinished transaction is rolled back on close
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, batch: str, jobs: list[RenderJob]) -> list[int]:
+        """Queue the jobs of a batch, returning their ids."""
+        ids = []
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            for job in jobs:
+                cursor = db.execute(
+                    "INSERT INTO jobs (batch, payload) VALUES (?, ?)",
+                    (batch, job.to_json()),
+                )
+                job.id = cursor.lastrowid
+                ids.append(job.id)
+            db.execute("COMMIT")
+        return ids
+
+    def claim(self, worker: str, batch: str | None = None) -> RenderJob | None:
+        """Lease the oldest job that is queued or whose lease expired."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ? "
+                "WHERE status = 'running' AND lease_until < ? "
+                "AND attempts >= ?",
+                (
+                    f"lease expired after {self.max_attempts} attempts",
+                    now,
+                    self.max_attempts,
+                ),
+            )
+            row = db.execute(
+                "SELECT id, payload FROM jobs "
+                "WHERE (status = 'queued' "
+                "OR (status = 'running' AND lease_until < ?)) "
+                "AND (? IS NULL OR batch = ?) ORDER BY id LIMIT 1",
+                (now, batch, batch),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, "
+                    "attempts = attempts + 1, lease_until = ? WHERE id = ?",
+                    (worker, now + self.lease_seconds, row[0]),
+                )
+            db.execute("COMMIT")
+        return None if row is None else RenderJob.from_json(*row)
+
+    def complete(self, job_id: int, result: dict) -> None:
+        """Record the result of a job."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', result = ? "
+                "WHERE id = ? AND status = 'running'",
+                (json.dumps(result), job_id),
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        """Queue a failed job again, or fail it after its last attempt."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET error = ?, status = CASE "
+                "WHEN attempts < ? THEN 'queued' ELSE 'failed' END "
+                "WHERE id = ? AND status = 'running'",
+                (error, self.max_attempts, job_id),
+            )
+
+    def cancel(self, job_id: int, error: str) -> None:
+        """Fail a job without retrying it."""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ? WHERE id = ?",
+                (error, job_id),
+            )
+
+    def progress(self, batch: str) -> Counter:
+        """Jobs of a batch by status."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE batch = ? "
+                "GROUP BY status",
+                (batch,),
+            ).fetchall()
+        return Counter(dict(rows))
+
+    def results(self, batch: str) -> list[dict]:
+        """Status, result and error of the jobs of a batch, in order."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, status, attempts, result, error FROM jobs "
+                "WHERE batch = ? ORDER BY id",
+                (batch,),
+            ).fetchall()
+        return [
+            {
+                "id": job_id,
+                "status": status,
+                "attempts": attempts,
+                "result": json.loads(result) if result else None,
+                "error": error,
+            }
+            for job_id, status, attempts, result, error in rows
+        ]
+
+    def summary(self) -> list[tuple[str, str, int]]:
+        """Jobs of every batch by status."""
+        with self._connect() as db:
+            return db.execute(
+                "SELECT batch, status, COUNT(*) FROM jobs "
+                "GROUP BY batch, status ORDER BY batch"
+            ).fetchall()
+
+    def purge(self, batch: str) -> None:
+        """Delete the jobs of a batch."""
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+
+
+class RenderWorker:
+    """Claims render jobs and renders them one by one."""
+
+    def __init__(
+        self,
+        queue: RenderQueue,
+        name: str | None = None,
+        generator: AthleteRankPosterGenerator | None = None,
+        poll_interval: float = 0.5,
+    ):
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.generator = generator or AthleteRankPosterGenerator()
+        if generator is None:
+            # A long-lived worker keeps no avatars between posters
+            self.generator.release_avatars = True
+        self.poll_interval = poll_interval
+        self.logger = config.logger
+
+    async def render(self, job: RenderJob) -> dict:
+        """Render and save the poster of a job."""
+        self.generator.deadline = (
+            None
+            if job.avatar_deadline is None
+            else time.monotonic() + job.avatar_deadline - time.time()
+        )
+        fallbacks = Counter(self.generator.fallbacks)
+        poster = await self.generator.generate_poster(
+            job.athletes, job.head_icons, theme=job.poster_theme()
+        )
+        await PosterSaver(Path(job.output_dir)).save_poster(
+            poster, job.filename
+        )
+        return {
+            "file": job.filename,
+            "worker": self.name,
+            "fallbacks": dict(self.generator.fallbacks - fallbacks),
+        }
+
+    async def run_once(self, batch: str | None = None) -> bool:
+        """Render one job; False if there was none to claim."""
+        job = await asyncio.to_thread(self.queue.claim, self.name, batch)
+        if job is None:
+            return False
+        if not Path(job.output_dir).is_dir():
+            # The run gave up its batch
+            await asyncio.to_thread(
+                self.queue.cancel, job.id, "output directory removed"
+            )
+            return True
+        try:
+            result = await self.render(job)
+        except Exception as e:
+            self.logger.error("Render job %s failed: %s", job.id, e)
+            await asyncio.to_thread(self.queue.fail, job.id, repr(e))
+        else:
+            await asyncio.to_thread(self.queue.complete, job.id, result)
+        return True
+
+    async def run(self, exit_when_idle: bool = False) -> None:
+        """Work the queue until stopped (or until it is empty)."""
+        self.logger.info("Render worker %s started", self.name)
+        try:
+            while True:
+                if await self.run_once():
+                    continue
+                if exit_when_idle:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.generator.close()
+
+
+async def render_with_workers(
+    collector: PosterAthletesCollector,
+    queue: RenderQueue,
+    batch: str,
+    poll_interval: float = 0.2,
+) -> list[str]:
+    """Render the posters of a collector through the queue.
+
+    The coordinating process renders jobs of the batch too, with the
+    collector's generator and its prefetched avatars. Returns the file
+    names of the posters; raises RuntimeError if a job failed for good.
+    """
+    generator = collector.poster_generator
+    deadline = generator.deadline
+    staging = collector.start_output()
+    # Overlapping attempts of a run keep apart
+    batch = f"{batch}:{staging.name}"
+    jobs = [
+        RenderJob(
+            athletes=group,
+            theme=collector.theme.name,
+            compact=bool(num and collector.layout.compact),
+            head_icons=num == 0,
+            output_dir=str(staging),
+            filename=f"poster_{num + 1}.png",
+            avatar_deadline=(
+                None
+                if deadline is None
+                else time.time() + deadline - time.monotonic()
+            ),
+        )
+        for num, group in enumerate(collector.poster_groups())
+    ]
+    await asyncio.to_thread(queue.submit, batch, jobs)
+
+    worker = RenderWorker(queue, generator=generator)
+    done = -1
+    try:
+        while True:
+            rendered = await worker.run_once(batch)
+            progress = await asyncio.to_thread(queue.progress, batch)
+            if progress["done"] != done:
+                done = progress["done"]
+                config.logger.info(
+                    "Render batch %s: %s/%s posters done",
+                    batch,
+                    done,
+                    len(jobs),
+                )
+            if not progress["queued"] and not progress["running"]:
+                break
+            if not rendered:
+                await asyncio.sleep(poll_interval)
+    except BaseException:
+        await asyncio.to_thread(queue.purge, batch)
+        collector.discard_output()
+        raise
+    finally:
+        await generator.close()
+
+    results = await asyncio.to_thread(queue.results, batch)
+    await asyncio.to_thread(queue.purge, batch)
+    failed = [job for job in results if job["status"] != "done"]
+    if failed:
+        collector.discard_output()
+        raise RuntimeError(
+            f"Render batch {batch}: {len(failed)} jobs failed, "
+            f"first error: {failed[0]['error']}"
+        )
+    # Degraded renderings of every worker, for the run report
+    generator.fallbacks = Counter()
+    for job in results:
+        generator.fallbacks.update(job["result"]["fallbacks"])
+    workers = Counter(job["result"]["worker"] for job in results)
+    config.logger.info("Render batch %s by workers: %s", batch, dict(workers))
+    collector.publish_output()
+    return [job["result"]["file"] for job in results]
+
+
+def run_worker(exit_when_idle: bool = False) -> None:
+    """Entry point of a worker process."""
+    asyncio.run(RenderWorker(RenderQueue()).run(exit_when_idle))
+
+
+def parse_args() -> argparse.Namespace:
+    """Command line arguments."""
+    parser = argparse.ArgumentParser(description="Poster render queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="work the render queue")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument(
+        "--exit-when-idle",
+        action="store_true",
+        help="stop once no job is left to claim",
+    )
+    commands.add_parser("status", help="jobs in the queue by status")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "status":
+        for batch, status, count in RenderQueue().summary():
+            print(f"{batch:<24} {status:<8} {count}")
+    elif args.processes == 1:
+        run_worker(args.exit_when_idle)
+    else:
+        processes = [
+            multiprocessing.Process(
+                target=run_worker, args=(args.exit_when_idle,)
+            )
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
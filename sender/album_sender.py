@@ -1,4 +1,5 @@
 import os
+import re
 
 import config
 
@@ -9,6 +10,32 @@ class PosterAlbumSender:
     """
 
     IMAGE_PATH = config.BASE_DIR / "out_posters"
+    # Telegram accepts at most 10 photos in one media group
+    ALBUM_SIZE = 10
+
+    @staticmethod
+    def poster_order(filename: str) -> tuple:
+        """Sort key that puts poster_2.png before poster_10.png."""
+        return tuple(
+            int(part) if part.isdigit() else part
+            for part in re.split(r"(\d+)", filename)
+        )
+
+    @classmethod
+    def album_chunks(cls, items: list) -> list[list]:
+        """Split items into as few albums as possible, of even sizes.
+
+        Telegram rejects a media group of one photo, so 11 posters are
+        sent as 6 + 5 rather than 10 + 1.
+        """
+        albums = -(-len(items) // cls.ALBUM_SIZE)
+        size, extra = divmod(len(items), albums) if albums else (0, 0)
+        chunks, start = [], 0
+        for i in range(albums):
+            end = start + size + (i < extra)
+            chunks.append(items[start:end])
+            start = end
+        return chunks
 
     def get_image_files(self) -> list[str]:
         """Get a list the files in the IMAGE_PATH directory."""
@@ -19,4 +46,4 @@ class PosterAlbumSender:
             if file.lower().endswith(allowed_extensions)
         ]
 
-        return image_files
+        return sorted(image_files, key=self.poster_order)
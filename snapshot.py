@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import config
+
+
+class LeaderboardSnapshot:
+    """
+    A scraped leaderboard of a club for one week, stored on disk.
+
+    Layout of a snapshot directory::
+
+        snapshots/<club_id>_<YYYY-Www>/
+            snapshot.json   - leaderboard rows and the avatar index
+            page.html       - raw HTML of the leaderboard page
+            avatars/<sha1>  - avatar bytes as downloaded from the CDN
+    """
+
+    SNAPSHOTS_DIR = config.BASE_DIR / "snapshots"
+    FORMAT_VERSION = 1
+
+    def __init__(
+        self,
+        club_id: int | str,
+        week: str,
+        leaderboard: list[dict[str, str]],
+        page_html: str | None = None,
+        avatars: dict[str, bytes] | None = None,
+    ):
+        self.club_id = str(club_id)
+        self.week = week
+        self.leaderboard = leaderboard
+        self.page_html = page_html
+        self.avatars = avatars or {}
+
+    @classmethod
+    def for_last_week(cls, club_id: int | str, **kwargs) -> LeaderboardSnapshot:
+        """Create a snapshot keyed by the previous ISO week."""
+        week = config.iso_week_key(datetime.now() - timedelta(weeks=1))
+        return cls(club_id, week, **kwargs)
+
+    @property
+    def week_date(self) -> datetime:
+        """Monday of the snapshot week."""
+        return datetime.strptime(f"{self.week}-1", "%G-W%V-%u")
+
+    @property
+    def path(self) -> Path:
+        """Directory of the snapshot."""
+        return self.SNAPSHOTS_DIR / f"{self.club_id}_{self.week}"
+
+    @staticmethod
+    def _avatar_filename(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def save(self, path: Path | None = None) -> Path:
+        """Write the snapshot to disk and return its directory."""
+        path = Path(path or self.path)
+        avatars_dir = path / "avatars"
+        avatars_dir.mkdir(parents=True, exist_ok=True)
+
+        avatar_index = {}
+        for url, image_bytes in self.avatars.items():
+            filename = self._avatar_filename(url)
+            (avatars_dir / filename).write_bytes(image_bytes)
+            avatar_index[url] = filename
+
+        if self.page_html is not None:
+            (path / "page.html").write_text(self.page_html, encoding="utf-8")
+
+        manifest = {
+            "version": self.FORMAT_VERSION,
+            "club_id": self.club_id,
+            "week": self.week,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "leaderboard": self.leaderboard,
+            "avatars": avatar_index,
+        }
+        with (path / "snapshot.json").open("w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        config.logger.info(
+            "Snapshot of %s athletes saved to %s", len(self.leaderboard), path
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path | str) -> LeaderboardSnapshot:
+        """Read a snapshot from its directory."""
+        path = Path(path)
+        with (path / "snapshot.json").open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version: {manifest.get('version')}"
+            )
+
+        avatars = {
+            url: (path / "avatars" / filename).read_bytes()
+            for url, filename in manifest["avatars"].items()
+            if (path / "avatars" / filename).is_file()
+        }
+        page_file = path / "page.html"
+        page_html = (
+            page_file.read_text(encoding="utf-8")
+            if page_file.is_file()
+            else None
+        )
+
+        config.logger.info("Snapshot loaded from %s", path)
+        return cls(
+            manifest["club_id"],
+            manifest["week"],
+            manifest["leaderboard"],
+            page_html=page_html,
+            avatars=avatars,
+        )
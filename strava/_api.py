@@ -1,4 +1,17 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import ssl
+import time
+
+import aiohttp
+import certifi
 import requests
+import yarl
+
+import config
+from strava.exceptions import StravaApiException
 
 
 class InfoStravaClub:
@@ -33,3 +46,214 @@ class InfoStravaClub:
         """Get club info"""
         response = requests.get(self.club_url, headers=self.headers, timeout=5)
         return response.json()
+
+
+class StravaApiClient:
+    """
+    Async client of the Strava API for club data.
+
+    The access token is cached until shortly before it expires, and only
+    one refresh runs at a time however many requests are waiting for it.
+    All requests go through one pooled session, and a GET answered
+    before is made conditional on its ETag, reusing the cached body on
+    HTTP 304.
+    """
+
+    API_URL = "https://www.strava.com/api/v3"
+    AUTH_URL = "https://www.strava.com/oauth/token"
+    PER_PAGE = 200
+    # Refresh the token this many seconds before it expires
+    TOKEN_LEEWAY = 60
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        refresh_token: str,
+        session: aiohttp.ClientSession | None = None,
+        api_url: str | None = None,
+        auth_url: str | None = None,
+        max_concurrency: int = 5,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.api_url = (api_url or self.API_URL).rstrip("/")
+        self.auth_url = auth_url or self.AUTH_URL
+        self.logger = config.logger
+        self.session = session
+        self._owns_session = session is None
+        self._access_token: str | None = None
+        self._expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self._requests_limit = asyncio.Semaphore(max_concurrency)
+        # ETag and body of the last answer by request URL
+        self._etags: dict[str, tuple[str, object]] = {}
+        self.token_refreshes = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_env(cls, **kwargs) -> StravaApiClient:
+        """Create a client from the STRAVA_* environment variables."""
+        return cls(
+            config.env.str("STRAVA_CLIENT_ID"),
+            config.env.str("STRAVA_CLIENT_SECRET"),
+            config.env.str("STRAVA_REFRESH_TOKEN"),
+            api_url=config.env.str("STRAVA_API_URL", None),
+            auth_url=config.env.str("STRAVA_AUTH_URL", None),
+            **kwargs,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Close the session if the client created it."""
+        if self.session is not None and self._owns_session:
+            await self.session.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            connector = aiohttp.TCPConnector(ssl=ssl_context, limit=20)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self.session
+
+    def _token_is_valid(self) -> bool:
+        return (
+            self._access_token is not None
+            and time.time() < self._expires_at - self.TOKEN_LEEWAY
+        )
+
+    async def get_access_token(self) -> str:
+        """Get a cached access token, refreshing it when it expires."""
+        if self._token_is_valid():
+            return self._access_token
+
+        async with self._token_lock:
+            # Another caller may have refreshed it while we were waiting
+            if not self._token_is_valid():
+                await self._refresh_access_token()
+        return self._access_token
+
+    async def _refresh_access_token(self) -> None:
+        payload = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "refresh_token": self.refresh_token,
+            "grant_type": "refresh_token",
+        }
+        async with self._get_session().post(
+            self.auth_url, data=payload
+        ) as response:
+            if response.status != 200:
+                raise StravaApiException(
+                    f"Token refresh failed: HTTP {response.status}"
+                )
+            data = await response.json()
+
+        self._access_token = data["access_token"]
+        self._expires_at = float(
+            data.get("expires_at", time.time() + data.get("expires_in", 0))
+        )
+        # Strava may rotate the refresh token
+        self.refresh_token = data.get("refresh_token", self.refresh_token)
+        self.token_refreshes += 1
+        self.logger.info("Strava access token refreshed")
+
+    async def _get(self, path: str, params: dict | None = None):
+        """GET an API path, refreshing the token once on HTTP 401."""
+        url = str(yarl.URL(f"{self.api_url}{path}").with_query(params or {}))
+        for attempt in range(2):
+            token = await self.get_access_token()
+            headers = {"Authorization": f"Bearer {token}"}
+            cached = self._etags.get(url)
+            if cached is not None:
+                headers["If-None-Match"] = cached[0]
+            async with self._requests_limit:
+                async with self._get_session().get(
+                    url, headers=headers
+                ) as response:
+                    if response.status == 401 and attempt == 0:
+                        # Unless a concurrent request has refreshed it
+                        if self._access_token == token:
+                            self._access_token = None
+                        continue
+                    if response.status == 304 and cached is not None:
+                        self.not_modified += 1
+                        return cached[1]
+                    if response.status != 200:
+                        raise StravaApiException(
+                            f"GET {path} failed: HTTP {response.status}"
+                        )
+                    data = await response.json()
+                    if response.headers.get("ETag"):
+                        self._etags[url] = (response.headers["ETag"], data)
+                    return data
+        raise StravaApiException(f"GET {path} failed: unauthorized")
+
+    async def get_club_info(self, club_id: int | str) -> dict:
+        """Get club info"""
+        return await self._get(f"/clubs/{club_id}")
+
+    async def get_club_members_page(
+        self, club_id: int | str, page: int
+    ) -> list[dict]:
+        """Get one page of club members."""
+        return await self._get(
+            f"/clubs/{club_id}/members",
+            params={"page": page, "per_page": self.PER_PAGE},
+        )
+
+    async def get_club_with_members(
+        self, club_id: int | str
+    ) -> tuple[dict, list[dict]]:
+        """
+        Get club info and all its members.
+
+        The info and the first page are requested together, the remaining
+        pages concurrently once the member count is known.
+        """
+        info, first_page = await asyncio.gather(
+            self.get_club_info(club_id),
+            self.get_club_members_page(club_id, 1),
+        )
+        members = list(first_page)
+
+        if len(first_page) == self.PER_PAGE:
+            pages = max(
+                math.ceil(info.get("member_count", 0) / self.PER_PAGE), 1
+            )
+            for page_members in await asyncio.gather(
+                *(
+                    self.get_club_members_page(club_id, page)
+                    for page in range(2, pages + 1)
+                )
+            ):
+                members.extend(page_members)
+
+            # The member count may lag behind, keep going while pages are full
+            page = pages
+            while len(members) == page * self.PER_PAGE:
+                page += 1
+                members.extend(
+                    await self.get_club_members_page(club_id, page)
+                )
+
+        self.logger.info(
+            "Received %s members of club %s from the API",
+            len(members),
+            club_id,
+        )
+        return info, members
+
+    async def get_club_members(self, club_id: int | str) -> list[dict]:
+        """Get all members of the club."""
+        _, members = await self.get_club_with_members(club_id)
+        return members
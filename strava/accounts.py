@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import config
+from strava.exceptions import AccountPoolExhaustedException
+
+# Scrapes an account may start per hour
+SCRAPES_PER_HOUR = 6
+# Seconds an account rests after a failed sign-in
+AUTH_COOLDOWN = 1800
+
+
+class StravaAccount:
+    """A Strava account of the pool and its recent use."""
+
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        scrapes_per_hour: int = SCRAPES_PER_HOUR,
+    ):
+        self.email = email
+        self.password = password
+        self.scrapes_per_hour = scrapes_per_hour
+        self.active = 0
+        # Start times of the scrapes of the last hour
+        self.started: deque[float] = deque()
+        # Start time of the scrape in progress in this process
+        self.acquired_at = 0.0
+        self.failures = 0
+        self.resting_until = 0.0
+
+    def __repr__(self) -> str:
+        return f"StravaAccount({self.email!r})"
+
+    def recent_scrapes(self, now: float) -> int:
+        """Scrapes started within the last hour."""
+        while self.started and self.started[0] <= now - 3600:
+            self.started.popleft()
+        return len(self.started)
+
+    def is_available(self, now: float) -> bool:
+        """Healthy, idle and within its rate budget."""
+        return (
+            not self.active
+            and self.resting_until <= now
+            and self.recent_scrapes(now) < self.scrapes_per_hour
+        )
+
+    def load(self, now: float) -> float:
+        """Share of the hourly budget already used."""
+        return self.recent_scrapes(now) / self.scrapes_per_hour
+
+
+class AccountPool:
+    """
+    Strava accounts that scrape jobs are spread over.
+
+    A job gets the least-loaded account that is not scraping, is within
+    its hourly budget and has not failed to sign in recently; one account
+    runs one browser at a time. If no account is available, the job waits
+    for one. Every account keeps its own cookie jar and Chrome profile.
+
+    With a usage file the hourly budgets and rests are shared by all the
+    processes using it (the scheduler, a standalone bot), under a lock
+    of the file. Which accounts are scraping is known per process only.
+    """
+
+    # Usage shared by the processes of the pool from the environment
+    USAGE_FILE = config.BASE_DIR / "account_usage.json"
+
+    def __init__(
+        self, accounts: list[StravaAccount], usage_file: Path | None = None
+    ):
+        if not accounts:
+            raise ValueError("The account pool needs at least one account")
+        self.accounts = accounts
+        self.usage_file = usage_file
+        self.logger = config.logger
+        self._available = threading.Condition()
+
+    @classmethod
+    def from_env(cls) -> AccountPool:
+        """
+        Accounts of STRAVA_ACCOUNTS, a JSON list of objects with email,
+        password and optionally scrapes_per_hour, or EMAIL and PASSWD.
+        """
+        per_hour = config.env.int("SCRAPES_PER_HOUR", SCRAPES_PER_HOUR)
+        accounts = [
+            StravaAccount(
+                account["email"],
+                account["password"],
+                account.get("scrapes_per_hour", per_hour),
+            )
+            for account in json.loads(
+                config.env.str("STRAVA_ACCOUNTS", "") or "[]"
+            )
+        ] or [
+            StravaAccount(
+                config.env.str("EMAIL"), config.env.str("PASSWD"), per_hour
+            )
+        ]
+        for account in accounts:
+            if account.scrapes_per_hour < 1:
+                raise ValueError(
+                    f"Account {account.email}: scrapes_per_hour "
+                    f"(SCRAPES_PER_HOUR) must be at least 1, "
+                    f"got {account.scrapes_per_hour}"
+                )
+        return cls(accounts, cls.USAGE_FILE)
+
+    @contextmanager
+    def _shared_usage(self, save: bool = False):
+        """Take the use of the accounts by other processes into account.
+
+        Holds the lock of the usage file for the block, with the accounts
+        read from it; with save their use is written back at the end.
+        Called with self._available held.
+        """
+        if self.usage_file is None:
+            yield
+            return
+        self.usage_file.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.usage_file.with_name(self.usage_file.name + ".lock")
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                usage = self._read_usage()
+                for account in self.accounts:
+                    if account.email in usage:
+                        shared = usage[account.email]
+                        account.started = deque(shared["started"])
+                        account.resting_until = shared["resting_until"]
+                        account.failures = shared["failures"]
+                yield
+                if save:
+                    self._write_usage(usage)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_usage(self) -> dict:
+        if not self.usage_file.is_file():
+            return {}
+        with self.usage_file.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_usage(self, usage: dict) -> None:
+        now = time.time()
+        for account in self.accounts:
+            usage[account.email] = {
+                "started": [
+                    started
+                    for started in account.started
+                    if started > now - 3600
+                ],
+                "resting_until": account.resting_until,
+                "failures": account.failures,
+            }
+        tmp_path = self.usage_file.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(usage, f, indent=2)
+        os.replace(tmp_path, self.usage_file)
+
+    def _next_available(self, now: float) -> float:
+        """Seconds until a busy account may be available again."""
+        waits = [
+            max(account.resting_until - now, 0)
+            if account.resting_until > now
+            else account.started[0] + 3600 - now
+            for account in self.accounts
+            if not account.active and not account.is_available(now)
+        ]
+        return max(min(waits, default=60), 0.1)
+
+    def acquire(self, timeout: float | None = None) -> StravaAccount:
+        """Take the least-loaded available account, waiting for one.
+
+        Raises AccountPoolExhaustedException after the timeout.
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        with self._available:
+            while True:
+                now = time.time()
+                with self._shared_usage(save=True):
+                    available = [
+                        account
+                        for account in self.accounts
+                        if account.is_available(now)
+                    ]
+                    if available:
+                        account = min(available, key=lambda a: a.load(now))
+                        account.active += 1
+                        account.started.append(now)
+                        account.acquired_at = now
+                if available:
+                    self.logger.info("Scraping as %s", account.email)
+                    return account
+
+                wait = self._next_available(now)
+                if give_up is not None:
+                    if time.monotonic() >= give_up:
+                        raise AccountPoolExhaustedException(
+                            "No Strava account available: all are busy, "
+                            "over their budget or resting"
+                        )
+                    wait = min(wait, give_up - time.monotonic())
+                self._available.wait(wait)
+
+    def release(
+        self,
+        account: StravaAccount,
+        auth_failed: bool = False,
+        unused: bool = False,
+    ):
+        """Return an account; a failed sign-in lets it rest.
+
+        An unused account (its scrape never started) gets back the
+        budget its acquire() took.
+        """
+        with self._available, self._shared_usage(save=True):
+            account.active -= 1
+            if unused and account.acquired_at in account.started:
+                account.started.remove(account.acquired_at)
+            if auth_failed:
+                account.failures += 1
+                # Consecutive failures rest the account longer
+                account.resting_until = time.time() + AUTH_COOLDOWN * (
+                    2 ** min(account.failures - 1, 4)
+                )
+                self.logger.warning(
+                    "Account %s failed to sign in, resting it", account.email
+                )
+            else:
+                account.failures = 0
+            self._available.notify_all()
+
+    @contextmanager
+    def lease(self, timeout: float | None = None):
+        """Hold an account for the duration of a scrape.
+
+        The body reports a failed sign-in by setting
+        lease.auth_failed = True on the yielded lease, and a scrape it did
+        not start with lease.unused = True.
+        """
+        lease = AccountLease(self.acquire(timeout))
+        try:
+            yield lease
+        finally:
+            self.release(lease.account, lease.auth_failed, lease.unused)
+
+    def spare_scrapes(self) -> int:
+        """Scrapes the accounts not resting may still start this hour."""
+        now = time.time()
+        with self._available, self._shared_usage():
+            return sum(
+                max(account.scrapes_per_hour - account.recent_scrapes(now), 0)
+                for account in self.accounts
+                if account.resting_until <= now
+            )
+
+    def status(self) -> list[dict]:
+        """Use and health of every account."""
+        now = time.time()
+        with self._available, self._shared_usage():
+            return [
+                {
+                    "email": account.email,
+                    "active": account.active,
+                    "scrapes_last_hour": account.recent_scrapes(now),
+                    "scrapes_per_hour": account.scrapes_per_hour,
+                    "resting_for": max(
+                        round(account.resting_until - now), 0
+                    ),
+                }
+                for account in self.accounts
+            ]
+
+
+class AccountLease:
+    """An account taken from the pool for one scrape."""
+
+    def __init__(self, account: StravaAccount):
+        self.account = account
+        self.auth_failed = False
+        self.unused = False
+
+    @property
+    def email(self) -> str:
+        return self.account.email
+
+    @property
+    def password(self) -> str:
+        return self.account.password
+
+
+@lru_cache(maxsize=1)
+def get_account_pool() -> AccountPool:
+    """The account pool of the process, read from the environment once."""
+    return AccountPool.from_env()
@@ -11,6 +11,7 @@ import config
 from strava.cookie_manager import CookieManager
 from strava.exceptions import AuthorizationFailureException
 from strava.page_utils import StravaPageUtils
+from profiling import profiled_stage
 
 
 def pause(min_delay: float = 0.5, max_delay: float = 2.0) -> None:
@@ -161,27 +162,37 @@ class StravaAuthorization(StravaPageUtils):
         self.human_simulator = HumanInteractionSimulator(browser)
         self.logger = config.logger
 
+    @profiled_stage("authorization")
     def authorization(self) -> None:
         """
         Perform user authentication with cookie management.
 
-        First tries to use saved cookies, falls back to username/password if needed.
+        A browser profile that is still signed in needs nothing. Otherwise
+        tries to use saved cookies, falls back to username/password if needed.
 
         Raises:
             AuthorizationFailureException: If authentication fails
         """
         self._open_page(f"{config.BASE_URL}/login")
-        cookies = self.cookie_manager.read_cookie()
-
-        if cookies and self._check_apply_cookies(cookies):
-            self.logger.info("Cookies have been successfully applied.")
-        else:
-            self.logger.warning(
-                "Invalid cookies! Authorization failed. "
-                "Authentication will be attempted using a login and password."
-            )
-            self.cookie_manager.remove_cookie()
-            self._login(self.email, self.password)
+        # A persistent profile that is still signed in is redirected away
+        if "/login" not in self.browser.current_url:
+            self.logger.info("Already signed in (browser profile).")
+            return
+
+        # Another process of the same account may be logging in: wait for
+        # it and use the cookies it saves
+        with self.cookie_manager.lock():
+            cookies = self.cookie_manager.read_cookie()
+
+            if cookies and self._check_apply_cookies(cookies):
+                self.logger.info("Cookies have been successfully applied.")
+            else:
+                self.logger.warning(
+                    "Invalid cookies! Authorization failed. "
+                    "Authentication will be attempted using a login and password."
+                )
+                self.cookie_manager.remove_cookie()
+                self._login(self.email, self.password)
 
     def _login(self, username: str, password: str) -> None:
         """
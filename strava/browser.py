@@ -1,20 +1,59 @@
+from __future__ import annotations
+
+import json
 import os
+from pathlib import Path
 
 from selenium_stealth import stealth
 from selenium import webdriver
 from selenium.common import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.driver_finder import DriverFinder
 
 import config
 
+PROFILES_DIR = config.BASE_DIR / "chrome_profiles"
+
 
 class BrowserManager:
     """A context manager for managing a Selenium web browser instance."""
 
-    def __init__(self):
-        self.options_arguments = config.option_arguments
+    # Driver and browser paths found by Selenium Manager
+    DRIVER_CACHE = PROFILES_DIR / "driver_paths.json"
+    _driver_paths: dict[str, str] | None = None
+
+    def __init__(
+        self, profile: str | None = None, use_driver_cache: bool = True
+    ):
+        self.remote = bool(os.environ.get("DRIVER_FROM_DOCKER", False))
+        if profile and self.remote:
+            # The profile path is on this host, not in the remote browser
+            config.logger.warning(
+                "Chrome profiles are not supported by the remote driver, "
+                "starting incognito"
+            )
+            profile = None
+        # With a profile Chrome keeps its cookies between runs, so the
+        # account stays logged in instead of starting incognito
+        self.profile_dir = self.profile_path(profile) if profile else None
+        self.options_arguments = [
+            argument
+            for argument in config.option_arguments
+            if not (self.profile_dir and argument == "--incognito")
+        ]
+        if self.profile_dir:
+            self.options_arguments.append(
+                f"--user-data-dir={self.profile_dir}"
+            )
+        self.use_driver_cache = use_driver_cache
         self.options = self._driver_options()
         self.browser = None
 
+    @staticmethod
+    def profile_path(account: str) -> Path:
+        """Chrome user data directory of a Strava account."""
+        return PROFILES_DIR / account.split("@")[0]
+
     def __enter__(self):
         self.start_browser()
         return self
@@ -37,16 +76,70 @@ class BrowserManager:
         for argument in self.options_arguments:
             options.add_argument(argument)
 
+    @classmethod
+    def _read_driver_cache(cls) -> dict[str, str] | None:
+        if cls._driver_paths is None and cls.DRIVER_CACHE.is_file():
+            try:
+                cls._driver_paths = json.loads(cls.DRIVER_CACHE.read_text())
+            except (OSError, ValueError):
+                cls._driver_paths = None
+        paths = cls._driver_paths
+        if paths and all(Path(path).is_file() for path in paths.values()):
+            return paths
+        return None
+
+    @classmethod
+    def clear_driver_cache(cls) -> None:
+        """Forget the cached paths (e.g. after a Chrome update)."""
+        cls._driver_paths = None
+        cls.DRIVER_CACHE.unlink(missing_ok=True)
+
+    def _driver_service(self) -> Service:
+        """Chrome service with the driver path resolved once and cached.
+
+        Selenium Manager is run only when nothing usable is cached.
+        """
+        paths = self._read_driver_cache() if self.use_driver_cache else None
+        if paths is None:
+            finder = DriverFinder(Service(), self.options)
+            paths = {
+                "driver_path": finder.get_driver_path(),
+                "browser_path": finder.get_browser_path(),
+            }
+            if self.use_driver_cache:
+                self.DRIVER_CACHE.parent.mkdir(parents=True, exist_ok=True)
+                self.DRIVER_CACHE.write_text(json.dumps(paths, indent=2))
+                type(self)._driver_paths = paths
+                config.logger.info("Chrome driver resolved: %s", paths)
+
+        self.options.binary_location = paths["browser_path"]
+        return Service(executable_path=paths["driver_path"])
+
+    def _start_local_browser(self) -> webdriver.Chrome:
+        try:
+            return webdriver.Chrome(
+                service=self._driver_service(), options=self.options
+            )
+        except WebDriverException:
+            if not self.use_driver_cache or self._driver_paths is None:
+                raise
+            # The cached driver may no longer match the installed Chrome
+            config.logger.warning("Cached Chrome driver failed, resolving")
+            self.clear_driver_cache()
+            return webdriver.Chrome(
+                service=self._driver_service(), options=self.options
+            )
+
     def start_browser(self):
         """Start the web driver (remote or local)."""
         try:
-            if os.environ.get("DRIVER_FROM_DOCKER", False):
+            if self.remote:
                 self.browser = webdriver.Remote(
                     command_executor="http://172.0.0.2:4444",
                     options=self.options,
                 )
             else:
-                self.browser = webdriver.Chrome(options=self.options)
+                self.browser = self._start_local_browser()
                 stealth(self.browser,
                         languages=["en-US", "en"],
                         vendor="Google Inc.",
@@ -55,6 +148,10 @@ class BrowserManager:
                         renderer="Intel Iris OpenGL Engine",
                         fix_hairline=True,
                         )
+            # A hung page load fails instead of stalling the run
+            self.browser.set_page_load_timeout(
+                config.env.float("PAGE_LOAD_TIMEOUT", 60)
+            )
         except WebDriverException as error:
             config.logger.error(
                 "Error starting the web browser: %s", str(error)
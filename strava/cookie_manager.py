@@ -1,10 +1,18 @@
 import os
 import json
+import fcntl
+from contextlib import contextmanager
+
 import config
 
 
 class CookieManager:
-    """CookieManager is a utility class for managing user-specific cookies."""
+    """CookieManager is a utility class for managing user-specific cookies.
+
+    Writes are atomic (a temporary file renamed over the jar), so a reader
+    never sees half a file. Processes signing in with the same account
+    hold lock() around the check-and-login, so only one of them logs in.
+    """
 
     def __init__(self, email: str):
         self.email = email
@@ -16,14 +24,30 @@ class CookieManager:
         # ensure directory exists
         os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
 
+    @contextmanager
+    def lock(self):
+        """Hold the account's cookie jar exclusively."""
+        with open(f"{self.file_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
     def save_cookie(self, cookies):
         """Save cookies to a JSON file."""
+        tmp_path = f"{self.file_path}.{os.getpid()}.tmp"
         try:
-            with open(self.file_path, "w", encoding="utf-8") as cookie_file:
+            with open(tmp_path, "w", encoding="utf-8") as cookie_file:
                 json.dump(cookies, cookie_file, indent=2)
-                config.logger.info("Cookie JSON file is saved.")
+                cookie_file.flush()
+                os.fsync(cookie_file.fileno())
+            os.replace(tmp_path, self.file_path)
+            config.logger.info("Cookie JSON file is saved.")
         except Exception as e:
             config.logger.error(f"Failed to save cookie JSON: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def read_cookie(self):
         """Read cookies from a JSON file."""
@@ -44,4 +68,4 @@ class CookieManager:
         """Remove cookies."""
         if os.path.exists(self.file_path):
             config.logger.warning("Deleting invalid cookie JSON file.")
-            os.remove(self.file_path)
\ No newline at end of file
+            os.remove(self.file_path)
@@ -3,3 +3,15 @@
 
 class AuthorizationFailureException(Exception):
     """Exception raised when authorization fails"""
+
+
+class StravaApiException(Exception):
+    """Exception raised when a Strava API request fails"""
+
+
+class AccountPoolExhaustedException(Exception):
+    """Exception raised when no Strava account is available to scrape"""
+
+
+class ScrapeCancelledException(Exception):
+    """Exception raised when a scrape is given up before it starts"""
@@ -1,19 +1,45 @@
+from __future__ import annotations
+
 import json
 import html
+import time
+from typing import Iterator, NamedTuple
+from urllib.parse import urlencode
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
+from selenium.common import TimeoutException
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as ec
+from selenium.webdriver.support.wait import WebDriverWait
 
 import config
 from strava.page_utils import StravaPageUtils
+from profiling import profiled_stage
+
+
+class LeaderboardView(NamedTuple):
+    """One view of a club leaderboard: a week and, optionally, a sport."""
+
+    last_week: bool = True
+    sport: str | None = None
 
 
 class StravaLeaderboard(StravaPageUtils):
     """A class for interacting with the Strava leaderboard of a club."""
 
+    LEADERBOARD_TABLE = (By.CLASS_NAME, "dense")
+    NEXT_PAGE_LINK = (By.CSS_SELECTOR, ".pagination .next_page a")
+    # Seconds to wait for lazy-loaded rows after scrolling
+    LOAD_MORE_TIMEOUT = 2
+    # Query parameter that selects the sport of the leaderboard
+    SPORT_PARAM = "sport_type"
+
     def __init__(self, browser: webdriver.Chrome):
         super().__init__(browser)
         self.browser = browser
+        self.page_source = None
+        self.page_sources: dict[LeaderboardView, str] = {}
 
     def get_this_week_or_last_week_leaders(
         self, club_id: int, last_week=True
@@ -25,53 +51,139 @@ class StravaLeaderboard(StravaPageUtils):
         if last_week:
             self._click_last_week_button()
 
-        return self._get_data_leaderboard()
+        leaderboard = self._get_data_leaderboard()
+        # Keep the raw page so that the run can be snapshotted and replayed
+        self.page_source = self.browser.page_source
+        return leaderboard
+
+    def _leaderboard_url(self, club_id: int, sport: str | None) -> str:
+        url = f"{config.BASE_URL}/clubs/{str(club_id)}/leaderboard"
+        if sport:
+            url += "?" + urlencode({self.SPORT_PARAM: sport})
+        return url
+
+    def get_leaderboard_views(
+        self, club_id: int, views: list[LeaderboardView]
+    ) -> dict[LeaderboardView, list]:
+        """
+        Get several views of a club leaderboard in one browser session.
+
+        Every view gets its own tab. The pages are requested together
+        (without waiting for each load) and read one after another, so an
+        extra view costs about one page load.
+        """
+        views = list(dict.fromkeys(views))
+        main_tab = self.browser.current_window_handle
+        tabs = {}
+
+        for num, view in enumerate(views):
+            if num:
+                self.browser.switch_to.new_window("tab")
+            tabs[view] = self.browser.current_window_handle
+            # Start loading without blocking on the page load
+            self.browser.execute_script(
+                "window.location.href = arguments[0];",
+                self._leaderboard_url(club_id, view.sport),
+            )
+
+        results = {}
+        try:
+            for view, tab in tabs.items():
+                self.browser.switch_to.window(tab)
+                if view.last_week:
+                    self._click_last_week_button()
+                results[view] = self._get_data_leaderboard()
+                self.page_sources[view] = self.browser.page_source
+                config.logger.info(
+                    "Leaderboard view %s: %s athletes",
+                    view,
+                    len(results[view]),
+                )
+        finally:
+            for tab in tabs.values():
+                if tab != main_tab:
+                    self.browser.switch_to.window(tab)
+                    self.browser.close()
+            self.browser.switch_to.window(main_tab)
+
+        return results
+
+    def iter_leaderboard_batches(
+        self, club_id: int, last_week=True, batch_size: int = 50
+    ) -> Iterator[list[dict[str, str]]]:
+        """
+        Yield the leaders of a club in batches as the rows are read.
+
+        If Strava lazy-loads the table, the page is scrolled (or the next
+        page is opened) until no new rows appear.
+        """
+        self._open_page(f"{config.BASE_URL}/clubs/{str(club_id)}/leaderboard")
+
+        if last_week:
+            self._click_last_week_button()
+
+        table = self._wait_element(self.LEADERBOARD_TABLE)
+        seen = total = 0
+        batch = []
+
+        while True:
+            trows = table.find_elements(By.TAG_NAME, "tr")[1:]
+            for trow in trows[seen:]:
+                batch.append(self._parse_row(trow))
+                total += 1
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            seen = len(trows)
+
+            next_pages = self.browser.find_elements(*self.NEXT_PAGE_LINK)
+            if next_pages:
+                # Paginated table: rows of the next page start from zero
+                next_pages[0].click()
+                try:
+                    WebDriverWait(
+                        self.browser, self.LOAD_MORE_TIMEOUT
+                    ).until(ec.staleness_of(table))
+                except TimeoutException:
+                    break
+                seen = 0
+            else:
+                # Lazy-loaded table: scroll down for more rows
+                self.browser.execute_script(
+                    "window.scrollTo(0, document.body.scrollHeight);"
+                )
+                if not self._wait_rows_change(seen):
+                    break
+            table = self._wait_element(self.LEADERBOARD_TABLE)
+
+        if batch:
+            yield batch
+
+        self.page_source = self.browser.page_source
+        config.logger.info(
+            "Streamed athlete data of %s athletes of the club", total
+        )
 
+    def _wait_rows_change(self, seen: int) -> bool:
+        """Wait briefly for lazy-loaded rows to be appended."""
+        deadline = time.monotonic() + self.LOAD_MORE_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            tables = self.browser.find_elements(*self.LEADERBOARD_TABLE)
+            if not tables:
+                continue
+            count = len(tables[0].find_elements(By.TAG_NAME, "tr")[1:])
+            if count > seen:
+                return True
+        return False
+
+    @profiled_stage("_get_data_leaderboard")
     def _get_data_leaderboard(self) -> list:
         """Get data leaderboard"""
 
-        leaderboard = []
-        table = self._wait_element((By.CLASS_NAME, "dense"))
+        table = self._wait_element(self.LEADERBOARD_TABLE)
         trows = table.find_elements(By.TAG_NAME, "tr")[1:]
-
-        for trow in trows:
-            athlete_url = (
-                trow.find_element(By.TAG_NAME, "a")
-                .get_attribute("href")
-                .strip()
-            )
-            avatar_div = trow.find_element(By.CSS_SELECTOR, "div.avatar")
-            props = json.loads(html.unescape(
-                avatar_div.get_attribute("data-react-props")
-            ))
-            avatar_medium = props.get("src")
-            avatar_large = avatar_medium.replace("medium", "large")
-
-            # Extract text values from 'td' elements and assign them to variables
-            (
-                rank,
-                athlete_name,
-                distance,
-                activities,
-                longest,
-                avg_pace,
-                elev_gain,
-            ) = (td.text for td in trow.find_elements(By.TAG_NAME, "td"))
-
-            athlete_data = {
-                "rank": rank,
-                "athlete_name": athlete_name,
-                "distance": distance,
-                "activities": activities,
-                "longest": longest,
-                "avg_pace": avg_pace,
-                "elev_gain": elev_gain,
-                "avatar_large": avatar_large,
-                "avatar_medium": avatar_medium,
-                "link": athlete_url,
-            }
-
-            leaderboard.append(athlete_data)
+        leaderboard = [self._parse_row(trow) for trow in trows]
 
         count_athletes = len(leaderboard)
         config.logger.info(
@@ -81,6 +193,47 @@ class StravaLeaderboard(StravaPageUtils):
         )
         return leaderboard
 
+    @staticmethod
+    def _parse_row(trow: WebElement) -> dict[str, str]:
+        """Read the athlete data from a table row."""
+        athlete_url = (
+            trow.find_element(By.TAG_NAME, "a")
+            .get_attribute("href")
+            .strip()
+        )
+        avatar_div = trow.find_element(By.CSS_SELECTOR, "div.avatar")
+        props = json.loads(html.unescape(
+            avatar_div.get_attribute("data-react-props")
+        ))
+        avatar_medium = props.get("src")
+        # Only the file name tells the variant apart
+        base_url, _, filename = avatar_medium.rpartition("/")
+        avatar_large = f"{base_url}/{filename.replace('medium', 'large')}"
+
+        # Extract text values from 'td' elements and assign them to variables
+        (
+            rank,
+            athlete_name,
+            distance,
+            activities,
+            longest,
+            avg_pace,
+            elev_gain,
+        ) = (td.text for td in trow.find_elements(By.TAG_NAME, "td"))
+
+        return {
+            "rank": rank,
+            "athlete_name": athlete_name,
+            "distance": distance,
+            "activities": activities,
+            "longest": longest,
+            "avg_pace": avg_pace,
+            "elev_gain": elev_gain,
+            "avatar_large": avatar_large,
+            "avatar_medium": avatar_medium,
+            "link": athlete_url,
+        }
+
     def _click_last_week_button(self):
         """Click last week button on table"""
         self._wait_element((By.CLASS_NAME, "last-week")).click()
@@ -15,7 +15,9 @@ class StravaPageUtils:
 
     def __init__(self, browser: webdriver):
         self.browser = browser
-        self.wait = WebDriverWait(self.browser, 15)
+        self.wait = WebDriverWait(
+            self.browser, config.env.float("PAGE_WAIT", 15)
+        )
 
     def _check_element(
         self, by_element: tuple[str, str], until_not: bool = False
@@ -1,14 +1,20 @@
+from __future__ import annotations
+
+import contextlib
 import os
 from datetime import datetime, timedelta
-from typing import List, Union
+from pathlib import Path
+from typing import Callable, Dict, List, Union
 
 from aiogram import Bot, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import FSInputFile, InputMediaPhoto
 
 import config
-from config import format_and_translate_date, bot
+from profiling import profiled_stage
+from config import format_and_translate_date
 from sender.album_sender import PosterAlbumSender
 
 
@@ -19,11 +25,26 @@ class TelegramSender(PosterAlbumSender):
     media groups of images with signatures to the said chat.
     """
 
-    CLUB_ID = config.env.str("CLUB_ID")
-
-    def __init__(self):
-        self.bot: Bot = bot
+    def __init__(
+        self,
+        report_date: datetime | None = None,
+        image_path: Path | None = None,
+        bot_instance: Bot | None = None,
+        close_session: bool = True,
+    ):
+        self.bot: Bot = bot_instance or config.bot
+        # Long-lived processes keep the Bot session open between albums
+        self.close_session = close_session
         self.logger = config.logger
+        # Any date of the reported week (last week by default)
+        self.report_date = report_date
+        if image_path is not None:
+            self.IMAGE_PATH = image_path
+
+    @property
+    def CLUB_ID(self) -> str:
+        """Strava club id, read when the caption is built."""
+        return config.env.str("CLUB_ID", "")
 
     @property
     def get_caption(self) -> str:
@@ -39,7 +60,9 @@ class TelegramSender(PosterAlbumSender):
 
         # Translation text
         text = "Підсумок {week}-го тижня бігу ({month}, {year})"
-        last_week_date = datetime.now() - timedelta(weeks=1)
+        last_week_date = self.report_date or (
+            datetime.now() - timedelta(weeks=1)
+        )
         description = config.translate.gettext(text).format(
             **format_and_translate_date(last_week_date)
         )
@@ -57,31 +80,127 @@ class TelegramSender(PosterAlbumSender):
         """
         Get a list of InputMediaPhoto objects from the IMAGE_PATH directory.
         """
-        image_files = sorted(self.get_image_files())
+        image_files = self.get_image_files()
         media_group = []
 
         for i, image_file in enumerate(image_files):
             # Get the caption for the first image
             caption = self.get_caption if i == 0 else None
+            media_group.append(self._media(image_file, caption))
+
+        return media_group
+
+    def _media(
+        self, image_file: str, caption: str | None = None
+    ) -> InputMediaPhoto:
+        return InputMediaPhoto(
+            media=FSInputFile(os.path.join(self.IMAGE_PATH, image_file)),
+            caption=caption,
+            parse_mode=ParseMode.HTML,
+        )
 
-            media_group.append(
-                InputMediaPhoto(
-                    media=FSInputFile(
-                        os.path.join(self.IMAGE_PATH, image_file)
-                    ),
-                    caption=caption,
+    async def _send_media(
+        self,
+        bot: Bot,
+        chat_id: Union[int, str],
+        media: List[InputMediaPhoto],
+        sent_albums: Dict[int, List[int]] | None = None,
+        on_album_sent: Callable[[int, List[int]], None] | None = None,
+        album_timeout: float | None = None,
+    ) -> List[int]:
+        """Send media in albums Telegram accepts, returning message ids.
+
+        A media group needs at least two items: the albums are split
+        evenly and a single poster is sent as a photo. Albums already in
+        sent_albums (by position) are skipped; on_album_sent is called
+        as soon as each album is delivered. album_timeout bounds every
+        request, never the album as a whole.
+        """
+        sent_albums = sent_albums or {}
+        message_ids = []
+        for num, chunk in enumerate(self.album_chunks(media)):
+            if num in sent_albums:
+                message_ids.extend(sent_albums[num])
+                continue
+            if len(chunk) == 1:
+                message = await bot.send_photo(
+                    chat_id=chat_id,
+                    photo=chunk[0].media,
+                    caption=chunk[0].caption,
                     parse_mode=ParseMode.HTML,
+                    request_timeout=album_timeout,
                 )
-            )
+                album_ids = [message.message_id]
+            else:
+                messages = await bot.send_media_group(
+                    chat_id=chat_id,
+                    media=chunk,
+                    request_timeout=album_timeout,
+                )
+                album_ids = [m.message_id for m in messages]
+            if on_album_sent is not None:
+                on_album_sent(num, album_ids)
+            message_ids.extend(album_ids)
+        return message_ids
+
+    async def send_posters(
+        self, chat_id: Union[int, str], image_files: List[str]
+    ) -> List[int]:
+        """Send the given posters as new messages, without a caption."""
+        return await self._send_media(
+            self.bot, chat_id, [self._media(name) for name in image_files]
+        )
 
-        return media_group
+    async def edit_poster(
+        self,
+        chat_id: Union[int, str],
+        message_id: int,
+        image_file: str,
+        caption: str | None = None,
+    ) -> bool:
+        """Replace the image of a sent poster in place.
 
-    async def send_album_to_telegram(self, chat_id: Union[int, str]) -> None:
-        """Send an album of images to a Telegram chat."""
+        Returns False if the message no longer exists.
+        """
+        try:
+            await self.bot.edit_message_media(
+                chat_id=chat_id,
+                message_id=message_id,
+                media=self._media(image_file, caption),
+            )
+        except TelegramBadRequest as e:
+            if "not modified" in e.message:
+                return True
+            if "not found" in e.message:
+                self.logger.warning(
+                    "Message %s to edit not found: %s", message_id, e
+                )
+                return False
+            raise
+        return True
+
+    @profiled_stage("send_album_to_telegram")
+    async def send_album_to_telegram(
+        self,
+        chat_id: Union[int, str],
+        sent_albums: Dict[int, List[int]] | None = None,
+        on_album_sent: Callable[[int, List[int]], None] | None = None,
+        album_timeout: float | None = None,
+    ) -> List[int]:
+        """Send an album of images to a Telegram chat.
+
+        Returns the ids of the sent messages. A resumed send passes the
+        albums delivered before (see _send_media()).
+        """
         self.logger.info("Початок відправки альбому до чату %s...", chat_id)
 
         try:
-            async with self.bot as bot:
+            bot_context = (
+                self.bot
+                if self.close_session
+                else contextlib.nullcontext(self.bot)
+            )
+            async with bot_context as bot:
 
                 # Send a chat action
                 await bot.send_chat_action(
@@ -92,13 +211,21 @@ class TelegramSender(PosterAlbumSender):
                 media = await self.get_media_group()
                 if not media:
                     self.logger.warning("No media to send.")
-                    return
-
-                # Send the album
-                await bot.send_media_group(chat_id=chat_id, media=media)
+                    return []
+
+                # Send the album, split into media groups Telegram accepts
+                message_ids = await self._send_media(
+                    bot,
+                    chat_id,
+                    media,
+                    sent_albums,
+                    on_album_sent,
+                    album_timeout,
+                )
                 self.logger.info(
                     "Successfully sent album to chat %s", chat_id
                 )
+                return message_ids
 
         except Exception as e:
             self.logger.error("Error sending album: %s", str(e))